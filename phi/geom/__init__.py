@@ -1 +1,3 @@
 from .geometry import Geometry, Sphere, box, AABox, union
+from .batch import SphereBatch, BoxBatch, batch_geometries
+from .sdf import SignedDistanceLattice, signed_distance_lattice
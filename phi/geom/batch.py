@@ -0,0 +1,239 @@
+"""
+Geometries holding many primitives of the same kind, e.g. the spheres of a porous medium or the boxes of a city block.
+
+SphereBatch and BoxBatch evaluate all primitives in one vectorized pass.
+For NumPy points and more than ACCELERATION_THRESHOLD primitives, an acceleration structure (UniformGrid) is used
+so that each point is only tested against the primitives overlapping its cell.
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+from phi import struct, math
+from .geometry import Geometry, Sphere, AABox, _enclosing_box
+
+
+# Minimum number of primitives for which value_at() uses a UniformGrid
+ACCELERATION_THRESHOLD = 8
+# Maximum number of acceleration structures kept by _acceleration_structure()
+ACCELERATION_CACHE_SIZE = 8
+
+_ACCELERATION_CACHE = struct.LRUCache(ACCELERATION_CACHE_SIZE)  # fingerprint of geometry batch -> UniformGrid
+
+
+@struct.definition(slots=True, compile=True)
+class SphereBatch(Geometry):
+
+    def __init__(self, centers, radii, **kwargs):
+        """
+Union of spheres.
+        :param centers: tensor of shape (count, rank)
+        :param radii: tensor of shape (count,) or scalar
+        """
+        Geometry.__init__(self, **struct.kwargs(locals()))
+
+    @struct.constant()
+    def centers(self, centers):
+        centers = math.as_tensor(centers)
+        assert math.ndims(centers) == 2, 'centers must have shape (count, rank) but got %s' % (math.staticshape(centers),)
+        return centers
+
+    @struct.constant(dependencies='centers')
+    def radii(self, radii):
+        radii = math.as_tensor(radii)
+        if isinstance(radii, np.ndarray) and radii.ndim == 0:
+            radii = np.full(self.centers.shape[:1], radii, radii.dtype)
+        return radii
+
+    @property
+    def rank(self):
+        return math.staticshape(self.centers)[-1]
+
+    @property
+    def count(self):
+        return math.staticshape(self.centers)[0]
+
+    def value_at(self, location):
+        if _use_acceleration(self, location):
+            def inside(points, primitives):
+                return math.sum((points - self.centers[primitives]) ** 2, axis=-1) <= self.radii[primitives] ** 2
+            return _accelerated_value_at(self, location, inside)
+        distance_squared = math.sum((math.expand_dims(location, -2) - self.centers) ** 2, axis=-1)
+        return math.to_float(math.any(distance_squared <= self.radii ** 2, axis=-1, keepdims=True))
+
+    def signed_distance(self, location):
+        distance = math.sqrt(math.sum((math.expand_dims(location, -2) - self.centers) ** 2, axis=-1)) - self.radii
+        return math.expand_dims(math.min(distance, axis=-1), -1)
+
+    def bounding_box(self):
+        radii = math.expand_dims(self.radii, -1)
+        return _enclosing_box(self.centers - radii, self.centers + radii)
+
+    def primitive_bounds(self):
+        """
+        :return: lower and upper corners of the bounding boxes of all spheres, each of shape (count, rank)
+        """
+        radii = math.expand_dims(self.radii, -1)
+        return self.centers - radii, self.centers + radii
+
+
+@struct.definition(slots=True, compile=True)
+class BoxBatch(Geometry):
+
+    def __init__(self, lower, upper, **kwargs):
+        """
+Union of axis-aligned boxes.
+        :param lower: tensor of shape (count, rank)
+        :param upper: tensor of shape (count, rank)
+        """
+        Geometry.__init__(self, **struct.kwargs(locals()))
+
+    @struct.constant()
+    def lower(self, lower):
+        lower = math.to_float(math.as_tensor(lower))
+        assert math.ndims(lower) == 2, 'lower must have shape (count, rank) but got %s' % (math.staticshape(lower),)
+        return lower
+
+    @struct.constant()
+    def upper(self, upper):
+        upper = math.to_float(math.as_tensor(upper))
+        assert math.ndims(upper) == 2, 'upper must have shape (count, rank) but got %s' % (math.staticshape(upper),)
+        return upper
+
+    @property
+    def rank(self):
+        return math.staticshape(self.lower)[-1]
+
+    @property
+    def count(self):
+        return math.staticshape(self.lower)[0]
+
+    def value_at(self, location):
+        if _use_acceleration(self, location):
+            def inside(points, primitives):
+                return math.all((points >= self.lower[primitives]) & (points <= self.upper[primitives]), axis=-1)
+            return _accelerated_value_at(self, location, inside)
+        location = math.expand_dims(location, -2)
+        bool_inside = math.all((location >= self.lower) & (location <= self.upper), axis=-1)
+        return math.to_float(math.any(bool_inside, axis=-1, keepdims=True))
+
+    def signed_distance(self, location):
+        location = math.expand_dims(location, -2)
+        distance = math.maximum(self.lower - location, location - self.upper)  # per box and axis, negative inside
+        outside = math.sqrt(math.sum(math.maximum(distance, 0) ** 2, axis=-1))
+        inside = math.minimum(math.max(distance, axis=-1), 0)
+        return math.expand_dims(math.min(outside + inside, axis=-1), -1)
+
+    def bounding_box(self):
+        return _enclosing_box(self.lower, self.upper)
+
+    def primitive_bounds(self):
+        """
+        :return: lower and upper corners of all boxes, each of shape (count, rank)
+        """
+        return self.lower, self.upper
+
+
+def batch_geometries(geometries):
+    """
+Combines Spheres and AABoxes into SphereBatches and BoxBatches so that their union can be evaluated in one pass.
+Only unbatched NumPy geometries are combined. Spheres are grouped by the data types of center and radius so that results do not change.
+    :param geometries: list or tuple of Geometry
+    :return: list of Geometry with the same union, unsupported geometries are passed through
+    """
+    spheres = OrderedDict()  # (center dtype, radius dtype, rank) -> list of Sphere
+    boxes = OrderedDict()  # rank -> list of AABox
+    result = []
+    for geometry in geometries:
+        if type(geometry) is Sphere and _is_numpy(geometry.center, 1) and _is_numpy(geometry.radius, 0):  # pylint: disable-msg = unidiomatic-typecheck
+            spheres.setdefault((geometry.center.dtype, geometry.radius.dtype, len(geometry.center)), []).append(geometry)
+        elif type(geometry) is AABox and _is_numpy(geometry.lower, 1) and _is_numpy(geometry.upper, 1) and geometry.lower.shape == geometry.upper.shape:  # pylint: disable-msg = unidiomatic-typecheck
+            boxes.setdefault(len(geometry.lower), []).append(geometry)
+        else:
+            result.append(geometry)
+    for group in spheres.values():
+        if len(group) == 1:
+            result.append(group[0])
+        else:
+            result.append(SphereBatch(np.stack([s.center for s in group]), np.stack([s.radius for s in group])))
+    for group in boxes.values():
+        if len(group) == 1:
+            result.append(group[0])
+        else:
+            result.append(BoxBatch(np.stack([b.lower for b in group]), np.stack([b.upper for b in group])))
+    return result
+
+
+def _is_numpy(tensor, ndims):
+    return isinstance(tensor, np.ndarray) and tensor.ndim == ndims
+
+
+class UniformGrid(object):
+    """
+Acceleration structure that sorts primitives into the cells of a uniform grid covering their bounding boxes.
+Each primitive is listed in every cell its bounding box overlaps.
+The cell size is chosen close to the median primitive size with at most about four cells per primitive in total.
+    """
+
+    def __init__(self, lower, upper):
+        """
+        :param lower: NumPy array of shape (count, rank) holding the lower corners of the primitive bounding boxes
+        :param upper: NumPy array of shape (count, rank) holding the upper corners of the primitive bounding boxes
+        """
+        lower, upper = np.asarray(lower, np.float64), np.asarray(upper, np.float64)
+        count, rank = lower.shape
+        # pad the boxes slightly so that rounding in the inside tests of primitives never leaves their cells
+        padding = 1e-6 * (np.max(np.abs(np.concatenate([lower, upper]))) + 1)
+        lower, upper = lower - padding, upper + padding
+        self.origin = lower.min(axis=0)
+        extent = upper.max(axis=0) - self.origin
+        max_cells = max(1, int(np.ceil((4 * count) ** (1. / rank))))
+        typical_size = np.maximum(np.median(upper - lower, axis=0), extent / max_cells)
+        self.shape = tuple(int(n) for n in np.clip(np.ceil(extent / typical_size), 1, max_cells))
+        self.cell_size = extent / self.shape
+        low_cells, high_cells = self._cell_indices(lower), self._cell_indices(upper)
+        cells, primitives = [], []
+        for primitive in range(count):
+            ranges = [np.arange(low, high + 1) for low, high in zip(low_cells[primitive], high_cells[primitive])]
+            covered = np.stack(np.meshgrid(*ranges, indexing='ij'), -1).reshape(-1, rank)
+            cells.append(np.ravel_multi_index(covered.T, self.shape))
+            primitives.append(np.full(len(covered), primitive, np.int64))
+        cells, primitives = np.concatenate(cells), np.concatenate(primitives)
+        order = np.argsort(cells, kind='stable')
+        self.primitives = primitives[order]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(cells, minlength=int(np.prod(self.shape))))])
+
+    def _cell_indices(self, points):
+        return np.clip(np.floor((points - self.origin) / self.cell_size).astype(np.int64), 0, np.array(self.shape) - 1)
+
+    def candidates(self, points):
+        """
+Finds the primitives that may contain each point.
+        :param points: NumPy array of shape (point count, rank)
+        :return: point indices, primitive indices. Both are 1D NumPy arrays with one entry per candidate pair.
+        """
+        points = np.asarray(points, np.float64)
+        cell_coordinates = np.floor((points - self.origin) / self.cell_size)
+        in_grid = np.all((cell_coordinates >= 0) & (cell_coordinates < self.shape), axis=-1)
+        cells = np.ravel_multi_index(cell_coordinates[in_grid].astype(np.int64).T, self.shape)
+        point_indices = np.flatnonzero(in_grid)
+        starts, counts = self.offsets[cells], self.offsets[cells + 1] - self.offsets[cells]
+        pair_points = np.repeat(point_indices, counts)
+        pair_offsets = np.arange(len(pair_points)) - np.repeat(np.cumsum(counts) - counts, counts)
+        return pair_points, self.primitives[np.repeat(starts, counts) + pair_offsets]
+
+
+def _use_acceleration(batch, location):
+    return batch.count >= ACCELERATION_THRESHOLD and isinstance(location, np.ndarray) and all(isinstance(t, np.ndarray) for t in batch.primitive_bounds())
+
+
+def _accelerated_value_at(batch, location, inside):
+    points = location.reshape((-1, location.shape[-1]))
+    point_indices, primitives = _acceleration_structure(batch).candidates(points)
+    result = np.zeros(points.shape[:1], math.storage_dtype())
+    result[point_indices[inside(points[point_indices], primitives)]] = 1
+    return result.reshape(location.shape[:-1] + (1,))
+
+
+def _acceleration_structure(batch):
+    return _ACCELERATION_CACHE.lookup(struct.fingerprint(batch), lambda: UniformGrid(*batch.primitive_bounds()))
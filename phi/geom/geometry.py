@@ -1,10 +1,12 @@
+from numbers import Number
+
 import numpy as np
 
 from phi import struct
 from phi import math
 
 
-@struct.definition()
+@struct.definition(slots=True, compile=True)
 class Geometry(struct.Struct):
 
     def value_at(self, location):
@@ -15,12 +17,51 @@ Samples the geometry at the given locations and returns a binary mask, labelling
         """
         raise NotImplementedError(self.__class__)
 
+    def signed_distance(self, location):
+        """
+Computes the signed distance from the given locations to the surface of the geometry, negative inside.
+        :param location: tensor of the shape (batch_size, ..., rank)
+        :return: float tensor of same shape as location but with shape[-1]=1
+        """
+        raise NotImplementedError(self.__class__)
+
+    def bounding_box(self):
+        """
+Returns an axis-aligned box containing all points that lie inside this geometry.
+        :return: AABox
+        """
+        raise NotImplementedError(self.__class__)
+
+    def rasterize(self, box, resolution, out=None):
+        """
+Samples the geometry at the cell centers of a regular grid, equivalent to value_at(CenteredGrid.getpoints(box, resolution).data).
+Only the cells inside the bounding box of the geometry are sampled. Geometries without a bounding box are sampled at all cells.
+NumPy only, raises NotImplementedError for geometries holding tensors of other backends.
+        :param box: AABox covered by the grid
+        :param resolution: number of cells along each axis
+        :param out: (optional) NumPy array of shape (batch_size, resolution..., 1) to write to.
+        Sampled values are combined with the content of out using the maximum, so multiple geometries can be rasterized into one mask.
+        :return: NumPy array of shape (batch_size, resolution..., 1), out if given
+        """
+        lines = _cell_centers(box, resolution)
+        try:
+            window = _index_window(lines, self.bounding_box())
+        except NotImplementedError:
+            window = tuple(slice(None) for _ in lines)
+        values = self.value_at(_window_points(lines, window)) if all(_window_size(w, len(l)) > 0 for w, l in zip(window, lines)) else 0
+        if not isinstance(values, (np.ndarray, Number)):
+            raise NotImplementedError('%s cannot be rasterized: only NumPy geometries are supported' % self)
+        out = _mask_buffer(out, resolution, np.shape(values)[0] if np.ndim(values) > 0 else 1)
+        target = out[(slice(None),) + window]
+        np.maximum(target, values, out=target)
+        return out
+
     @property
     def rank(self):
         raise NotImplementedError()
 
 
-@struct.definition()
+@struct.definition(slots=True, compile=True, fingerprint=True)
 class AABox(Geometry):
 
     def __init__(self, lower, upper, **kwargs):
@@ -72,6 +113,30 @@ class AABox(Geometry):
         bool_inside = math.all(bool_inside, axis=-1, keepdims=True)
         return math.to_float(bool_inside)
 
+    def signed_distance(self, location):
+        lower, upper = math.batch_align([self.lower, self.upper], 1, location)
+        distance = math.maximum(lower - location, location - upper)  # per axis, negative inside
+        outside = math.sqrt(math.sum(math.maximum(distance, 0) ** 2, axis=-1, keepdims=True))
+        inside = math.minimum(math.expand_dims(math.max(distance, axis=-1), -1), 0)
+        return outside + inside
+
+    def bounding_box(self):
+        return self
+
+    def rasterize(self, box, resolution, out=None):
+        if not isinstance(self.lower, np.ndarray) or not isinstance(self.upper, np.ndarray) or math.ndims(self.lower) > 1 or math.ndims(self.upper) > 1:
+            return Geometry.rasterize(self, box, resolution, out)
+        # The cells inside the box form an index range along each axis
+        lines = _cell_centers(box, resolution)
+        lower, upper = np.broadcast_to(self.lower, [len(lines)]), np.broadcast_to(self.upper, [len(lines)])
+        window = []
+        for axis, line in enumerate(lines):
+            inside = np.flatnonzero((line >= lower[axis]) & (line <= upper[axis]))
+            window.append(slice(inside[0], inside[-1] + 1) if inside.size > 0 else slice(0, 0))
+        out = _mask_buffer(out, resolution, 1)
+        out[(slice(None),) + tuple(window)] = 1
+        return out
+
     def contains(self, other):
         if isinstance(other, AABox):
             return np.all(other.lower >= self.lower) and np.all(other.upper <= self.upper)
@@ -130,7 +195,7 @@ class AABoxGenerator(object):
 box = AABoxGenerator()
 
 
-@struct.definition()
+@struct.definition(slots=True, compile=True)
 class Sphere(Geometry):
 
     def __init__(self, center, radius, **kwargs):
@@ -151,12 +216,21 @@ class Sphere(Geometry):
         bool_inside = distance_squared <= radius**2
         return math.to_float(bool_inside)
 
+    def signed_distance(self, location):
+        center = math.batch_align(self.center, 1, location)
+        radius = math.batch_align(self.radius, 0, location)
+        return math.sqrt(math.sum((location - center) ** 2, axis=-1, keepdims=True)) - radius
+
+    def bounding_box(self):
+        radius = math.expand_dims(self.radius, -1) if math.ndims(self.radius) > 0 else self.radius
+        return _enclosing_box(self.center - radius, self.center + radius)
+
     @property
     def rank(self):
         return len(self.center)
 
 
-@struct.definition()
+@struct.definition(slots=True, compile=True)
 class _Union(Geometry):
 
     def __init__(self, geometries, **kwargs):
@@ -170,12 +244,31 @@ class _Union(Geometry):
         self.geometries = tuple(self.geometries)
 
     def value_at(self, points, collapse_dimensions=True):
-        if len(self.geometries) == 1:
-            result = self.geometries[0].value_at(points)
+        from .batch import batch_geometries
+        geometries = batch_geometries(self.geometries)
+        if len(geometries) == 1:
+            result = geometries[0].value_at(points)
         else:
-            result = math.max([geometry.value_at(points) for geometry in self.geometries], axis=0)
+            result = math.max([geometry.value_at(points) for geometry in geometries], axis=0)
         return result
 
+    def signed_distance(self, location):
+        from .batch import batch_geometries
+        geometries = batch_geometries(self.geometries)
+        if len(geometries) == 1:
+            return geometries[0].signed_distance(location)
+        return math.min([geometry.signed_distance(location) for geometry in geometries], axis=0)
+
+    def rasterize(self, box, resolution, out=None):
+        from .batch import batch_geometries
+        for geometry in batch_geometries(self.geometries):
+            out = geometry.rasterize(box, resolution, out)
+        return out
+
+    def bounding_box(self):
+        boxes = [geometry.bounding_box() for geometry in self.geometries]
+        return _enclosing_box(math.stack([b.lower for b in boxes]), math.stack([b.upper for b in boxes]))
+
     @property
     def rank(self):
         if len(self.geometries) == 0:
@@ -188,6 +281,67 @@ class _Union(Geometry):
         return tuple(geometries)
 
 
+def _enclosing_box(lower, upper):
+    """ Returns the AABox enclosing all boxes, given their corners as tensors of shape (..., rank). """
+    if math.ndims(lower) > 1:
+        lower = math.min(lower, axis=tuple(range(math.ndims(lower) - 1)))
+        upper = math.max(upper, axis=tuple(range(math.ndims(upper) - 1)))
+    return AABox(lower, upper)
+
+
+# Maximum number of boxes and resolutions for which rasterize() keeps the cell center coordinates
+CELL_CENTERS_CACHE_SIZE = 16
+_CELL_CENTERS_CACHE = struct.LRUCache(CELL_CENTERS_CACHE_SIZE)  # (fingerprint of box, resolution, dtype) -> cell center coordinates along each axis
+
+
+def _cell_centers(box, resolution):
+    """ Returns the coordinates of the cell centers along each axis, equal to the values of CenteredGrid.getpoints(box, resolution). """
+    if not isinstance(box.lower, np.ndarray) or not isinstance(box.upper, np.ndarray):
+        raise NotImplementedError('Only NumPy boxes can be rasterized')
+    resolution = tuple(int(r) for r in resolution)
+    key = (struct.fingerprint(box), resolution, np.dtype(math.storage_dtype()).str)
+
+    def create():
+        size, lower = np.broadcast_to(box.size, [len(resolution)]), np.broadcast_to(box.lower, [len(resolution)])
+        lines = []
+        for axis, dim in enumerate(resolution):
+            local = np.linspace(0.5 / dim, 1 - 0.5 / dim, dim).astype(math.storage_dtype())
+            line = local * size[axis] + lower[axis]
+            line.setflags(write=False)
+            lines.append(line)
+        return tuple(lines)
+
+    return _CELL_CENTERS_CACHE.lookup(key, create)
+
+
+def _index_window(lines, bounding_box):
+    """ Returns a slice for each axis, covering the cells whose centers lie inside the bounding box plus one cell to account for rounding. """
+    lower, upper = np.broadcast_to(bounding_box.lower, [len(lines)]), np.broadcast_to(bounding_box.upper, [len(lines)])
+    window = []
+    for axis, line in enumerate(lines):
+        start = max(0, np.searchsorted(line, lower[axis], side='left') - 1)
+        stop = min(len(line), np.searchsorted(line, upper[axis], side='right') + 1)
+        window.append(slice(int(start), int(max(start, stop))))
+    return tuple(window)
+
+
+def _window_size(window, size):
+    return len(range(*window.indices(size)))
+
+
+def _window_points(lines, window):
+    """ Returns the cell centers inside the window as tensor of shape (1, window size..., rank). """
+    coordinates = np.meshgrid(*[line[w] for line, w in zip(lines, window)], indexing='ij')
+    return np.stack(coordinates, axis=-1)[np.newaxis, ...]
+
+
+def _mask_buffer(out, resolution, batch_size):
+    if out is None:
+        return np.zeros((batch_size,) + tuple(int(r) for r in resolution) + (1,), math.storage_dtype())
+    assert tuple(out.shape[1:]) == tuple(int(r) for r in resolution) + (1,), 'out has shape %s but resolution is %s' % (out.shape, resolution)
+    return out
+
+
 def union(geometries):
     if len(geometries) == 0:
         return NO_GEOMETRY
@@ -195,7 +349,7 @@ def union(geometries):
         return _Union(geometries)
 
 
-@struct.definition()
+@struct.definition(slots=True, compile=True)
 class _NoGeometry(Geometry):
 
     def rank(self):
@@ -0,0 +1,93 @@
+"""
+Cached signed distance fields of geometries on regular grids.
+
+The cell centers of a grid, the face centers of the matching staggered grid and the cell centers of all coarser (2x downsampled)
+grids of the same domain lie on one lattice with spacing dx/2 that includes the domain boundary.
+signed_distance_lattice() samples the signed distance of a geometry on this lattice once and caches it,
+so that masks and fractional coverages for all of these grids are derived by slicing and are consistent with each other.
+"""
+
+import numpy as np
+
+from phi import struct, math
+
+
+# Maximum number of lattices kept by signed_distance_lattice()
+SDF_CACHE_SIZE = 8
+
+_SDF_CACHE = struct.LRUCache(SDF_CACHE_SIZE)  # (fingerprint of geometry, fingerprint of box, resolution, dtype) -> SignedDistanceLattice
+
+
+class SignedDistanceLattice(object):
+    """
+Signed distance of a geometry sampled at the points lower + k * dx / 2, k = 0 ... 2 * resolution, along each axis. NumPy only.
+Requires (2 * resolution + 1) ** rank samples, i.e. about 2 ** rank times the number of cells.
+    """
+
+    def __init__(self, geometry, box, resolution):
+        """
+        :param geometry: Geometry implementing signed_distance()
+        :param box: AABox of the finest grid
+        :param resolution: cells per axis of the finest grid
+        """
+        self.resolution = tuple(int(r) for r in resolution)
+        if not isinstance(box.lower, np.ndarray) or not isinstance(box.upper, np.ndarray):
+            raise NotImplementedError('Signed distance lattices require NumPy boxes')
+        self.dx = np.broadcast_to(box.size, [len(self.resolution)]) / self.resolution
+        lower = np.broadcast_to(box.lower, [len(self.resolution)])
+        lines = [(lower[axis] + np.arange(2 * n + 1) * (self.dx[axis] / 2)).astype(math.storage_dtype()) for axis, n in enumerate(self.resolution)]
+        points = np.stack(np.meshgrid(*lines, indexing='ij'), -1)[np.newaxis, ...]
+        self.values = np.asarray(geometry.signed_distance(points))
+        self.values.setflags(write=False)
+
+    @property
+    def rank(self):
+        return len(self.resolution)
+
+    def centered(self, level=0):
+        """
+Signed distance at the cell centers of the grid downsampled level times by a factor of 2.
+        :return: read-only NumPy array of shape (batch_size, resolution / 2 ** level..., 1)
+        """
+        step = 2 ** level
+        assert all(n % step == 0 for n in self.resolution), 'resolution %s cannot be downsampled %d times' % (self.resolution, level)
+        return self.values[(slice(None),) + (slice(step, None, 2 * step),) * self.rank + (slice(None),)]
+
+    def staggered(self, axis):
+        """
+Signed distance at the face centers of the staggered grid component along axis.
+        :return: read-only NumPy array of shape (batch_size, resolution with +1 along axis..., 1)
+        """
+        return self.values[(slice(None),) + tuple(slice(0, None, 2) if d == axis else slice(1, None, 2) for d in range(self.rank)) + (slice(None),)]
+
+    def mask(self, level=0):
+        """
+        :return: 1 for cell centers inside the geometry, 0 outside, see centered()
+        """
+        return (self.centered(level) <= 0).astype(math.storage_dtype())
+
+    def staggered_mask(self, axis):
+        """
+        :return: 1 for face centers inside the geometry, 0 outside, see staggered()
+        """
+        return (self.staggered(axis) <= 0).astype(math.storage_dtype())
+
+    def coverage(self, level=0):
+        """
+Fraction of each cell that lies inside the geometry, approximated from the signed distance at the cell center assuming a locally planar surface.
+        :return: NumPy array of shape (batch_size, resolution / 2 ** level..., 1) with values between 0 and 1
+        """
+        cell_size = np.min(self.dx) * 2 ** level
+        return np.clip(0.5 - self.centered(level) / cell_size, 0, 1).astype(math.storage_dtype())
+
+
+def signed_distance_lattice(geometry, box, resolution):
+    """
+Returns the cached SignedDistanceLattice of geometry for the grid given by box and resolution.
+    :param geometry: Geometry implementing signed_distance()
+    :param box: AABox of the finest grid
+    :param resolution: cells per axis of the finest grid
+    :return: SignedDistanceLattice
+    """
+    key = (struct.fingerprint(geometry), struct.fingerprint(box), tuple(int(r) for r in resolution), np.dtype(math.storage_dtype()).str)
+    return _SDF_CACHE.lookup(key, lambda: SignedDistanceLattice(geometry, box, resolution))
@@ -1,6 +1,9 @@
 from .base_backend import DYNAMIC_BACKEND
 from .scipy_backend import SciPyBackend
 from .struct_backend import StructBroadcastBackend
+from .precision import Precision, precision, set_precision, get_precision, storage_dtype, accumulation_dtype
+from .halo import with_halo, empty_with_halo
+from .parallel import set_num_threads, get_num_threads, threads, available_cpus
 from .math_util import types, is_static_shape, zeros, ones, randn, randfreq
 from .nd import (spatial_rank, spatial_dimensions, axes, all_dimensions,
                  is_scalar,
@@ -1,5 +1,8 @@
 # coding=utf-8
+import numpy as np
+
 from .base_backend import DYNAMIC_BACKEND as math
+from .precision import accumulation_dtype
 
 
 def conjugate_gradient(k, apply_A, initial_x=None, accuracy=1e-5, max_iterations=1024, back_prop=False):
@@ -44,12 +47,12 @@ def conjugate_gradient(k, apply_A, initial_x=None, accuracy=1e-5, max_iterations
         laplace_momentum : A_times_momentum
         residual : residual
         """
-        tmp = math.sum(momentum * A_times_momentum, axis=1, keepdims=True)  # t = sum(mAm)
+        tmp = _accumulated_dot(momentum, A_times_momentum)  # t = sum(mAm)
         tmp = math.where(math.equal(tmp, 0), math.ones_like(tmp), tmp)
-        a = math.sum(momentum * residual, axis=1, keepdims=True) / tmp  # a = sum(mr)/sum(mAm)
+        a = _to_dtype_of(_accumulated_dot(momentum, residual) / tmp, momentum)  # a = sum(mr)/sum(mAm)
         pressure += a * momentum  # p += am
         residual -= a * A_times_momentum  # r -= aAm
-        momentum = residual - (math.sum(residual * A_times_momentum, axis=1, keepdims=True) * momentum / tmp)  # m = r-sum(rAm)*m/t = r-sum(rAm)*m/sum(mAm)
+        momentum = residual - (_to_dtype_of(_accumulated_dot(residual, A_times_momentum) / tmp, momentum) * momentum)  # m = r-sum(rAm)*m/t = r-sum(rAm)*m/sum(mAm)
         A_times_momentum = apply_A(momentum)  # Am = A*m
         return [pressure, momentum, A_times_momentum, residual, loop_index + 1]
 
@@ -60,3 +63,23 @@ def conjugate_gradient(k, apply_A, initial_x=None, accuracy=1e-5, max_iterations
                                                                           maximum_iterations=max_iterations)
 
     return x, loop_index
+
+
+def _accumulated_dot(a, b):
+    """ Row-wise dot product of two batched vectors, summed in at least the accumulation precision (see phi.math.precision). """
+    dtype = accumulation_dtype()
+    if _is_lower_float_precision(math.dtype(a), dtype):
+        a = math.cast(a, dtype)
+    if _is_lower_float_precision(math.dtype(b), dtype):
+        b = math.cast(b, dtype)
+    return math.sum(a * b, axis=1, keepdims=True)
+
+
+def _is_lower_float_precision(dtype, target):
+    dtype = np.dtype(getattr(dtype, 'as_numpy_dtype', dtype))  # TensorFlow dtypes
+    return dtype.kind == 'f' and dtype.itemsize < target.itemsize
+
+
+def _to_dtype_of(value, reference):
+    dtype = math.dtype(reference)
+    return value if math.dtype(value) == dtype else math.cast(value, dtype)
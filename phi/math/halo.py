@@ -0,0 +1,215 @@
+"""
+Ghost-cell (halo) storage for NumPy arrays.
+
+An array created by with_halo() or empty_with_halo() is a view into a larger buffer that has room for ghost cells around the spatial dimensions.
+When such an array is padded using the same mode as the halo, SciPyBackend.pad refreshes only the ghost cells in-place
+and returns a read-only view of the buffer instead of copying the whole array.
+
+Note that views returned this way share memory with the buffer: their ghost cells are re-filled whenever the array is padded again.
+"""
+import weakref
+
+import numpy as np
+
+from phi.struct.tensorop import expand, collapsed_gather_nd
+from .parallel import parallel_map, slabs, get_num_threads
+
+
+# order matters! wrap first. Must match the order in which SciPyBackend.pad applies mixed modes.
+_PASS_ORDER = ('wrap', 'symmetric', 'reflect', 'constant')
+
+_HALOS = {}  # id(interior) -> Halo
+
+
+class Halo(object):
+    """
+Buffer with ghost cells around an interior region.
+The ghost cells are filled according to mode and constant_values which are fixed when the halo is created.
+    """
+
+    def __init__(self, interior_shape, widths, mode, constant_values, dtype):
+        self.widths = widths
+        self.modes = _expand_modes(mode, len(interior_shape))
+        self.constant_values = expand(constant_values, shape=(len(interior_shape), 2))
+        self.interior_shape = tuple(interior_shape)
+        self.buffer = np.empty([s + lower + upper for s, (lower, upper) in zip(interior_shape, widths)], dtype)
+        self._interior_ref = None
+
+    def refresh(self):
+        """ Re-fills all ghost cells from the current interior values. """
+        fill_ghost_cells(self.buffer, self.widths, self.modes, self.constant_values)
+
+    def supports(self, widths, modes, constant_values):
+        for d, (lower, upper) in enumerate(widths):
+            for side, width in enumerate((lower, upper)):
+                if width == 0:
+                    continue
+                if width > self.widths[d][side] or modes[d][side] != self.modes[d][side]:
+                    return False
+                if modes[d][side] == 'constant' and constant_values[d][side] != self.constant_values[d][side]:
+                    return False
+        return True
+
+    def view(self, widths):
+        """ Returns a view of the buffer that contains the interior padded by widths. Does not refresh the ghost cells. """
+        return self.buffer[tuple(slice(h_lower - lower, h_lower + s + upper) for (h_lower, _), (lower, upper), s in zip(self.widths, widths, self.interior_shape))]
+
+
+def with_halo(tensor, width=1, mode='constant', constant_values=0):
+    """
+Copies a NumPy array into a buffer with ghost cells around all spatial dimensions.
+If tensor already lives in a suitable halo buffer, it is returned unchanged.
+Tensors of other backends are returned unchanged.
+    :param tensor: NumPy array of shape (batch_size, spatial dimensions..., components)
+    :param width: number of ghost cells on each side of every spatial dimension
+    :param mode: padding mode as in math.pad, 'constant', 'symmetric', 'reflect', 'wrap' or nested per dimension and side
+    :param constant_values: used for ghost cells if mode='constant'
+    :return: array with equal values that is a view into the halo buffer
+    """
+    if not isinstance(tensor, np.ndarray) or tensor.ndim < 3:
+        return tensor
+    rank = tensor.ndim
+    widths = [[0, 0]] + [[width, width]] * (rank - 2) + [[0, 0]]
+    existing = find_halo(tensor)
+    if existing is not None and existing.supports(widths, _expand_modes(mode, rank), expand(constant_values, shape=(rank, 2))):
+        return tensor
+    interior = empty_with_halo(tensor.shape, tensor.dtype, width, mode, constant_values)
+    interior[...] = tensor
+    return interior
+
+
+def empty_with_halo(shape, dtype, width=1, mode='constant', constant_values=0):
+    """
+Allocates an uninitialized array inside a buffer with ghost cells around all spatial dimensions, see with_halo().
+Operations can write their results directly into this array instead of copying them into a halo buffer afterwards.
+    :param shape: (batch_size, spatial dimensions..., components)
+    :return: writable NumPy array of the given shape that is a view into the halo buffer
+    """
+    rank = len(shape)
+    widths = [[0, 0]] + [[width, width]] * (rank - 2) + [[0, 0]]
+    halo = Halo(shape, widths, mode, constant_values, dtype)
+    interior = halo.view([[0, 0]] * rank)
+    key = id(interior)
+    halo._interior_ref = weakref.ref(interior, lambda _ref: _HALOS.pop(key, None))
+    _HALOS[key] = halo
+    return interior
+
+
+def find_halo(tensor):
+    """
+    :return: the Halo whose interior is tensor or None
+    """
+    if not isinstance(tensor, np.ndarray):
+        return None
+    halo = _HALOS.get(id(tensor), None)
+    if halo is not None and halo._interior_ref() is tensor:
+        return halo
+    return None
+
+
+def halo_padded(value, pad_width, mode, constant_values):
+    """
+Pads value by refreshing the ghost cells of its halo buffer if possible.
+The result is read-only since writing to it would modify value.
+    :return: padded view of the halo buffer or None if value does not have a compatible halo
+    """
+    halo = find_halo(value)
+    if halo is None:
+        return None
+    rank = value.ndim
+    widths = _expand_widths(pad_width, rank)
+    if not halo.supports(widths, _expand_modes(mode, rank), expand(constant_values, shape=(rank, 2))):
+        return None
+    halo.refresh()
+    padded = halo.view(widths)
+    padded.setflags(write=False)
+    return padded
+
+
+def padded_copy(value, pad_width, mode, constant_values):
+    """
+Pads value with mixed modes using a single allocation.
+The result equals applying the modes one after another in the order wrap, symmetric, reflect, constant.
+    :return: padded NumPy array or None if the widths exceed the array size for a reflecting or wrapping mode
+    """
+    rank = value.ndim
+    widths = _expand_widths(pad_width, rank)
+    modes = _expand_modes(mode, rank)
+    for d in range(rank):
+        for side in (0, 1):
+            limit = value.shape[d] - 1 if modes[d][side] == 'reflect' else value.shape[d]
+            if modes[d][side] != 'constant' and widths[d][side] > limit:
+                return None
+    buffer = np.empty([s + lower + upper for s, (lower, upper) in zip(value.shape, widths)], value.dtype)
+    constant_values = expand(constant_values, shape=(rank, 2))
+    interior = tuple(slice(lower, lower + s) for s, (lower, _) in zip(value.shape, widths))
+    if widths[0] == [0, 0] and value.shape[0] >= get_num_threads():
+        def pad_slab(slab):  # batch entries are independent if the first dimension is not padded
+            start, stop = slab
+            buffer[(slice(start, stop),) + interior[1:]] = value[start:stop]
+            fill_ghost_cells(buffer[start:stop], widths, modes, constant_values)
+
+        parallel_map(pad_slab, slabs(value.shape[0]))
+        return buffer
+    if rank > 1:
+        # too few batch entries: copy the interior in slabs along the first spatial axis, then fill the comparatively small ghost regions
+        def copy_slab(slab):
+            start, stop = slab
+            buffer[interior[:1] + (slice(widths[1][0] + start, widths[1][0] + stop),) + interior[2:]] = value[:, start:stop]
+
+        parallel_map(copy_slab, slabs(value.shape[1]))
+    else:
+        buffer[interior] = value
+    fill_ghost_cells(buffer, widths, modes, constant_values)
+    return buffer
+
+
+def fill_ghost_cells(buffer, widths, modes, constant_values):
+    """
+Fills the ghost cells of buffer in-place from the interior which is located at buffer[widths[d][0]:-widths[d][1]].
+    :param widths: list of [lower, upper] for every dimension of buffer
+    :param modes: list of [lower, upper] mode for every dimension of buffer
+    :param constant_values: list of [lower, upper] values for every dimension of buffer
+    """
+    valid = [[lower, size - upper] for size, (lower, upper) in zip(buffer.shape, widths)]
+    for single_mode in _PASS_ORDER:
+        for axis in range(buffer.ndim):
+            lower = widths[axis][0] if modes[axis][0] == single_mode else 0
+            upper = widths[axis][1] if modes[axis][1] == single_mode else 0
+            if lower == 0 and upper == 0:
+                continue
+            _fill_axis(buffer, valid, axis, lower, upper, single_mode, constant_values[axis])
+
+
+def _fill_axis(buffer, valid, axis, w_lower, w_upper, mode, constant_values):
+    lo, hi = valid[axis]
+
+    def region(start, stop):
+        return tuple(slice(start, stop) if d == axis else slice(*valid[d]) for d in range(buffer.ndim))
+
+    def flipped(start, stop):
+        return np.flip(buffer[region(start, stop)], axis)
+
+    if mode == 'constant':
+        buffer[region(lo - w_lower, lo)] = constant_values[0]
+        buffer[region(hi, hi + w_upper)] = constant_values[1]
+    elif mode == 'wrap':
+        buffer[region(lo - w_lower, lo)] = buffer[region(hi - w_lower, hi)]
+        buffer[region(hi, hi + w_upper)] = buffer[region(lo, lo + w_upper)]
+    elif mode == 'symmetric':
+        buffer[region(lo - w_lower, lo)] = flipped(lo, lo + w_lower)
+        buffer[region(hi, hi + w_upper)] = flipped(hi - w_upper, hi)
+    elif mode == 'reflect':
+        buffer[region(lo - w_lower, lo)] = flipped(lo + 1, lo + 1 + w_lower)
+        buffer[region(hi, hi + w_upper)] = flipped(hi - 1 - w_upper, hi - 1)
+    else:
+        raise ValueError('Unsupported padding mode: %s' % mode)
+    valid[axis] = [lo - w_lower, hi + w_upper]
+
+
+def _expand_widths(pad_width, rank):
+    return [[int(collapsed_gather_nd(pad_width, [d, upper])) for upper in (0, 1)] for d in range(rank)]
+
+
+def _expand_modes(mode, rank):
+    return [[single_mode.lower() for single_mode in pair] for pair in expand(mode, shape=(rank, 2))]
@@ -7,6 +7,7 @@ from phi.struct.functions import mappable
 from .base_backend import DYNAMIC_BACKEND as math
 from .base_backend import NoBackendFound
 from .nd import fftfreq
+from .precision import storage_dtype
 
 
 @mappable(item_condition=struct.ALL_ITEMS, unsafe_context=True)
@@ -32,21 +33,23 @@ def _none_to_one(shape):
 
 
 @mappable(leaf_condition=is_static_shape)
-def zeros(shape, dtype=np.float32):
-    return np.zeros(_none_to_one(shape), dtype=dtype)
+def zeros(shape, dtype=None):
+    return np.zeros(_none_to_one(shape), dtype=dtype or storage_dtype())
 
 
 @mappable(leaf_condition=is_static_shape)
-def ones(shape, dtype=np.float32):
-    return np.ones(_none_to_one(shape), dtype)
+def ones(shape, dtype=None):
+    return np.ones(_none_to_one(shape), dtype or storage_dtype())
 
 
 @mappable(leaf_condition=is_static_shape)
-def randn(shape, dtype=np.float32):
-    return np.random.randn(*_none_to_one(shape)).astype(dtype)
+def randn(shape, dtype=None):
+    return np.random.randn(*_none_to_one(shape)).astype(dtype or storage_dtype())
 
 
-def randfreq(shape, dtype=np.float32, power=8):
+def randfreq(shape, dtype=None, power=8):
+    dtype = dtype or storage_dtype()
+
     def genarray(shape):
         fft = randn(shape, dtype) + 1j * randn(shape, dtype)
         k = fftfreq(shape[1:-1], mode='absolute')
@@ -5,6 +5,7 @@ import numpy as np
 
 from phi import struct
 from .base_backend import DYNAMIC_BACKEND as math
+from .precision import storage_dtype
 
 
 def spatial_rank(tensor):
@@ -28,16 +29,18 @@ def is_scalar(obj):
     return len(math.staticshape(obj)) == 0
 
 
-def indices_tensor(tensor, dtype=np.float32):
+def indices_tensor(tensor, dtype=None):
     """
     Returns an index tensor of the same spatial shape as the given tensor.
     Each index denotes the location within the tensor starting from zero.
     Indices are encoded as vectors in the index tensor.
 
     :param tensor: a tensor of shape (batch size, spatial dimensions..., component size)
-    :param dtype: a numpy data type (default float32)
+    :param dtype: a numpy data type (default: storage precision, see phi.math.precision)
     :return: an index tensor of shape (1, spatial dimensions..., spatial rank)
     """
+    if dtype is None:
+        dtype = storage_dtype()
     spatial_dimensions = list(tensor.shape[1:-1])
     idx_zyx = np.meshgrid(*[range(dim) for dim in spatial_dimensions], indexing='ij')
     idx = np.stack(idx_zyx, axis=-1).reshape([1, ] + spatial_dimensions + [len(spatial_dimensions)])
@@ -0,0 +1,143 @@
+"""
+Thread pool used by the NumPy backend to split heavy kernels over batch entries or spatial slabs.
+
+NumPy and SciPy release the GIL inside most of their compiled loops, so independent slabs can run concurrently in threads.
+Results are always assembled in slab order, so the output does not depend on the number of threads or on scheduling.
+
+Parallel execution is disabled by default (one thread). Enable it globally using
+    math.set_num_threads(8)  # or math.set_num_threads(None) to match the CPUs available to this process
+or temporarily with
+    with math.threads(8):
+        ...
+"""
+import os
+import threading
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+
+
+_NUM_THREADS = [1]
+_THREADS_STACK = []
+_POOLS = {}  # thread count -> ThreadPool
+_WORKER = threading.local()
+
+
+def available_cpus():
+    """
+Number of CPUs this process may use, taking into account CPU affinity and cgroup CPU quotas (e.g. Docker --cpus or Kubernetes limits).
+    :return: int >= 1
+    """
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on all platforms
+        count = os.cpu_count() if hasattr(os, 'cpu_count') else None
+        if count is None:
+            import multiprocessing
+            count = multiprocessing.cpu_count()
+    limit = cgroup_cpu_limit()
+    if limit is not None:
+        count = min(count, limit)
+    return max(1, count)
+
+
+def cgroup_cpu_limit():
+    """
+Reads the CPU quota of the cgroup this process runs in (cgroup v2 or v1).
+    :return: quota rounded up to whole CPUs or None if no quota is set
+    """
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:  # cgroup v2
+            quota, period = f.read().split()[:2]
+        if quota == 'max':
+            return None
+        return _whole_cpus(int(quota), int(period))
+    except (IOError, OSError, ValueError):
+        pass
+    try:
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:  # cgroup v1
+            quota = int(f.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+            period = int(f.read())
+        if quota <= 0:
+            return None
+        return _whole_cpus(quota, period)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _whole_cpus(quota, period):
+    return max(1, -(-quota // period))
+
+
+def _resolve_thread_count(num_threads):
+    if num_threads is None:
+        return available_cpus()
+    assert num_threads >= 1, 'num_threads must be at least 1 but got %s' % num_threads
+    return int(num_threads)
+
+
+def get_num_threads():
+    """
+    :return: number of threads the NumPy backend currently uses for parallel kernels, i.e. the innermost threads() context or the global setting
+    """
+    if _THREADS_STACK:
+        return _THREADS_STACK[-1]
+    return _NUM_THREADS[0]
+
+
+def set_num_threads(num_threads):
+    """
+Sets the global number of threads used by parallel NumPy kernels. This does not affect active threads() contexts.
+    :param num_threads: int >= 1 or None to use available_cpus(), which respects cgroup CPU limits
+    """
+    _NUM_THREADS[0] = _resolve_thread_count(num_threads)
+
+
+@contextmanager
+def threads(num_threads):
+    """
+Context manager that temporarily sets the number of threads used by parallel NumPy kernels.
+    :param num_threads: int >= 1 or None to use available_cpus()
+    """
+    _THREADS_STACK.append(_resolve_thread_count(num_threads))
+    try:
+        yield get_num_threads()
+    finally:
+        _THREADS_STACK.pop(-1)
+
+
+def parallel_map(function, items):
+    """
+Applies function to all items, using the thread pool if more than one thread is configured.
+Nested calls from within a worker thread run sequentially.
+    :return: list of results in the order of items
+    """
+    items = list(items)
+    num_threads = min(get_num_threads(), len(items))
+    if num_threads <= 1 or _is_worker_thread():
+        return [function(item) for item in items]
+    return _pool(num_threads).map(function, items, chunksize=1)
+
+
+def slabs(size, min_slab_size=1):
+    """
+Splits range(size) into at most get_num_threads() contiguous slabs of nearly equal size.
+    :return: list of (start, stop) tuples in ascending order
+    """
+    count = max(1, min(get_num_threads(), size // max(1, min_slab_size)))
+    bounds = [size * i // count for i in range(count + 1)]
+    return [(start, stop) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+
+def _pool(num_threads):
+    if num_threads not in _POOLS:
+        _POOLS[num_threads] = ThreadPool(num_threads, initializer=_mark_worker_thread)
+    return _POOLS[num_threads]
+
+
+def _mark_worker_thread():
+    _WORKER.active = True
+
+
+def _is_worker_thread():
+    return getattr(_WORKER, 'active', False)
@@ -0,0 +1,79 @@
+"""
+Floating point precision policy for tensors created or accumulated by the NumPy backend.
+
+The policy distinguishes between the storage dtype, used for all float arrays that are created by phi,
+and the accumulation dtype, used for reductions and sums such as the dot products in conjugate gradient solves.
+
+Example: float16 storage with float32 accumulation
+    with math.precision(16, 32):
+        ...
+"""
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class Precision(object):
+    """
+Pair of floating point types (storage, accumulation) that phi uses when creating or reducing float tensors.
+    """
+
+    def __init__(self, storage, accumulation=None):
+        self.storage = _float_type(storage)
+        self.accumulation = self.storage if accumulation is None else _float_type(accumulation)
+        assert self.accumulation.itemsize >= self.storage.itemsize, 'Accumulation precision must be at least the storage precision but got %s' % self
+
+    def __repr__(self):
+        return 'Precision(storage=%s, accumulation=%s)' % (self.storage, self.accumulation)
+
+
+def _float_type(value):
+    if isinstance(value, int):
+        value = {16: np.float16, 32: np.float32, 64: np.float64}[value]
+    dtype = np.dtype(value)
+    assert dtype.kind == 'f', 'Precision must be a floating point type but got %s' % dtype
+    return dtype
+
+
+_DEFAULT_PRECISION = [Precision(np.float32)]
+_PRECISION_STACK = []
+
+
+def get_precision():
+    """
+    :return: the currently active Precision, i.e. the innermost precision() context or the global default
+    """
+    if _PRECISION_STACK:
+        return _PRECISION_STACK[-1]
+    return _DEFAULT_PRECISION[0]
+
+
+def set_precision(storage, accumulation=None):
+    """
+Sets the global precision policy. This does not affect active precision() contexts.
+    :param storage: 16, 32, 64 or NumPy float type
+    :param accumulation: 16, 32, 64, NumPy float type or None to use the storage precision
+    """
+    _DEFAULT_PRECISION[0] = Precision(storage, accumulation)
+
+
+@contextmanager
+def precision(storage, accumulation=None):
+    """
+Context manager that temporarily overrides the precision policy.
+    :param storage: 16, 32, 64 or NumPy float type
+    :param accumulation: 16, 32, 64, NumPy float type or None to use the storage precision
+    """
+    _PRECISION_STACK.append(Precision(storage, accumulation))
+    try:
+        yield get_precision()
+    finally:
+        _PRECISION_STACK.pop(-1)
+
+
+def storage_dtype():
+    return get_precision().storage
+
+
+def accumulation_dtype():
+    return get_precision().accumulation
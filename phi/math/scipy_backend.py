@@ -7,6 +7,13 @@ import six
 
 from phi.struct.tensorop import collapsed_gather_nd, expand
 from .base_backend import Backend
+from . import halo
+from .parallel import parallel_map, slabs, get_num_threads
+from .precision import storage_dtype, accumulation_dtype
+
+
+# Minimum number of matrix rows per thread when matmul() splits a sparse matrix
+MATMUL_MIN_ROWS = 1024
 
 
 class SciPyBackend(Backend):
@@ -48,7 +55,7 @@ class SciPyBackend(Backend):
             return (x/y)
 
     def random_uniform(self, shape):
-        return np.random.random(shape).astype('f')
+        return np.random.random(shape).astype(storage_dtype())
 
     def rank(self, value):
         return len(value.shape)
@@ -68,11 +75,18 @@ class SciPyBackend(Backend):
         return np.concatenate(values, axis)
 
     def pad(self, value, pad_width, mode='constant', constant_values=0):
+        padded = halo.halo_padded(value, pad_width, mode, constant_values)
+        if padded is not None:
+            return padded
         dims = range(len(self.shape(value)))
         constant_values = expand(constant_values, shape=(len(dims), 2))
-        if isinstance(mode, six.string_types):
+        if isinstance(mode, six.string_types) and (get_num_threads() == 1 or not isinstance(value, np.ndarray) or mode.lower() not in halo._PASS_ORDER):
             return self._single_mode_pad(value, pad_width, mode, constant_values)
         else:
+            if isinstance(value, np.ndarray):
+                padded = halo.padded_copy(value, pad_width, mode, constant_values)
+                if padded is not None:
+                    return padded
             mode = expand(mode, shape=(len(dims), 2))
             for single_mode in ('wrap', 'symmetric', 'reflect', 'constant'):  # order matters! wrap first
                 widths = [[collapsed_gather_nd(pad_width, [d, upper]) if mode[d][upper] == single_mode else 0 for upper in (False, True)] for d in dims]
@@ -124,16 +138,22 @@ class SciPyBackend(Backend):
 
         import scipy.interpolate
         points = [np.arange(dim) for dim in inputs.shape[1:-1]]
-        result = []
-        for batch in range(sample_coords.shape[0]):
-            components = []
-            for dim in range(inputs.shape[-1]):
-                resampled = scipy.interpolate.interpn(points, inputs[batch, ..., dim], sample_coords[batch, ...], method=interpolation.lower(), bounds_error=False, fill_value=0)
-                components.append(resampled)
-            result.append(np.stack(components, -1))
-
-        result = np.stack(result).astype(inputs.dtype)
-        return result
+
+        # split over batch entries and components, and also over slabs of sample points if these are too few to use all threads
+        tasks = [(batch, dim) for batch in range(sample_coords.shape[0]) for dim in range(inputs.shape[-1])]
+        if len(tasks) < get_num_threads() and sample_coords.ndim > 2:
+            point_slabs = [slice(start, stop) for start, stop in slabs(sample_coords.shape[1])]
+        else:
+            point_slabs = [slice(None)]
+
+        def resample_slab(task):
+            (batch, dim), slab = task
+            return scipy.interpolate.interpn(points, inputs[batch, ..., dim], sample_coords[batch, slab], method=interpolation.lower(), bounds_error=False, fill_value=0)
+
+        parts = iter(parallel_map(resample_slab, [(task, slab) for task in tasks for slab in point_slabs]))
+        components = [np.concatenate([next(parts) for _ in point_slabs]) for _ in tasks]
+        result = np.stack([np.stack(components[batch * inputs.shape[-1]:(batch + 1) * inputs.shape[-1]], -1) for batch in range(sample_coords.shape[0])])
+        return result.astype(inputs.dtype)
 
     def zeros_like(self, tensor):
         return np.zeros_like(tensor)
@@ -148,7 +168,12 @@ class SciPyBackend(Backend):
         return np.tensordot(a, b, axes)
 
     def matmul(self, A, b):
-        return np.stack([A.dot(b[i]) for i in range(b.shape[0])])
+        if not scipy.sparse.isspmatrix_csr(A) or b.shape[0] >= get_num_threads():
+            return np.stack(parallel_map(lambda i: A.dot(b[i]), range(b.shape[0])))
+        # too few batch entries: split the rows of A, each row is summed in the same order as by A.dot()
+        tasks = [(i, slab) for i in range(b.shape[0]) for slab in slabs(A.shape[0], min_slab_size=MATMUL_MIN_ROWS)]
+        blocks = parallel_map(lambda task: _csr_rows(A, *task[1]).dot(b[task[0]]), tasks)
+        return np.stack([np.concatenate([block for (i, _), block in zip(tasks, blocks) if i == batch]) for batch in range(b.shape[0])])
 
     def while_loop(self, cond, body, loop_vars, shape_invariants=None, parallel_iterations=10, back_prop=True,
                    swap_memory=False, name=None, maximum_iterations=None):
@@ -199,17 +224,20 @@ class SciPyBackend(Backend):
         assert tensor.shape[-1] == kernel.shape[-2]
         # kernel = kernel[[slice(None)] + [slice(None, None, -1)] + [slice(None)]*(len(kernel.shape)-3) + [slice(None)]]
         if padding.lower() == "same":
-            result = np.zeros(tensor.shape[:-1] + (kernel.shape[-1],), np.float32)
+            result = np.zeros(tensor.shape[:-1] + (kernel.shape[-1],), accumulation_dtype())
         elif padding.lower() == "valid":
             valid = [tensor.shape[i + 1] - (kernel.shape[i] + 1) // 2 for i in range(tensor_spatial_rank(tensor))]
-            result = np.zeros([tensor.shape[0]] + valid + [kernel.shape[-1]], np.float32)
+            result = np.zeros([tensor.shape[0]] + valid + [kernel.shape[-1]], accumulation_dtype())
         else:
             raise ValueError("Illegal padding: %s"%padding)
-        for batch in range(tensor.shape[0]):
-            for o in range(kernel.shape[-1]):
-                for i in range(tensor.shape[-1]):
-                    result[batch, ..., o] += scipy.signal.correlate(tensor[batch, ..., i], kernel[..., i, o], padding.lower())
-        return result
+
+        def convolve_channel(batch_and_channel):
+            batch, o = batch_and_channel
+            for i in range(tensor.shape[-1]):
+                result[batch, ..., o] += scipy.signal.correlate(tensor[batch, ..., i], kernel[..., i, o], padding.lower())
+
+        parallel_map(convolve_channel, [(batch, o) for batch in range(tensor.shape[0]) for o in range(kernel.shape[-1])])
+        return _to_storage(result)
 
     def expand_dims(self, a, axis=0, number=1):
         for _i in range(number):
@@ -223,7 +251,7 @@ class SciPyBackend(Backend):
         return np.shape(tensor)
 
     def to_float(self, x, float64=False):
-        return np.array(x).astype(np.float64 if float64 else np.float32)
+        return np.array(x).astype(np.float64 if float64 else storage_dtype())
 
     def to_int(self, x, int64=False):
         return np.array(x).astype(np.int64 if int64 else np.int32)
@@ -269,18 +297,20 @@ class SciPyBackend(Backend):
 
     def scatter(self, points, indices, values, shape, duplicates_handling='undefined'):
         indices = self.unstack(indices, axis=-1)
-        array = np.zeros(shape, np.float32)
         if duplicates_handling == 'add':
-            np.add.at(array, tuple(indices), values)
+            array = np.zeros(shape, accumulation_dtype())
+            _add_at(array, tuple(indices), values)
         elif duplicates_handling == 'mean':
+            array = np.zeros(shape, accumulation_dtype())
             count = np.zeros(shape, np.int32)
-            np.add.at(array, tuple(indices), values)
-            np.add.at(count, tuple(indices), 1)
+            _add_at(array, tuple(indices), values)
+            _add_at(count, tuple(indices), 1)
             count = np.maximum(1, count)
-            return array / count
+            array = array / count
         else:  # last, any, undefined
+            array = np.zeros(shape, storage_dtype())
             array[indices] = values
-        return array
+        return _to_storage(array)
 
     def fft(self, x):
         rank = len(x.shape) - 2
@@ -320,6 +350,41 @@ class SciPyBackend(Backend):
         return array.dtype
 
 
+def _add_at(array, indices, values):
+    """
+Equivalent to np.add.at(array, indices, values).
+With multiple threads, the target array is split into slabs along the first indexed axis that has at least as many entries as there are threads,
+i.e. the batch axis or, for small batches, a spatial axis. Every slab only receives the values that fall into it,
+so that no two threads write to the same memory and the summation order per element stays the same.
+    """
+    indexed_sizes = array.shape[:len(indices)]
+    if get_num_threads() == 1 or max(indexed_sizes) < 2:
+        np.add.at(array, indices, values)
+        return
+    axis = next((d for d, size in enumerate(indexed_sizes) if size >= get_num_threads()), int(np.argmax(indexed_sizes)))
+    indices = tuple(np.asarray(index) for index in indices)
+    values = np.broadcast_to(values, indices[0].shape + array.shape[len(indices):])
+
+    def add_slab(slab):
+        start, stop = slab
+        selection = (indices[axis] >= start) & (indices[axis] < stop)
+        np.add.at(array, tuple(index[selection] for index in indices), values[selection])
+
+    parallel_map(add_slab, slabs(array.shape[axis]))
+
+
+def _csr_rows(matrix, start, stop):
+    """ Returns rows start:stop of a CSR matrix as CSR matrix that shares the data and indices arrays with matrix. """
+    begin, end = matrix.indptr[start], matrix.indptr[stop]
+    return scipy.sparse.csr_matrix((matrix.data[begin:end], matrix.indices[begin:end], matrix.indptr[start:stop + 1] - begin), shape=(stop - start, matrix.shape[1]))
+
+
+def _to_storage(array):
+    if array.dtype.kind == 'f' and array.dtype != storage_dtype():
+        return array.astype(storage_dtype())
+    return array
+
+
 def clamp(coordinates, shape):
     assert coordinates.shape[-1] == len(shape)
     for i in range(len(shape)):
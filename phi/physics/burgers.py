@@ -6,13 +6,14 @@ from .field.effect import effect_applied
 
 class Burgers(Physics):
 
-    def __init__(self, viscosity=0.1):
+    def __init__(self, viscosity=0.1, implicit=False):
         Physics.__init__(self, [StateDependency('effects', 'velocity_effect', blocking=True)])
         self.viscosity = viscosity
+        self.implicit = implicit
 
     def step(self, v, dt=1.0, effects=()):
         v = advect.semi_lagrangian(v, v, dt)
-        v = diffuse(v, dt * self.viscosity, substeps=1)
+        v = diffuse(v, dt * self.viscosity, substeps=1, implicit=self.implicit)
         for effect in effects:
             v = effect_applied(effect, v, dt)
         return v.copied_with(age=v.age + dt)
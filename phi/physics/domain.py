@@ -9,7 +9,7 @@ from .material import Material, OPEN
 from .field import CenteredGrid, StaggeredGrid, Field, DIVERGENCE_FREE
 
 
-@struct.definition()
+@struct.definition(compile=True, fingerprint=True)
 class Domain(struct.Struct):
 
     def __init__(self, resolution, boundaries=OPEN, box=None, **kwargs):
@@ -43,7 +43,7 @@ class Domain(struct.Struct):
     def box(self, box):
         return AABox.to_box(box, resolution_hint=self.resolution)
 
-    @struct.constant(default=OPEN)
+    @struct.constant(default=OPEN, dependencies='resolution')
     def boundaries(self, boundaries):
         assert isinstance(boundaries, (Material, list, tuple))
         if isinstance(boundaries, (tuple, list)):
@@ -101,7 +101,9 @@ class Domain(struct.Struct):
                 grids.append(grid)
             return StaggeredGrid(grids, age=age, box=self.box, name=name, batch_size=batch_size, extrapolation=extrapolation, flags=())
 
-    def centered_grid(self, data, components=1, dtype=np.float32, name=None, batch_size=None, extrapolation=None):
+    def centered_grid(self, data, components=1, dtype=None, name=None, batch_size=None, extrapolation=None):
+        if dtype is None:
+            dtype = math.storage_dtype()
         if extrapolation is None:
             extrapolation = Material.extrapolation_mode(self.boundaries)
         if callable(data):  # data is an initializer
@@ -126,7 +128,9 @@ class Domain(struct.Struct):
             grid = CenteredGrid(data, box=self.box, extrapolation=extrapolation, name=name)
         return grid
 
-    def staggered_grid(self, data, dtype=np.float32, name=None, batch_size=None, extrapolation=None):
+    def staggered_grid(self, data, dtype=None, name=None, batch_size=None, extrapolation=None):
+        if dtype is None:
+            dtype = math.storage_dtype()
         if extrapolation is None:
             extrapolation = Material.extrapolation_mode(self.boundaries)
         if callable(data):  # data is an initializer
@@ -188,10 +192,10 @@ class DomainState(State):
     def rank(self):
         return self.domain.rank
 
-    def centered_grid(self, name, value, components=1, dtype=np.float32):
+    def centered_grid(self, name, value, components=1, dtype=None):
         extrapolation = Material.extrapolation_mode(self.domain.boundaries)
         return self.domain.centered_grid(value, dtype=dtype, name=name, components=components, batch_size=self._batch_size, extrapolation=extrapolation)
 
-    def staggered_grid(self, name, value, dtype=np.float32):
+    def staggered_grid(self, name, value, dtype=None):
         extrapolation = Material.extrapolation_mode(self.domain.boundaries)
         return self.domain.staggered_grid(value, dtype=dtype, name=name, batch_size=self._batch_size, extrapolation=extrapolation)
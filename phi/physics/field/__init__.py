@@ -3,9 +3,11 @@ from .flag import Flag, DIVERGENCE_FREE, L2_NORMALIZED
 from .constant import ConstantField
 from .grid import CenteredGrid
 from .staggered_grid import StaggeredGrid, unstack_staggered_tensor
-from .mask import GeometryMask, mask, union_mask
+from .mask import GeometryMask, mask, union_mask, rasterized_union
 from .analytic import AnalyticField
 from . import advect
 from . import manta
 from .util import diffuse, data_bounds
 from .sampled import SampledField
+from .transfer import particles_to_grid, grid_to_particles
+from .lazy import lazy_evaluation, set_lazy_evaluation, lazy_evaluation_enabled, materialize
@@ -1,4 +1,12 @@
+import numpy as np
+import six
+
+from phi import struct
 from .field import StaggeredSamplePoints
+from .grid import CenteredGrid
+from .staggered_grid import StaggeredGrid
+from .resampling import sample_linear
+from .transfer import grid_to_particles
 
 
 def semi_lagrangian(field, velocity_field, dt):
@@ -9,6 +17,8 @@ def semi_lagrangian(field, velocity_field, dt):
         :param dt: time step
         :return: Field compatible with input field
     """
+    if _supports_grid_advection(field) and _supports_grid_advection(velocity_field):
+        return grid_semi_lagrangian([field], velocity_field, dt)[0]
     try:
         x0 = field.points
         v = velocity_field.at(x0)
@@ -18,3 +28,85 @@ def semi_lagrangian(field, velocity_field, dt):
     except StaggeredSamplePoints:
         advected = [semi_lagrangian(component, velocity_field, dt) for component in field.unstack()]
         return field.with_data(advected)
+
+
+def grid_semi_lagrangian(fields, velocity_field, dt):
+    """
+    Semi-Lagrangian advection of multiple CenteredGrids and StaggeredGrids (MAC grids) by the same velocity grid.
+    The velocity is averaged onto the sample points of each grid (or staggered component) using direct stencils (see CenteredGrid.at).
+    Then each grid performs a single backtrace in index space and one gather with multilinear interpolation.
+    Velocity samples are shared between fields with equal sample points, e.g. when advecting density and velocity in the same step.
+
+    Fields that are not NumPy grids with a uniform extrapolation are advected using semi_lagrangian().
+        :param fields: list or tuple of Fields
+        :param velocity_field: CenteredGrid or StaggeredGrid
+        :param dt: time step
+        :return: list of advected fields, equivalent to [semi_lagrangian(field, velocity_field, dt) for field in fields]
+    """
+    if not _supports_grid_advection(velocity_field):
+        return [semi_lagrangian(field, velocity_field, dt) for field in fields]
+    velocity_samples = {}  # geometry -> velocity at the sample points of a grid
+
+    def advect_grid(grid):
+        key = (struct.fingerprint(grid.box), tuple(int(r) for r in grid.resolution))
+        if key not in velocity_samples:
+            velocity_samples[key] = velocity_field.at(grid).data
+        velocity = velocity_samples[key]
+        displacement = velocity * (dt / grid.dx).astype(velocity.dtype)
+        coordinates = np.empty(displacement.shape, np.result_type(displacement.dtype, np.float32))
+        for axis, size in enumerate(grid.resolution):
+            index = np.arange(size).reshape([1] + [-1 if d == axis else 1 for d in range(grid.rank)])
+            coordinates[..., axis] = index - displacement[..., axis]
+        return grid.with_data(sample_linear(grid.data, coordinates, grid.extrapolation))
+
+    result = []
+    for field in fields:
+        if not _supports_grid_advection(field):
+            result.append(semi_lagrangian(field, velocity_field, dt))
+        elif isinstance(field, StaggeredGrid):
+            result.append(field.with_data([advect_grid(component) for component in field.data]))
+        else:
+            result.append(advect_grid(field))
+    return result
+
+
+def points(sample_points, velocity_field, dt, order=2):
+    """
+    Lagrangian advection of points, e.g. marker particles, using an explicit Runge-Kutta integrator.
+    All points are advanced in one batched call per velocity evaluation.
+    NumPy grids are sampled with the vectorized multilinear interpolator, other fields with sample_at().
+        :param sample_points: SampledField or NumPy array of shape (batch_size, point_count, rank) holding positions in world space
+        :param velocity_field: Field, typically a StaggeredGrid
+        :param dt: time step
+        :param order: 1 (Euler), 2 (midpoint) or 4 (classical Runge-Kutta)
+        :return: advected points of the same type as sample_points. The data of SampledFields is kept.
+    """
+    assert order in (1, 2, 4), 'order must be 1, 2 or 4 but got %s' % order
+    from .sampled import SampledField  # pylint: disable-msg = cyclic-import
+    if isinstance(sample_points, SampledField):
+        advected = points(sample_points.sample_points, velocity_field, dt, order)
+        if sample_points.data is sample_points.sample_points:
+            return sample_points.copied_with(sample_points=advected, data=advected)
+        return sample_points.copied_with(sample_points=advected)
+    x = sample_points
+    v1 = _sample_velocity(velocity_field, x)
+    if order == 1:
+        return x + dt * v1
+    v2 = _sample_velocity(velocity_field, x + (0.5 * dt) * v1)
+    if order == 2:
+        return x + dt * v2
+    v3 = _sample_velocity(velocity_field, x + (0.5 * dt) * v2)
+    v4 = _sample_velocity(velocity_field, x + dt * v3)
+    return x + (dt / 6.) * (v1 + 2 * v2 + 2 * v3 + v4)
+
+
+def _sample_velocity(velocity_field, x):
+    if _supports_grid_advection(velocity_field) and isinstance(x, np.ndarray):
+        return grid_to_particles(velocity_field, x)
+    return velocity_field.sample_at(x)
+
+
+def _supports_grid_advection(field):
+    if isinstance(field, StaggeredGrid):
+        return isinstance(field.extrapolation, six.string_types) and all(_supports_grid_advection(component) for component in field.data)
+    return isinstance(field, CenteredGrid) and isinstance(field.extrapolation, six.string_types) and isinstance(field.data, np.ndarray)
@@ -7,7 +7,7 @@ ADD = 'add'
 FIX = 'fix'
 
 
-@struct.definition()
+@struct.definition(slots=True)
 class FieldEffect(State):
 
     def __init__(self, field, targets, mode=GROW, tags=('effect',), **kwargs):
@@ -54,7 +54,7 @@ HeatSource = lambda geometry, rate: FieldEffect(GeometryMask([geometry], value=r
 ColdSource = lambda geometry, rate: FieldEffect(GeometryMask([geometry], value=-rate, name='heat-source'), ('temperature',), GROW)
 
 
-@struct.definition()
+@struct.definition(slots=True)
 class Gravity(State):
 
     def __init__(self, gravity=-9.81, name='gravity', **kwargs):
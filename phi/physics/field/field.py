@@ -3,6 +3,7 @@ import numpy as np
 from phi import math, struct
 from phi.physics import State
 from phi.physics.field.flag import _PROPAGATOR
+from phi.physics.field.lazy import lazy_evaluation_enabled, lazy_operation, LazyExpression
 
 
 def _to_valid_data(data):
@@ -38,7 +39,7 @@ class Field(State):
         """
         return _to_valid_data(data)
 
-    @struct.constant()
+    @struct.constant(dependencies='data')
     def flags(self, flags):
         """
         Flags describe constants_dict of a Field such as divergence-freeness.
@@ -159,22 +160,79 @@ class Field(State):
         return self.__dataop__(other, True, lambda d1, d2: d1 / d2)
 
     def __dataop__(self, other, linear_if_scalar, data_operator):
+        lazy = lazy_evaluation_enabled()
         if isinstance(other, Field):
             assert self.compatible(other), 'Fields are not compatible: %s and %s' % (self, other)
             flags = propagate_flags_operation(self.flags+other.flags, False, self.rank, self.component_count)
-            self_data = self.data if self.has_points else self.at(other).data
-            other_data = other.data if other.has_points else other.at(self).data
-            data = data_operator(self_data, other_data)
+            self_data = _lazy_data(self) if self.has_points else self.at(other).data
+            other_data = _lazy_data(other) if other.has_points else other.at(self).data
         else:
             flags = propagate_flags_operation(self.flags, linear_if_scalar, self.rank, self.component_count)
-            data = data_operator(self.data, other)
+            self_data, other_data = _lazy_data(self), other
+        if lazy:
+            data = lazy_operation(data_operator, self_data, other_data)
+            if isinstance(data, LazyExpression):
+                return self._with_pending_data(data, flags)
+        else:
+            data = self._data_operation(data_operator, _evaluated(self_data), _evaluated(other_data))
         return self.copied_with(data=data, flags=flags)
 
+    def _data_operation(self, data_operator, data1, data2):
+        """ Computes the data of an element-wise operation, see __dataop__(). Subclasses may choose where the result is stored. """
+        return data_operator(data1, data2)
+
+    def _evaluate(self, expression):
+        """ Evaluates the LazyExpression holding the data of this field. Subclasses may choose where the result is stored. """
+        return expression.evaluate()
+
+    def _with_pending_data(self, expression, flags):
+        """
+Creates a copy of this field whose data is computed from expression when first accessed.
+The data validation is deferred until then.
+        """
+        with struct.unsafe():
+            duplicate = self.copied_with(flags=flags)
+        duplicate.__dict__.pop('_data', None)
+        duplicate._pending_data = expression
+        return duplicate
+
+    def _static_data_shape(self):
+        """ Shape of the data tensor. Does not evaluate pending lazy expressions. """
+        data = _lazy_data(self)
+        return data.shape if isinstance(data, LazyExpression) else math.staticshape(data)
+
+    def __getattr__(self, item):
+        # Only called if regular attribute lookup fails, i.e. for _data if the data is a pending lazy expression
+        if item == '_data':
+            pending = self.__dict__.get('_pending_data', None)
+            if pending is not None:
+                self._data = self._evaluate(pending)
+                self._pending_data = None
+                self._data = self.__struct__.find('data').validation_function(self, self._data)
+                return self._data
+        raise AttributeError(item)
+
+    def _set_items(self, **kwargs):
+        if 'data' in kwargs:
+            self._pending_data = None
+        return State._set_items(self, **kwargs)
+
     def default_physics(self):
         from .effect import FieldPhysics
         return FieldPhysics(self.name)
 
 
+def _lazy_data(field):
+    pending = field.__dict__.get('_pending_data', None)
+    if pending is not None and '_data' not in field.__dict__:
+        return pending
+    return field.data
+
+
+def _evaluated(data):
+    return data.evaluate() if isinstance(data, LazyExpression) else data
+
+
 class StaggeredSamplePoints(Exception):
 
     def __init__(self, *args):
@@ -7,8 +7,16 @@ from phi.geom.geometry import assert_same_rank
 from phi.struct.functions import mappable
 from phi.struct.tensorop import collapse, collapsed_gather_nd
 
-from .field import Field, propagate_flags_children
+from .field import Field, propagate_flags_children, propagate_flags_resample, _to_valid_data
 from .flag import SAMPLE_POINTS
+from .lazy import LazyExpression, lazy_operation
+from .resampling import resampling_plan, InterpolationPlan, GatherPlan, _required_paddings_transposed
+
+
+# Maximum number of sample point grids kept by CenteredGrid.getpoints()
+POINTS_CACHE_SIZE = 16
+
+_POINTS_CACHE = struct.LRUCache(POINTS_CACHE_SIZE)  # (fingerprint of box, resolution, dtype) -> CenteredGrid with read-only data
 
 
 def _crop_for_interpolation(data, offset_float, window_resolution):
@@ -18,16 +26,54 @@ def _crop_for_interpolation(data, offset_float, window_resolution):
     return data
 
 
-@struct.definition()
+@struct.definition(compile=True)
 class CenteredGrid(Field):
 
+    _ghost_cells = 0
+
     def __init__(self, data, box=None, extrapolation='boundary', name=None, **kwargs):
         Field.__init__(self, **struct.kwargs(locals()))
         self._sample_points = None
 
+    @struct.variable(dependencies='extrapolation')
+    def data(self, data):
+        """
+        Data holds the values of this field as tensor of shape (batch_size, spatial dimensions..., components).
+            :return: n-dimensional tensor
+        """
+        return _to_valid_data(data)
+
+    def with_ghost_cells(self, width=1):
+        """
+        Returns a copy of this grid that keeps its data inside a buffer with ghost cells (see math.with_halo).
+        Padding the data according to the extrapolation, e.g. in laplace() or sample_at(), then only refreshes the ghost cells
+        and reads through a read-only view instead of copying the whole array. Only applies to NumPy data.
+        Grids derived from it via element-wise operations (e.g. grid * 2 or grid + other) write their results directly into new halo buffers.
+        Data passed to copied_with() is stored as given, so that a grid which is padded at most once is not copied into a halo buffer first.
+            :param width: number of ghost cells on each side, 0 to disable
+            :return: CenteredGrid
+        """
+        with struct.unsafe():
+            duplicate = self.copied_with()
+        duplicate._ghost_cells = width
+        data = math.with_halo(self.data, width, _full_pad_mode(self.extrapolation)) if width > 0 else self.data
+        return duplicate.copied_with(data=data)
+
+    def _data_operation(self, data_operator, data1, data2):
+        if self._ghost_cells == 0:
+            return data_operator(data1, data2)
+        data = lazy_operation(data_operator, data1, data2)
+        return self._evaluate(data) if isinstance(data, LazyExpression) else data
+
+    def _evaluate(self, expression):
+        """ Writes the result into a new halo buffer if the grid stores ghost cells. """
+        if self._ghost_cells == 0 or expression.evaluated or len(expression.shape) != self.rank + 2:
+            return expression.evaluate()
+        return expression.evaluate(out=math.empty_with_halo(expression.shape, expression.dtype, self._ghost_cells, _full_pad_mode(self.extrapolation)))
+
     @property
     def resolution(self):
-        return math.as_tensor(math.staticshape(self.data)[1:-1])
+        return math.as_tensor(self._static_data_shape()[1:-1])
 
     @struct.constant(dependencies=Field.data)
     def box(self, box):
@@ -39,7 +85,7 @@ class CenteredGrid(Field):
 
     @property
     def rank(self):
-        return math.spatial_rank(self.data)
+        return len(self._static_data_shape()) - 2
 
     @struct.constant(default='boundary')
     def extrapolation(self, extrapolation):
@@ -70,6 +116,15 @@ class CenteredGrid(Field):
     def at(self, other_field, collapse_dimensions=True, force_optimization=False, return_self_if_compatible=False):
         if self.compatible(other_field):  # and return_self_if_compatible: not applicable for fields with Points
             return self
+        from .staggered_grid import StaggeredGrid, centers_to_staggered  # pylint: disable-msg = cyclic-import
+        if isinstance(other_field, StaggeredGrid) and self._is_cell_centered_in(other_field):
+            components = centers_to_staggered(self.data, self.extrapolation)
+            return other_field.copied_with(data=tuple(components), flags=propagate_flags_resample(self, other_field.flags, other_field.rank))
+        plan = resampling_plan(self, other_field)
+        if isinstance(plan, InterpolationPlan):
+            return CenteredGrid(plan.apply(self.data), other_field.box, name=self.name, batch_size=self._batch_size)
+        if isinstance(plan, GatherPlan) and isinstance(self.data, np.ndarray):
+            return other_field.copied_with(data=plan.apply(self.data), flags=propagate_flags_resample(self, other_field.flags, other_field.rank))
         if isinstance(other_field, CenteredGrid) and np.allclose(self.dx, other_field.dx):
             paddings = _required_paddings_transposed(self.box, self.dx, other_field.box)
             if math.sum(paddings) == 0:
@@ -84,9 +139,17 @@ class CenteredGrid(Field):
                 return padded.at(other_field, collapse_dimensions, force_optimization)
         return Field.at(self, other_field, force_optimization=force_optimization)
 
+    def _is_cell_centered_in(self, staggered_grid):
+        """ Tests whether this grid holds values at the cell centers of a MAC grid so that direct averaging applies. """
+        if not isinstance(self.data, np.ndarray) or not isinstance(self.extrapolation, six.string_types) or SAMPLE_POINTS in self.flags:
+            return False
+        if self.component_count not in (1, staggered_grid.rank):
+            return False
+        return self.box == staggered_grid.box and tuple(self.resolution) == tuple(staggered_grid.resolution)
+
     @property
     def component_count(self):
-        return self.data.shape[-1]
+        return self._static_data_shape()[-1]
 
     def unstack(self):
         flags = propagate_flags_children(self.flags, self.rank, 1)
@@ -102,6 +165,10 @@ class CenteredGrid(Field):
             self._sample_points = CenteredGrid.getpoints(self.box, self.resolution)
         return self._sample_points
 
+    @property
+    def has_points(self):
+        return True  # avoids building the sample points
+
     def compatible(self, other_field):
         if not other_field.has_points:
             return True
@@ -124,8 +191,7 @@ class CenteredGrid(Field):
             return 'Grid[invalid]'
 
     def padded(self, widths):
-        extrapolation = self.extrapolation if isinstance(self.extrapolation, six.string_types) else ['constant'] + list(self.extrapolation) + ['constant']
-        data = math.pad(self.data, [[0, 0]]+widths+[[0, 0]], _pad_mode(extrapolation))
+        data = math.pad(self.data, [[0, 0]]+widths+[[0, 0]], _full_pad_mode(self.extrapolation))
         w_lower, w_upper = np.transpose(widths)
         box = AABox(self.box.lower - w_lower * self.dx, self.box.upper + w_upper * self.dx)
         return CenteredGrid(data, box, extrapolation=self.extrapolation, name=self.name, batch_size=self._batch_size)
@@ -136,8 +202,27 @@ class CenteredGrid(Field):
 
     @staticmethod
     def getpoints(box, resolution):
+        """
+        Returns a grid holding the coordinates of all cell centers.
+        Results for NumPy boxes are cached globally (see POINTS_CACHE_SIZE) and hold read-only data that is shared between calls.
+            :param box: AABox
+            :param resolution: cells per dimension
+            :return: CenteredGrid with SAMPLE_POINTS flag
+        """
+        key = (struct.fingerprint(box), tuple(int(r) for r in resolution), np.dtype(math.storage_dtype()).str)
+        points = _POINTS_CACHE.get(key)
+        if points is not None:
+            return points
+        points = CenteredGrid._create_points(box, resolution)
+        if isinstance(points.data, np.ndarray):
+            points.data.setflags(write=False)
+            _POINTS_CACHE[key] = points
+        return points
+
+    @staticmethod
+    def _create_points(box, resolution):
         idx_zyx = np.meshgrid(*[np.linspace(0.5 / dim, 1 - 0.5 / dim, dim) for dim in resolution], indexing="ij")
-        local_coords = math.expand_dims(math.stack(idx_zyx, axis=-1), 0).astype(np.float32)
+        local_coords = math.expand_dims(math.stack(idx_zyx, axis=-1), 0).astype(math.storage_dtype())
         points = box.local_to_global(local_coords)
         return CenteredGrid(points, box, name='grid_centers(%s, %s)' % (box, resolution), flags=[SAMPLE_POINTS])
 
@@ -164,10 +249,11 @@ class CenteredGrid(Field):
         return resampled
 
 
-def _required_paddings_transposed(box, dx, target):
-    lower = math.to_int(math.ceil(math.maximum(0, box.lower - target.lower) / dx))
-    upper = math.to_int(math.ceil(math.maximum(0, target.upper - box.upper) / dx))
-    return [lower, upper]
+def _full_pad_mode(extrapolation):
+    """ Pad mode for all dimensions of the data tensor, including batch and component dimensions. """
+    if isinstance(extrapolation, six.string_types):
+        return _pad_mode(extrapolation)
+    return _pad_mode(['constant'] + list(extrapolation) + ['constant'])
 
 
 @mappable()
@@ -0,0 +1,190 @@
+"""
+Lazy evaluation of elementwise Field arithmetic.
+
+While lazy evaluation is enabled, arithmetic operators on fields with NumPy data (+, -, *, /, **) do not compute their result immediately.
+Instead, the resulting field holds a LazyExpression which records the operation.
+Chains of operations are evaluated in a single fused pass when the data is first accessed or at the end of World.step().
+The fused pass processes the arrays in cache-sized chunks so that intermediate results never occupy full-size temporaries.
+
+Example:
+    with lazy_evaluation():
+        velocity = (velocity + dt * force) * (1 - damping)  # nothing computed yet
+    velocity.data  # evaluated here
+"""
+from contextlib import contextmanager
+from numbers import Number
+
+import numpy as np
+
+from phi import struct
+
+
+# Number of elements processed per chunk during fused evaluation
+CHUNK_SIZE = 2 ** 15
+
+_LAZY_EVALUATION = [False]
+_LAZY_STACK = []
+
+
+def lazy_evaluation_enabled():
+    """
+    :return: True if Field arithmetic currently records LazyExpressions, i.e. inside a lazy_evaluation() context or if enabled globally
+    """
+    if _LAZY_STACK:
+        return _LAZY_STACK[-1]
+    return _LAZY_EVALUATION[0]
+
+
+def set_lazy_evaluation(enabled):
+    """
+Globally enables or disables lazy evaluation of Field arithmetic. This does not affect active lazy_evaluation() contexts.
+    :param enabled: bool
+    """
+    _LAZY_EVALUATION[0] = bool(enabled)
+
+
+@contextmanager
+def lazy_evaluation(enabled=True):
+    """
+Context manager that temporarily enables (or disables) lazy evaluation of Field arithmetic.
+Expressions created inside the context remain valid after it exits and are evaluated on first access.
+    :param enabled: bool
+    """
+    _LAZY_STACK.append(bool(enabled))
+    try:
+        yield
+    finally:
+        _LAZY_STACK.pop(-1)
+
+
+class LazyExpression(object):
+    """
+Elementwise operation on NumPy arrays, numbers or other LazyExpressions that is evaluated on demand.
+The result is computed at most once.
+    """
+
+    def __init__(self, operator, operands):
+        self.operator = operator
+        self.operands = tuple(operands)
+        self.shape = _broadcast_shape([_shape(operand) for operand in self.operands])
+        self._result = None
+
+    @property
+    def evaluated(self):
+        return self._result is not None
+
+    @property
+    def dtype(self):
+        """ Data type of the result, following NumPy's promotion rules, e.g. int / int yields float. """
+        if self._result is not None:
+            return np.asarray(self._result).dtype
+        return np.asarray(self.operator(*[_sample(operand) for operand in self.operands])).dtype
+
+    def evaluate(self, out=None):
+        """
+        :param out: (optional) NumPy array of the same shape and dtype as the result to write the result into. Ignored if the expression was already evaluated.
+        :return: NumPy array holding the result of the expression
+        """
+        if self._result is None:
+            self._result = _fused_evaluate(self, out)
+            self.operands = None  # release references to intermediate data
+        return self._result
+
+    def __repr__(self):
+        return 'LazyExpression(shape=%s, evaluated=%s)' % (self.shape, self.evaluated)
+
+
+def lazy_operation(operator, operand1, operand2):
+    """
+Records operator(operand1, operand2) as LazyExpression if both operands are supported, i.e. NumPy float/int arrays, numbers or LazyExpressions.
+Otherwise, the operation is computed immediately.
+    :return: LazyExpression or result of operator
+    """
+    if _is_lazy_operand(operand1) and _is_lazy_operand(operand2) and (isinstance(operand1, (np.ndarray, LazyExpression)) or isinstance(operand2, (np.ndarray, LazyExpression))):
+        return LazyExpression(operator, (operand1, operand2))
+    return operator(_value(operand1), _value(operand2))
+
+
+def materialize(obj):
+    """
+Evaluates all pending LazyExpressions held by the fields in obj in-place.
+    :param obj: Field or struct containing fields, e.g. a State
+    :return: obj
+    """
+    struct.flatten(obj)  # accessing the data of a field evaluates it
+    return obj
+
+
+def _is_lazy_operand(value):
+    if isinstance(value, LazyExpression):
+        return not value.evaluated or _is_lazy_operand(value._result)
+    if isinstance(value, np.ndarray):
+        return value.dtype.kind in 'fiub'
+    return isinstance(value, Number)
+
+
+def _value(operand):
+    return operand.evaluate() if isinstance(operand, LazyExpression) else operand
+
+
+def _sample(operand):
+    """ One-element stand-in for operand with the same dtype, used to determine result types. """
+    if isinstance(operand, (LazyExpression, np.ndarray)):
+        return np.ones(1, operand.dtype)
+    return operand
+
+
+def _shape(operand):
+    if isinstance(operand, LazyExpression):
+        return operand.shape
+    return np.shape(operand)
+
+
+def _broadcast_shape(shapes):
+    rank = max(len(shape) for shape in shapes)
+    result = []
+    for d in range(rank):
+        sizes = set(shape[d - rank + len(shape)] for shape in shapes if d - rank + len(shape) >= 0)
+        sizes.discard(1)
+        assert len(sizes) <= 1, 'Shapes cannot be broadcast: %s' % (shapes,)
+        result.append(sizes.pop() if sizes else 1)
+    return tuple(result)
+
+
+def _fused_evaluate(expression, out=None):
+    shape = expression.shape
+    if len(shape) < 2 or int(np.prod(shape)) <= CHUNK_SIZE:
+        result = _evaluate_chunk(expression, None, len(shape))
+        if out is None:
+            return np.asarray(result)
+        out[...] = result
+        return out
+    rows = max(1, CHUNK_SIZE // max(1, int(np.prod(shape[2:]))))
+    result = out
+    for batch in range(shape[0]):
+        for start in range(0, shape[1], rows):
+            index = (batch, slice(start, start + rows))
+            chunk = _evaluate_chunk(expression, index, len(shape))
+            if result is None:
+                result = np.empty(shape, np.result_type(chunk))
+            result[index] = chunk
+    return result
+
+
+def _evaluate_chunk(operand, index, rank):
+    if isinstance(operand, LazyExpression):
+        if operand.evaluated:
+            return _slice(operand._result, index, rank)
+        return operand.operator(*[_evaluate_chunk(o, index, rank) for o in operand.operands])
+    if isinstance(operand, np.ndarray):
+        return _slice(operand, index, rank)
+    return operand
+
+
+def _slice(array, index, rank):
+    if index is None or array.ndim == 0:
+        return array
+    if array.ndim < rank:
+        array = array.reshape((1,) * (rank - array.ndim) + array.shape)
+    batch, rows = index
+    return array[0 if array.shape[0] == 1 else batch, slice(None) if array.shape[1] == 1 else rows]
@@ -1,9 +1,20 @@
+import numpy as np
+
 from phi import struct, math
-from phi.geom import Geometry
-from .field import Field, propagate_flags_children
+from phi.geom import Geometry, AABox, batch_geometries
+from phi.geom.geometry import _cell_centers, _index_window
+from .field import Field, propagate_flags_children, propagate_flags_resample
+from .flag import SAMPLE_POINTS
+from .grid import CenteredGrid
 from .constant import _convert_constant_to_data, _expand_axes
 
 
+# Maximum number of grids for which rasterized_union() keeps a mask
+MASK_CACHE_SIZE = 16
+
+_MASK_CACHE = struct.LRUCache(MASK_CACHE_SIZE)  # fingerprint of grid -> (geometries, geometry fingerprints, mask grid)
+
+
 @struct.definition()
 class GeometryMask(Field):
 
@@ -18,12 +29,26 @@ class GeometryMask(Field):
     def sample_at(self, points, collapse_dimensions=True):
         if len(self.geometries) == 0:
             return _expand_axes(math.zeros([1,1]), points, collapse_dimensions=collapse_dimensions)
-        if len(self.geometries) == 1:
-            result = self.geometries[0].value_at(points)
+        geometries = batch_geometries(self.geometries)
+        if len(geometries) == 1:
+            result = geometries[0].value_at(points)
         else:
-            result = math.max([geometry.value_at(points) for geometry in self.geometries], axis=0)
+            result = math.max([geometry.value_at(points) for geometry in geometries], axis=0)
         return result * self.data
 
+    def at(self, other_field, collapse_dimensions=True, force_optimization=False, return_self_if_compatible=False):
+        if len(self.geometries) > 0 and _is_regular_grid(other_field):
+            # rasterize only the cells near each geometry
+            try:
+                result = None
+                for geometry in batch_geometries(self.geometries):
+                    result = geometry.rasterize(other_field.box, other_field.resolution, out=result)
+            except NotImplementedError:
+                pass
+            else:
+                return other_field.copied_with(data=result * self.data, flags=propagate_flags_resample(self, other_field.flags, other_field.rank))
+        return Field.at(self, other_field, collapse_dimensions=collapse_dimensions, force_optimization=force_optimization, return_self_if_compatible=return_self_if_compatible)
+
     @property
     def rank(self):
         return self.geometries[0].rank
@@ -56,3 +81,63 @@ def union_mask(geometries):
     for geom in geometries:
         assert isinstance(geom, Geometry)
     return GeometryMask(geometries, name='union')
+
+
+def rasterized_union(geometries, grid):
+    """
+Samples the union of geometries at the cell centers of grid, equivalent to union_mask(geometries).at(grid, collapse_dimensions=False).
+
+The last mask is cached per grid (see MASK_CACHE_SIZE).
+Calling this function again with equal geometries returns the same CenteredGrid instance so that its fingerprint,
+and everything keyed by it such as pressure matrices, is re-used.
+If only some of the geometries changed, e.g. a moving obstacle, the mask is updated only inside the bounding box of the old and new versions of these geometries.
+Masks of NumPy grids are cached, other grids are sampled on every call.
+    :param geometries: list or tuple of Geometry
+    :param grid: CenteredGrid whose cell centers to sample
+    :return: CenteredGrid with one component and read-only data
+    """
+    geometries = tuple(geometries)
+    if not isinstance(grid.points.data, np.ndarray):
+        return union_mask(geometries).at(grid, collapse_dimensions=False)
+    key = struct.fingerprint(grid)
+    fingerprints = tuple(struct.fingerprint(geometry) for geometry in geometries)
+    cached = _MASK_CACHE.pop(key, None)
+    if cached is not None and cached[1] == fingerprints:
+        result = cached[2]
+    else:
+        result = None
+        if cached is not None and len(cached[0]) == len(geometries) > 0:
+            changed = [(old, new) for old, new, old_fp, new_fp in zip(cached[0], geometries, cached[1], fingerprints) if old_fp != new_fp]
+            result = _update_mask(cached[2], [geometry for pair in changed for geometry in pair], geometries, grid)
+        if result is None:
+            result = union_mask(geometries).at(grid, collapse_dimensions=False)
+            if isinstance(result.data, np.ndarray):
+                result.data.setflags(write=False)
+    _MASK_CACHE[key] = (geometries, fingerprints, result)
+    return result
+
+
+def _update_mask(mask, changed_geometries, geometries, grid):
+    """ Rasterizes geometries inside the bounding box of changed_geometries. Returns None if the bounding box cannot be determined. """
+    if not isinstance(mask.data, np.ndarray):
+        return None
+    try:
+        boxes = [geometry.bounding_box() for geometry in changed_geometries]
+    except NotImplementedError:
+        return None
+    lower = np.min([np.broadcast_to(b.lower, [grid.rank]) for b in boxes], axis=0)
+    upper = np.max([np.broadcast_to(b.upper, [grid.rank]) for b in boxes], axis=0)
+    window = _index_window(_cell_centers(grid.box, grid.resolution), AABox(lower, upper))
+    data = np.array(mask.data)
+    if all(s.stop > s.start for s in window):
+        points = grid.points.data[(slice(None),) + window]
+        data[(slice(None),) + window] = union_mask(geometries).sample_at(points, collapse_dimensions=False)
+    data.setflags(write=False)
+    return mask.copied_with(data=data)
+
+
+def _is_regular_grid(field):
+    """ Tests whether the sample points of field are the cell centers of a CenteredGrid. """
+    if not isinstance(field, CenteredGrid):
+        return False
+    return SAMPLE_POINTS not in field.flags or field is CenteredGrid.getpoints(field.box, field.resolution)
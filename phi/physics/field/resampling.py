@@ -0,0 +1,236 @@
+"""
+Cached resampling plans for CenteredGrids.
+
+Which cells contribute to a resampled value and with which weights only depends on the geometries of the source and target grids.
+resampling_plan() computes this information once per pair of (box, resolution) and caches it, so that repeated resampling,
+e.g. StaggeredGrid.at_centers() in every step, reduces to slicing or gathering and a weighted sum.
+"""
+
+import numpy as np
+import six
+
+from phi import math, struct
+from phi.geom import AABox
+from phi.math.parallel import get_num_threads, parallel_map, slabs
+from .flag import SAMPLE_POINTS
+
+
+# Maximum number of plans kept by resampling_plan()
+PLAN_CACHE_SIZE = 64
+
+_PLAN_CACHE = struct.LRUCache(PLAN_CACHE_SIZE)  # (source geometry, target geometry, extrapolation) -> ResamplingPlan or None
+
+
+class ResamplingPlan(object):
+    """
+Precomputed linear interpolation of grid data onto the cell centers of a target grid.
+    """
+
+    def apply(self, data):
+        """
+        :param data: tensor of shape (batch_size, source resolution..., components)
+        :return: tensor of shape (batch_size, target resolution..., components)
+        """
+        raise NotImplementedError(self)
+
+
+class InterpolationPlan(ResamplingPlan):
+    """
+Used if source and target grids have the same cell size.
+The data is optionally padded, cropped to the target region and interpolated along the axes where the grids are shifted.
+Works with all backends.
+    """
+
+    def __init__(self, pad_widths, pad_mode, crop, upper_weights):
+        self.pad_widths = pad_widths
+        self.pad_mode = pad_mode
+        self.crop = crop
+        self.upper_weights = upper_weights
+
+    def apply(self, data):
+        if self.pad_widths is not None:
+            data = math.pad(data, self.pad_widths, self.pad_mode)
+        data = data[self.crop]
+        for dim, upper_weight in enumerate(self.upper_weights):
+            if upper_weight is not None:
+                upper_slices = tuple(slice(1, None) if d == dim + 1 else slice(None) for d in range(len(data.shape)))
+                lower_slices = tuple(slice(-1) if d == dim + 1 else slice(None) for d in range(len(data.shape)))
+                data = data[upper_slices] * upper_weight + data[lower_slices] * (1 - upper_weight)
+        return data
+
+
+class GatherPlan(ResamplingPlan):
+    """
+Used for grids with different cell sizes, NumPy only.
+Stores the lower and upper neighbour index and weight of every target cell center along each axis.
+Since the cell centers of a grid are separable, the interpolation is applied one axis at a time.
+    """
+
+    def __init__(self, axes):
+        self.axes = axes  # one (lower indices, upper indices, lower weights, upper weights) tuple per spatial dimension
+
+    def apply(self, data):
+        result = data.astype(np.float64)
+        for dim, (lower, upper, lower_weight, upper_weight) in enumerate(self.axes):
+            shape = [1] * result.ndim
+            shape[dim + 1] = -1
+            result = np.take(result, lower, axis=dim + 1) * lower_weight.reshape(shape) + np.take(result, upper, axis=dim + 1) * upper_weight.reshape(shape)
+        return result.astype(data.dtype)
+
+
+def resampling_plan(grid, target):
+    """
+Returns the cached plan for resampling grid at the cell centers of target.
+    :param grid: CenteredGrid to be resampled
+    :param target: Field to sample at
+    :return: InterpolationPlan if the grids have the same cell size, GatherPlan if not, None if no plan applies to these fields
+    """
+    from .grid import CenteredGrid
+    if not isinstance(target, CenteredGrid) or not isinstance(grid.extrapolation, six.string_types):
+        return None
+    if SAMPLE_POINTS in target.flags and target is not CenteredGrid.getpoints(target.box, target.resolution):
+        return None  # arbitrary sample points
+    key = (struct.fingerprint(grid.box), tuple(int(r) for r in grid.resolution),
+           struct.fingerprint(target.box), tuple(int(r) for r in target.resolution), grid.extrapolation)
+    return _PLAN_CACHE.lookup(key, lambda: _create_plan(grid, target))
+
+
+def _create_plan(grid, target):
+    if np.allclose(grid.dx, target.dx):
+        paddings = _required_paddings_transposed(grid.box, grid.dx, target.box)
+        if math.sum(paddings) == 0:
+            return _interpolation_plan(grid.box, grid.resolution, target, None, None)
+        elif math.sum(paddings) < 16:
+            widths = np.transpose(paddings).tolist()
+            w_lower, w_upper = np.transpose(widths)
+            box = AABox(grid.box.lower - w_lower * grid.dx, grid.box.upper + w_upper * grid.dx)
+            resolution = grid.resolution + w_lower + w_upper
+            if math.sum(_required_paddings_transposed(box, grid.dx, target.box)) != 0 or box == target.box:
+                return None  # CenteredGrid.at() handles these cases
+            from .grid import _full_pad_mode
+            return _interpolation_plan(box, resolution, target, [[0, 0]] + widths + [[0, 0]], _full_pad_mode(grid.extrapolation))
+    return _gather_plan(grid, target)
+
+
+def _interpolation_plan(box, resolution, target, pad_widths, pad_mode):
+    origin_in_local = box.global_to_local(target.box.lower) * resolution
+    offset = math.to_int(origin_in_local)
+    crop = tuple([slice(None)] + [slice(o, o + res + 1) for o, res in zip(offset, target.resolution)] + [slice(None)])
+    upper_weights = origin_in_local % 1.0
+    upper_weights = [upper_weights[d] if resolution[d] != target.resolution[d] else None for d in range(len(resolution))]
+    return InterpolationPlan(pad_widths, pad_mode, crop, upper_weights)
+
+
+def _gather_plan(grid, target):
+    from .grid import CenteredGrid
+    points = CenteredGrid.getpoints(target.box, target.resolution).data
+    if not isinstance(points, np.ndarray) or not isinstance(grid.box.lower, np.ndarray):
+        return None
+    local_points = grid.box.global_to_local(points) * math.to_float(grid.resolution) - 0.5
+    axes = []
+    for dim, size in enumerate(grid.resolution):
+        line = local_points[(0,) + tuple(slice(None) if d == dim else 0 for d in range(grid.rank)) + (dim,)]
+        axis = _gather_axis(line, int(size), grid.extrapolation)
+        if axis is None:
+            return None
+        axes.append(axis)
+    return GatherPlan(axes)
+
+
+def _gather_axis(coordinates, size, extrapolation):
+    """ Linear interpolation along one axis, equivalent to math.resample() as used by CenteredGrid.sample_at(). """
+    if extrapolation == 'periodic':
+        coordinates = np.asarray(coordinates % np.asarray(size, coordinates.dtype), np.float64)
+        points = size + 1  # resampled data is padded by one cell
+    elif extrapolation == 'boundary':
+        coordinates = np.clip(np.asarray(coordinates, np.float64), 0, size - 1)
+        points = size
+    else:
+        coordinates = np.asarray(coordinates, np.float64)
+        points = size
+    if points < 2:
+        return None
+    lower = np.clip(np.floor(coordinates), 0, points - 2).astype(np.int64)
+    upper_weight = coordinates - lower
+    lower_weight = 1 - upper_weight
+    upper = lower + 1
+    if extrapolation == 'periodic':
+        upper %= size
+    elif extrapolation == 'constant':
+        outside = (coordinates < 0) | (coordinates > size - 1)
+        lower_weight[outside] = 0
+        upper_weight[outside] = 0
+    return lower, upper, lower_weight, upper_weight
+
+
+def _required_paddings_transposed(box, dx, target):
+    lower = math.to_int(math.ceil(math.maximum(0, box.lower - target.lower) / dx))
+    upper = math.to_int(math.ceil(math.maximum(0, target.upper - box.upper) / dx))
+    return [lower, upper]
+
+
+def sample_linear(data, coordinates, extrapolation):
+    """
+Samples NumPy grid data at arbitrary points using multilinear interpolation.
+Equivalent to CenteredGrid.sample_at() with coordinates given in index space instead of world space,
+i.e. coordinate i along an axis refers to the center of cell i.
+    :param data: NumPy array of shape (batch_size or 1, spatial dimensions..., components)
+    :param coordinates: NumPy array of shape (batch_size or 1, sample dimensions..., rank)
+    :param extrapolation: 'boundary' replicates the edge values, 'constant' yields zero for points outside the outermost cell centers, 'periodic' wraps around
+    :return: NumPy array of shape (batch_size, sample dimensions..., components) and the dtype of data
+    """
+    assert len(data.shape) - 2 == coordinates.shape[-1], 'coordinates do not match the rank of data: %s, %s' % (coordinates.shape, data.shape)
+    if coordinates.ndim < 3 or get_num_threads() == 1:
+        return _sample_linear(data, coordinates, extrapolation)
+    # sample slabs along the first sample dimension in parallel
+    parts = parallel_map(lambda slab: _sample_linear(data, coordinates[:, slab[0]:slab[1]], extrapolation), slabs(coordinates.shape[1]))
+    return np.concatenate(parts, axis=1)
+
+
+def _sample_linear(data, coordinates, extrapolation):
+    rank = coordinates.shape[-1]
+    resolution = data.shape[1:-1]
+    dtype = np.result_type(data.dtype, np.float32)
+    batch_size = max(data.shape[0], coordinates.shape[0])
+    spatial_size = int(np.prod(resolution))
+    strides = [int(np.prod(resolution[axis + 1:])) for axis in range(rank)]
+    batch_offset = (np.arange(batch_size) % data.shape[0]) * spatial_size
+    base = batch_offset.reshape((-1,) + (1,) * (coordinates.ndim - 2))
+    outside = None
+    corners = []  # per axis: (lower offset, upper offset, lower weight, upper weight)
+    for axis in range(rank):
+        x = coordinates[..., axis].astype(dtype, copy=False)
+        size = resolution[axis]
+        if extrapolation == 'periodic':
+            x = x % dtype.type(size)
+            points = size + 1  # wrapped copy of the first cell
+        elif extrapolation == 'boundary':
+            x = np.clip(x, 0, size - 1)
+            points = size
+        else:
+            out = (x < 0) | (x > size - 1)
+            outside = out if outside is None else outside | out
+            points = size
+        if points < 2:
+            lower = np.zeros(x.shape, np.intp)
+            upper_weight = np.zeros(x.shape, dtype)
+        else:
+            lower = np.clip(np.floor(x), 0, points - 2).astype(np.intp)
+            upper_weight = x - lower
+        upper = np.minimum(lower + 1, size - 1) if extrapolation != 'periodic' else (lower + 1) % size
+        corners.append((lower * strides[axis], upper * strides[axis], 1 - upper_weight, upper_weight))
+    flat = data.reshape((-1, data.shape[-1]))
+    result = None
+    for corner in range(2 ** rank):
+        index = base
+        weight = None
+        for axis in range(rank):
+            use_upper = (corner >> (rank - 1 - axis)) & 1
+            index = index + corners[axis][1 if use_upper else 0]
+            axis_weight = corners[axis][3 if use_upper else 2]
+            weight = axis_weight if weight is None else weight * axis_weight
+        contribution = flat[index] * weight[..., None]
+        result = contribution if result is None else result + contribution
+    if outside is not None:
+        result[np.broadcast_to(outside, result.shape[:-1])] = 0
+    return result.astype(data.dtype, copy=False)
@@ -1,16 +1,17 @@
-from phi.physics.field.util import extrapolate
+from phi.physics.field.util import extrapolate_by_distance
 from phi import struct, math
 import numpy as np
 from .field import Field
 from .grid import CenteredGrid
 from .staggered_grid import StaggeredGrid, unstack_staggered_tensor
 from .flag import SAMPLE_POINTS
+from .transfer import particles_to_grid
 
 
 @struct.definition()
 class SampledField(Field):
 
-    def __init__(self, name, sample_points, data=1, mode='add', point_count=None, **kwargs):
+    def __init__(self, name, sample_points, data=1, mode='add', kernel='nearest', point_count=None, **kwargs):
         Field.__init__(self, **struct.kwargs(locals(), ignore=['point_count']))
         self._point_count = point_count
 
@@ -36,6 +37,9 @@ class SampledField(Field):
         :param resolution: grid resolution
         :return: CenteredGrid
         """
+        if self._supports_transfer():
+            scattered = particles_to_grid(self.sample_points, self.data, box, resolution, kernel=self.kernel, mode=self.mode)
+            return CenteredGrid(data=scattered, box=box, extrapolation='constant', name=self.name + '_centered')
         valid_indices = math.to_int(math.floor(self.sample_points))
         valid_indices = math.minimum(math.maximum(0, valid_indices), resolution - 1)
         # Correct format for math.scatter
@@ -51,6 +55,12 @@ class SampledField(Field):
         :param resolution: grid resolution
         :return: StaggeredGrid
         """
+        if self._supports_transfer():
+            active_mask = particles_to_grid(self.sample_points, 1, box, resolution, kernel='nearest', mode='any')
+            components = particles_to_grid(self.sample_points, self.data, box, resolution, kernel=self.kernel, mode=self.mode, staggered=True)
+            grid_values = StaggeredGrid(components, box=box)
+            grid_values, _ = extrapolate_by_distance(grid_values, _interior_mask(active_mask), voxel_distance=2)
+            return grid_values
         resolution = np.array(resolution)
         valid_indices = math.to_int(math.floor(self.sample_points))
         valid_indices = math.minimum(math.maximum(0, valid_indices), resolution - 1)
@@ -59,8 +69,6 @@ class SampledField(Field):
 
         active_mask = math.scatter(self.sample_points, valid_indices, 1, math.concat([[valid_indices.shape[0]], resolution, [1]], axis=-1), duplicates_handling='any')
 
-        mask = math.pad(active_mask, [[0, 0]] + [[1, 1]] * self.rank + [[0, 0]], "constant")
-
         if isinstance(self.data, (int, float, np.ndarray)):
             values = math.zeros_like(self.sample_points) + self.data
         else:
@@ -72,7 +80,7 @@ class SampledField(Field):
         dx = box.size / resolution
 
         dims = range(len(resolution))
-        for d in dims: 
+        for d in dims:
             staggered_offset = math.stack([(0.5 * dx[i] * ones_1d if i == d else 0.0 * ones_1d) for i in dims], axis=-1)
 
             indices = math.to_int(math.floor(self.sample_points + staggered_offset))
@@ -83,18 +91,14 @@ class SampledField(Field):
             values_d = math.expand_dims(math.unstack(values, axis=-1)[d], axis=-1)
             result.append(math.scatter(self.sample_points, valid_indices, values_d, [indices.shape[0]] + staggered_shape + [1], duplicates_handling=self.mode))
 
-            d_slice = tuple([(slice(0, -2) if i == d else slice(1,-1)) for i in dims])
-            u_slice = tuple([(slice(2, None) if i == d else slice(1,-1)) for i in dims])
-            active_mask = math.minimum(mask[(slice(None),) + d_slice + (slice(None),)], active_mask)
-            active_mask = math.minimum(mask[(slice(None),) + u_slice + (slice(None),)], active_mask)
-        
+        active_mask = _interior_mask(active_mask)
         staggered_tensor_prep = unstack_staggered_tensor(math.concat(result, axis=-1))
         grid_values = StaggeredGrid(staggered_tensor_prep)
         # Fix values at boundary of liquids (using StaggeredGrid these might not receive a value, so we replace it with a value inside the liquid)
-        grid_values, _ = extrapolate(grid_values, active_mask, voxel_distance=2)
+        grid_values, _ = extrapolate_by_distance(grid_values, active_mask, voxel_distance=2)
         return grid_values
 
-    @struct.variable()
+    @struct.variable(dependencies='sample_points')
     def data(self, data):
         if isinstance(data, (tuple, list, np.ndarray)):
             data = math.zeros_like(self.sample_points) + data
@@ -105,6 +109,18 @@ class SampledField(Field):
         assert mode in ('add', 'mean', 'any')
         return mode
 
+    @struct.constant(default='nearest')
+    def kernel(self, kernel):
+        """
+Particle-to-grid transfer weights used by at(). 'nearest' assigns each value to the closest sample point, 'linear' distributes it onto the 2^d closest ones.
+The linear kernel is only supported for NumPy sample points.
+        """
+        assert kernel in ('nearest', 'linear')
+        return kernel
+
+    def _supports_transfer(self):
+        return isinstance(self.sample_points, np.ndarray) and (isinstance(self.data, np.ndarray) or math.ndims(self.data) == 0)
+
     @struct.variable()
     def sample_points(self, sample_points):
         assert math.ndims(sample_points) == 3, sample_points.shape
@@ -149,6 +165,18 @@ class SampledField(Field):
         return '%s[%sx(%d), %dD]' % (self.__class__.__name__, self._point_count if self._point_count is not None else '?', self.component_count, self.rank)
 
 
+def _interior_mask(active_mask):
+    """ Removes cells from active_mask that have an inactive direct neighbour. Cells outside count as inactive. """
+    rank = math.spatial_rank(active_mask)
+    mask = math.pad(active_mask, [[0, 0]] + [[1, 1]] * rank + [[0, 0]], "constant")
+    for d in range(rank):
+        d_slice = tuple([(slice(0, -2) if i == d else slice(1, -1)) for i in range(rank)])
+        u_slice = tuple([(slice(2, None) if i == d else slice(1, -1)) for i in range(rank)])
+        active_mask = math.minimum(mask[(slice(None),) + d_slice + (slice(None),)], active_mask)
+        active_mask = math.minimum(mask[(slice(None),) + u_slice + (slice(None),)], active_mask)
+    return active_mask
+
+
 def batch_indices(indices):
     """
 Reshapes the indices such that, aside from indices, they also contain batch number.
@@ -167,15 +195,55 @@ Transform shape (b, p, d) to (b, p, d+1) where batch size is b, number of partic
     return math.concat((batch_ids, indices), axis=-1)
 
 
-def distribute_points(density, particles_per_cell=1, distribution='uniform'):
+def distribute_points(density, particles_per_cell=1, distribution='uniform', pad_value=None):
     """
 Distribute points according to the distribution specified in density.
     :param density: binary tensor
     :param particles_per_cell: integer
     :param distribution: 'uniform' or 'center'
+    :param pad_value: if not None, batch entries with fewer active cells are padded with this value so that batches may have different active-cell counts
     :return: tensor of shape (batch_size, point_count, rank)
     """
-    assert  distribution in ('center', 'uniform')
+    assert distribution in ('center', 'uniform')
+    if not isinstance(density, np.ndarray):
+        return _distribute_points_loop(density, particles_per_cell, distribution)
+    points, offsets = distribute_points_flat(density, particles_per_cell, distribution)
+    counts = np.diff(offsets)
+    if pad_value is None and np.any(counts != counts[0]):
+        raise ValueError("all arrays in the batch must have the same number of active cells.")
+    batch_size = len(counts)
+    point_count = int(np.max(counts)) if batch_size > 0 else 0
+    if np.all(counts == point_count):
+        return points.reshape((batch_size, point_count, points.shape[-1]))
+    result = np.full((batch_size, point_count, points.shape[-1]), pad_value, points.dtype)
+    batch = np.repeat(np.arange(batch_size), counts)
+    result[batch, np.arange(len(points)) - offsets[batch]] = points
+    return result
+
+
+def distribute_points_flat(density, particles_per_cell=1, distribution='uniform'):
+    """
+Distributes points like distribute_points() for all batch entries in one pass and returns them in an offset-indexed representation
+which supports different numbers of active cells per batch entry. NumPy only.
+    :param density: NumPy array of shape (batch_size, spatial dimensions..., 1)
+    :param particles_per_cell: integer
+    :param distribution: 'uniform' or 'center'
+    :return: points of shape (total point count, rank) and offsets of shape (batch_size + 1,). The points of batch entry b are points[offsets[b]:offsets[b+1]].
+    """
+    assert distribution in ('center', 'uniform')
+    active = np.nonzero(density[..., 0] > 0)
+    batch, cells = active[0], np.stack(active[1:], axis=-1)
+    counts = np.bincount(batch, minlength=density.shape[0])
+    # the points of each cell are consecutive so that points stay sorted by batch entry and cell
+    points = np.repeat(cells.astype(math.storage_dtype()), particles_per_cell, axis=0)
+    if distribution == 'center':
+        points += 0.5
+    else:
+        points += np.random.random(points.shape)
+    return points, np.concatenate([[0], np.cumsum(counts * particles_per_cell)])
+
+
+def _distribute_points_loop(density, particles_per_cell, distribution):
     index_array = []
     batch_size = math.staticshape(density)[0] if math.staticshape(density)[0] is not None else 1
     
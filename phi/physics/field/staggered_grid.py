@@ -9,7 +9,9 @@ from phi.geom.geometry import assert_same_rank
 from phi.struct.tensorop import collapse
 from .field import Field, propagate_flags_children, IncompatibleFieldTypes, broadcast_at, StaggeredSamplePoints, \
     propagate_flags_resample, propagate_flags_operation
+from .flag import SAMPLE_POINTS
 from .grid import CenteredGrid
+from .lazy import lazy_evaluation_enabled
 
 
 _SUBSCRIPTS = ['x', 'y', 'z', 'w']
@@ -24,8 +26,9 @@ def _subname(name, i):
 
 def _res(tensor, axis):
     if isinstance(tensor, CenteredGrid):
-        tensor = tensor.data
-    res = list(math.staticshape(tensor)[1:-1])
+        res = list(tensor.resolution)
+    else:
+        res = list(math.staticshape(tensor)[1:-1])
     res[axis] -= 1
     return tuple(res)
 
@@ -45,6 +48,73 @@ def stack_staggered_components(tensors):
     return math.concat(tensors, -1)
 
 
+def _has_nonzero_padding(tensor):
+    """ Tests whether a NumPy staggered tensor holds values outside of its components, i.e. at the upper end of the non-staggered dimensions. """
+    rank = tensor.ndim - 2
+    for axis in range(rank):
+        for dim in range(rank):
+            if dim != axis and np.any(tensor[(slice(None),) + tuple(-1 if d == dim else slice(None) for d in range(rank)) + (axis,)]):
+                return True
+    return False
+
+
+def staggered_to_centers(components):
+    """
+Averages the face values of a staggered grid onto the cell centers, two faces per axis. NumPy only.
+    :param components: list of NumPy arrays, component i of shape (batch_size, resolution with +1 along axis i..., 1)
+    :return: NumPy array of shape (batch_size, resolution..., len(components))
+    """
+    shape = list(components[0].shape)
+    shape[1] -= 1
+    shape[-1] = len(components)
+    result = np.empty(shape, np.result_type(*components))
+    for axis, component in enumerate(components):
+        lower = component[tuple(slice(None, -1) if d == axis + 1 else slice(None) for d in range(component.ndim))]
+        upper = component[tuple(slice(1, None) if d == axis + 1 else slice(None) for d in range(component.ndim))]
+        target = result[..., axis:axis + 1]
+        np.add(upper, lower, out=target)
+        target *= 0.5
+    return result
+
+
+def centers_to_staggered(data, extrapolation):
+    """
+Averages cell-centered values onto the faces of a staggered grid with the same box and resolution. NumPy only.
+Faces on the boundary average the outermost cell with the value given by the extrapolation.
+    :param data: NumPy array of shape (batch_size, resolution..., 1 or rank)
+    :param extrapolation: 'boundary', 'constant' or 'periodic'
+    :return: list of NumPy arrays, component i of shape (batch_size, resolution with +1 along axis i..., 1)
+    """
+    rank = data.ndim - 2
+    components = []
+    for axis in range(rank):
+        channel = data[..., axis:axis + 1] if data.shape[-1] > 1 else data
+        dim = axis + 1
+
+        def axis_slice(start, stop):
+            return tuple(slice(start, stop) if d == dim else slice(None) for d in range(data.ndim))
+
+        shape = list(channel.shape)
+        shape[dim] += 1
+        result = np.empty(shape, channel.dtype)
+        np.add(channel[axis_slice(1, None)], channel[axis_slice(None, -1)], out=result[axis_slice(1, -1)])
+        first, last = channel[axis_slice(0, 1)], channel[axis_slice(-1, None)]
+        if extrapolation == 'boundary':
+            np.add(first, first, out=result[axis_slice(0, 1)])
+            np.add(last, last, out=result[axis_slice(-1, None)])
+        elif extrapolation == 'constant':
+            result[axis_slice(0, 1)] = first
+            result[axis_slice(-1, None)] = last
+        elif extrapolation == 'periodic':
+            np.add(first, last, out=result[axis_slice(0, 1)])
+            result[axis_slice(-1, None)] = result[axis_slice(0, 1)]
+        else:
+            raise ValueError('Unsupported extrapolation: %s' % extrapolation)
+        result *= 0.5
+        components.append(result)
+    return components
+
+
 def staggered_component_box(resolution, axis, box_like=None):
     staggered_box = AABox(0, resolution) if box_like is None else AABox.to_box(box_like, resolution_hint=resolution)
     unit = np.array([(staggered_box.size[axis] / resolution[axis]) if d == axis else 0 for d in range(len(resolution))])
@@ -52,23 +122,21 @@ def staggered_component_box(resolution, axis, box_like=None):
     return box
 
 
-@struct.definition()
+@struct.definition(compile=True)
 class StaggeredGrid(Field):
 
     def __init__(self, data, box=None, name=None, **kwargs):
+        self._packed = None  # (buffer, component data) for grids created by packed(), see _packed_buffer()
         Field.__init__(self, **struct.kwargs(locals()))
 
-    @struct.variable(dependencies=[Field.name, Field.flags])
+    @struct.variable(dependencies=[Field.name, Field.flags, 'extrapolation', 'box'])
     def data(self, data):
         assert data is not None
         if math.is_tensor(data) is True:
             components = unstack_staggered_tensor(data)
         else:
             components = data
-        data = []
-        for cmp_idx, grid in enumerate(components):
-            data.append(self._component_grid(grid, cmp_idx))
-        return tuple(data)
+        return tuple(self._component_grid(grid, cmp_idx) for cmp_idx, grid in enumerate(components))
 
     def _component_grid(self, grid, axis):
         resolution = list(grid.resolution if isinstance(grid, CenteredGrid) else math.staticshape(grid)[1:-1])
@@ -115,6 +183,9 @@ class StaggeredGrid(Field):
     def at(self, other_field, collapse_dimensions=True, force_optimization=False, return_self_if_compatible=False):
         if isinstance(other_field, StaggeredGrid) and other_field.box == self.box:
             return self
+        if self._is_aligned_with(other_field):
+            data = staggered_to_centers([component.data for component in self.data])
+            return other_field.copied_with(data=data, flags=propagate_flags_resample(self, other_field.flags, other_field.rank))
         try:
             points = other_field.points
             resampled = [centeredgrid.at(other_field) for centeredgrid in self.data]
@@ -128,6 +199,14 @@ class StaggeredGrid(Field):
     def at_centers(self):
         return self.at(self.center_points)
 
+    def _is_aligned_with(self, centered_grid):
+        """ Tests whether centered_grid holds the cell centers of this MAC grid so that direct averaging applies. """
+        if not isinstance(centered_grid, CenteredGrid) or not all(isinstance(component.data, np.ndarray) for component in self.data):
+            return False
+        if centered_grid.box != self.box or tuple(centered_grid.resolution) != tuple(self.resolution):
+            return False
+        return SAMPLE_POINTS not in centered_grid.flags or centered_grid is self.center_points
+
     @property
     def component_count(self):
         return len(self.data)
@@ -157,14 +236,58 @@ class StaggeredGrid(Field):
     def __dataop__(self, other, linear_if_scalar, data_operator):
         if isinstance(other, StaggeredGrid):
             assert self.compatible(other), 'Fields are not compatible: %s and %s' % (self, other)
-            data = [data_operator(c1, c2) for c1, c2 in zip(self.data, other.data)]
             flags = propagate_flags_operation(self.flags+other.flags, False, self.rank, self.component_count)
+            buffers = (None, None) if lazy_evaluation_enabled() else (self._packed_buffer(), other._packed_buffer())
+            if buffers[0] is not None and buffers[1] is not None:
+                return self._with_packed_data(data_operator(*buffers), flags=flags)
+            data = [data_operator(c1, c2) for c1, c2 in zip(self.data, other.data)]
         else:
             flags = propagate_flags_operation(self.flags, linear_if_scalar, self.rank, self.component_count)
+            buffer = None if lazy_evaluation_enabled() or not isinstance(other, Number) else self._packed_buffer()
+            if buffer is not None:
+                return self._with_packed_data(data_operator(buffer, other), flags=flags)
             data = [data_operator(c1, other) for c1 in self.data]
         return self.copied_with(data=np.array(data, dtype=np.object), flags=flags)
 
+    def packed(self):
+        """
+Returns an equal StaggeredGrid whose components are views into one contiguous NumPy buffer of shape (batch_size, resolution+1..., rank).
+The buffer has the layout of staggered_tensor() so that staggered_tensor() returns it without copying.
+Element-wise operations between packed grids and with numbers operate on the whole buffer and yield packed grids.
+Grids constructed from a staggered tensor are not packed since the tensor is owned by the caller.
+        :return: self if already packed with zero padding, a packed copy otherwise
+        """
+        buffer = self._packed_buffer()
+        if buffer is not None and not _has_nonzero_padding(buffer):
+            return self
+        return self._with_packed_data(stack_staggered_components([c.data for c in self.data]))
+
+    def _with_packed_data(self, buffer, **kwargs):
+        """ Returns a copy whose components are views into buffer, a new NumPy staggered tensor that is not referenced anywhere else. """
+        grid = self.copied_with(data=buffer, **kwargs)
+        grid._packed = (buffer, tuple(c.data for c in grid.data))
+        return grid
+
+    def _packed_buffer(self):
+        """ Returns the NumPy buffer holding the data of all components or None if the components are stored separately. """
+        packed = self._packed
+        if packed is None:
+            return None
+        buffer, views = packed
+        if len(views) != len(self.data) or any(c.data is not view for c, view in zip(self.data, views)):
+            return None
+        return buffer
+
     def staggered_tensor(self):
+        """
+Stacks the components into one tensor of shape (batch_size, resolution+1..., rank), padding the non-staggered dimensions of each component with zeros.
+If the grid is packed and the padding entries of the buffer are zero, a read-only view of the buffer is returned without copying.
+        """
+        buffer = self._packed_buffer()
+        if buffer is not None and not _has_nonzero_padding(buffer):
+            view = buffer.view()
+            view.setflags(write=False)
+            return view
         tensors = [c.data for c in self.data]
         return stack_staggered_components(tensors)
 
@@ -189,9 +312,11 @@ class StaggeredGrid(Field):
         if data.shape[-1] != 1:
             raise ValueError('input must be a scalar field')
         tensors = []
+        # Pad once, then read the shifted faces for every axis through slices
+        padded = math.pad(data, [[0, 0]] + [[1, 1]] * scalar_field.rank + [[0, 0]], padding_mode)
         for dim in math.spatial_dimensions(data):
-            upper = math.pad(data, [[0,1] if d == dim else [0,0] for d in math.all_dimensions(data)], padding_mode)
-            lower = math.pad(data, [[1,0] if d == dim else [0,0] for d in math.all_dimensions(data)], padding_mode)
+            upper = padded[tuple([slice(None)] + [slice(1, None) if d == dim else slice(1, -1) for d in math.spatial_dimensions(data)] + [slice(None)])]
+            lower = padded[tuple([slice(None)] + [slice(None, -1) if d == dim else slice(1, -1) for d in math.spatial_dimensions(data)] + [slice(None)])]
             tensors.append((upper - lower) / scalar_field.dx[dim - 1])
         return StaggeredGrid(tensors, scalar_field.box, name='grad(%s)' % scalar_field.name,
                              batch_size=scalar_field._batch_size)
@@ -0,0 +1,163 @@
+"""
+Vectorized transfers between particles and grids, NumPy only.
+
+particles_to_grid() (P2G) splats particle values onto the cell centers of a grid or the faces of a staggered grid,
+grid_to_particles() (G2P) interpolates grid values at the particle positions.
+Both use multilinear weights, i.e. a particle contributes to and reads from the 2^d closest sample points.
+P2G linearizes the grid indices of all stencil entries and performs one weighted bincount per component and chunk of particles.
+"""
+import numpy as np
+import six
+
+from phi import math
+from .grid import CenteredGrid
+from .staggered_grid import StaggeredGrid, staggered_component_box
+from .resampling import sample_linear
+
+
+# Number of particles processed at once by particles_to_grid(), bounds the memory used by the stencils
+TRANSFER_CHUNK_SIZE = 2 ** 20
+
+
+def particles_to_grid(points, values, box, resolution, kernel='linear', mode='add', staggered=False):
+    """
+Transfers particle values onto a regular grid.
+Particles outside the grid contribute to the closest sample points inside.
+    :param points: NumPy array of shape (batch_size or 1, point_count, rank) holding the particle positions in world space
+    :param values: number or NumPy array of shape (batch_size or 1, point_count, components). Staggered grids take one component per axis or a single one.
+    :param box: AABox of the grid
+    :param resolution: cells per axis
+    :param kernel: 'linear' distributes each value onto the 2^d closest sample points, 'nearest' assigns it to the closest one
+    :param mode: 'add' sums the weighted values, 'mean' normalizes them by the sum of weights, 'any' yields 1 where a particle contributes and 0 elsewhere
+    :param staggered: if True, samples onto the faces of a staggered grid instead of the cell centers
+    :return: NumPy array of shape (batch_size, resolution..., components) or, if staggered, list of NumPy arrays of shape (batch_size, resolution with +1 along axis i..., 1)
+    """
+    resolution = tuple(int(r) for r in resolution)
+    if not staggered:
+        return scatter_linear(index_coordinates(points, box, resolution), values, resolution, kernel, mode)
+    components = []
+    for axis in range(len(resolution)):
+        component_resolution = tuple(r + 1 if d == axis else r for d, r in enumerate(resolution))
+        component_box = staggered_component_box(resolution, axis, box)
+        component_values = values[..., axis:axis + 1] if isinstance(values, np.ndarray) and values.shape[-1] > 1 else values
+        components.append(scatter_linear(index_coordinates(points, component_box, component_resolution), component_values, component_resolution, kernel, mode))
+    return components
+
+
+def grid_to_particles(grid, points):
+    """
+Interpolates a CenteredGrid or StaggeredGrid at the particle positions, equivalent to grid.sample_at(points).
+    :param grid: CenteredGrid or StaggeredGrid with NumPy data and a uniform extrapolation
+    :param points: NumPy array of shape (batch_size or 1, point_count, rank) holding the particle positions in world space
+    :return: NumPy array of shape (batch_size, point_count, components)
+    """
+    if isinstance(grid, StaggeredGrid):
+        return np.concatenate([grid_to_particles(component, points) for component in grid.data], axis=-1)
+    assert isinstance(grid, CenteredGrid) and isinstance(grid.data, np.ndarray), 'grid_to_particles requires NumPy grids but got %s' % grid
+    if not isinstance(grid.extrapolation, six.string_types):
+        return grid.sample_at(points)
+    return sample_linear(grid.data, index_coordinates(points, grid.box, grid.resolution), grid.extrapolation)
+
+
+def index_coordinates(points, box, resolution):
+    """
+Converts world positions to index space where coordinate i along an axis refers to the center of cell i.
+    :return: NumPy array of the same shape as points
+    """
+    resolution = np.array(resolution)
+    return box.global_to_local(points) * resolution.astype(np.result_type(points.dtype, np.float32)) - 0.5
+
+
+def cell_order(points, box, resolution):
+    """
+Sorts particles by the linear index of the cell containing them.
+Reordering particles by this permutation once in a while keeps particles that share sample points close in memory,
+which speeds up subsequent transfers.
+    :param points: NumPy array of shape (batch_size, point_count, rank)
+    :return: NumPy array of shape (batch_size, point_count) holding the permutation of each batch entry
+    """
+    resolution = tuple(int(r) for r in resolution)
+    cells = np.clip(np.floor(index_coordinates(points, box, resolution) + 0.5), 0, np.array(resolution) - 1).astype(np.int64)
+    linear = np.ravel_multi_index(np.moveaxis(cells, -1, 0), resolution)
+    return np.argsort(linear, axis=-1, kind='stable')
+
+
+def scatter_linear(coordinates, values, resolution, kernel='linear', mode='add'):
+    """
+Splats values given at index space coordinates onto a grid, see particles_to_grid().
+    :param coordinates: NumPy array of shape (batch_size or 1, point_count, rank), coordinate i along an axis refers to sample point i
+    :param values: number or NumPy array of shape (batch_size or 1, point_count, components)
+    :param resolution: number of sample points per axis
+    :return: NumPy array of shape (batch_size, resolution..., components)
+    """
+    assert kernel in ('linear', 'nearest'), kernel
+    assert mode in ('add', 'mean', 'any'), mode
+    rank = len(resolution)
+    assert coordinates.shape[-1] == rank, 'coordinates do not match the resolution: %s, %s' % (coordinates.shape, resolution)
+    if not isinstance(values, np.ndarray):
+        values = np.full((1, coordinates.shape[1], 1), values, np.result_type(values, np.float32))
+    batch_size = max(coordinates.shape[0], values.shape[0])
+    point_count = coordinates.shape[1]
+    spatial_size = int(np.prod(resolution))
+    dtype = np.result_type(values.dtype, coordinates.dtype, np.float32)
+    values = np.broadcast_to(values, (batch_size, point_count, values.shape[-1]))
+    coordinates = np.broadcast_to(coordinates, (batch_size, point_count, rank))
+    components = values.shape[-1]
+    sums = np.zeros([components, batch_size * spatial_size])
+    weight_sums = np.zeros([batch_size * spatial_size]) if mode != 'add' else None
+    buffers = None
+    if kernel == 'linear':
+        chunk_size = min(point_count, TRANSFER_CHUNK_SIZE)
+        buffers = np.empty([2 ** rank * chunk_size], np.int64), np.empty([2 ** rank * chunk_size], np.result_type(coordinates.dtype, np.float32))
+    for batch in range(batch_size):
+        for start in range(0, point_count, TRANSFER_CHUNK_SIZE):
+            indices, weights = _stencil(coordinates[batch, start:start + TRANSFER_CHUNK_SIZE], resolution, kernel, buffers)
+            indices += batch * spatial_size
+            chunk_values = values[batch, start:start + TRANSFER_CHUNK_SIZE]
+            if mode != 'any':
+                for component in range(components):
+                    component_weights = chunk_values[:, component] if weights is None else (weights * chunk_values[:, component]).ravel()
+                    sums[component] += np.bincount(indices.ravel(), component_weights, minlength=batch_size * spatial_size)
+            if weight_sums is not None:
+                weight_sums += np.bincount(indices.ravel(), None if weights is None else weights.ravel(), minlength=batch_size * spatial_size)
+    if mode == 'any':
+        sums[:] = weight_sums > 0
+    elif mode == 'mean':
+        np.divide(sums, weight_sums, out=sums, where=weight_sums > 0)
+    return np.moveaxis(sums, 0, -1).reshape((batch_size,) + resolution + (components,)).astype(dtype)
+
+
+def _stencil(coordinates, resolution, kernel, buffers=None):
+    """
+    :param coordinates: NumPy array of shape (point_count, rank)
+    :param buffers: optional flat index and weight arrays with at least stencil size * point_count entries that are reused between calls
+    :return: linear indices of shape (stencil size, point_count) and weights of the same shape or None if all weights are 1
+    """
+    rank = len(resolution)
+    point_count = len(coordinates)
+    strides = [int(np.prod(resolution[axis + 1:])) for axis in range(rank)]
+    if kernel == 'nearest':
+        index = np.zeros([1, point_count], np.int64)
+        for axis, size in enumerate(resolution):
+            index += np.clip(np.floor(coordinates[:, axis] + 0.5), 0, size - 1).astype(np.int64) * strides[axis]
+        return index, None
+    dtype = np.result_type(coordinates.dtype, np.float32)
+    if buffers is None:
+        buffers = np.empty([2 ** rank * point_count], np.int64), np.empty([2 ** rank * point_count], dtype)
+    indices, weights = [buffer[:2 ** rank * point_count].reshape((2,) * rank + (point_count,)) for buffer in buffers]
+    for axis, size in enumerate(resolution):
+        x = np.clip(coordinates[:, axis], 0, size - 1).astype(dtype, copy=False)
+        lower = np.clip(np.floor(x), 0, max(size - 2, 0)).astype(np.int64)
+        upper_weight = x - lower
+        corner_shape = [1] * rank + [point_count]
+        corner_shape[axis] = 2
+        # lower and upper neighbour along this axis, broadcast against the other axes to form all 2^d corners
+        axis_indices = np.stack([lower, np.minimum(lower + 1, size - 1)]).reshape(corner_shape) * strides[axis]
+        axis_weights = np.stack([1 - upper_weight, upper_weight]).reshape(corner_shape)
+        if axis == 0:
+            indices[...] = axis_indices
+            weights[...] = axis_weights
+        else:
+            indices += axis_indices
+            weights *= axis_weights
+    return indices.reshape((2 ** rank, point_count)), weights.reshape((2 ** rank, point_count))
@@ -1,16 +1,38 @@
 import itertools
 
 import numpy as np
+import scipy.sparse
 from numpy import pi
-from phi import math
+from phi import math, struct
 from phi.geom import AABox
+from phi.math.blas import conjugate_gradient
+from phi.math.parallel import parallel_map, slabs
 from phi.physics.field import StaggeredGrid
 from .field import StaggeredSamplePoints
 from .grid import CenteredGrid
 
 
-def diffuse(field, amount, substeps=1):
+# Maximum number of matrices kept by implicit_diffusion_matrix()
+DIFFUSION_CACHE_SIZE = 8
+
+_DIFFUSION_CACHE = struct.LRUCache(DIFFUSION_CACHE_SIZE)  # (resolution, dx, extrapolation, amount, dtype) -> sparse matrix
+
+
+def diffuse(field, amount, substeps=1, implicit=False):
+    """
+Diffuses a CenteredGrid by amount, i.e. viscosity or diffusivity times the time increment.
+Periodic grids are diffused exactly in Fourier space.
+Other grids take explicit forward Euler substeps unless implicit is True.
+    :param field: CenteredGrid
+    :param amount: diffusion amount
+    :param substeps: number of explicit substeps, only stable if amount / substeps is small compared to dx^2
+    :param implicit: if True, non-periodic grids take a single backward Euler step which is stable for any amount, see implicit_diffusion_matrix().
+    This requires NumPy data and a uniform 'boundary' or 'constant' extrapolation.
+    :return: diffused CenteredGrid
+    """
     assert isinstance(field, CenteredGrid)
+    if implicit and field.extrapolation != 'periodic' and (field.extrapolation not in ('boundary', 'constant') or not isinstance(field.data, np.ndarray)):
+        raise NotImplementedError('Implicit diffusion requires NumPy data and boundary or constant extrapolation but got %s with extrapolation %s' % (type(field.data).__name__, field.extrapolation))
     if field.extrapolation == 'periodic':
         frequencies = math.fft(math.to_complex(field.data))
         k = math.fftfreq(field.resolution) / field.dx
@@ -19,6 +41,8 @@ def diffuse(field, amount, substeps=1):
         diffuse_kernel = math.to_complex(math.exp(fft_laplace * amount))
         data = math.ifft(frequencies * diffuse_kernel)
         data = math.real(data)
+    elif implicit:
+        data = _diffuse_implicit(field, amount)
     else:
         data = field.data
         for i in range(substeps):
@@ -26,6 +50,49 @@ def diffuse(field, amount, substeps=1):
     return field.with_data(data)
 
 
+def _diffuse_implicit(field, amount, accuracy=1e-5, max_iterations=1000):
+    A = implicit_diffusion_matrix(field.resolution, field.dx, field.extrapolation, amount)
+    data = field.data
+    # every batch entry and component is an independent right-hand side
+    vectors = np.moveaxis(data, -1, 1).reshape((-1, A.shape[0]))
+    result, _ = conjugate_gradient(vectors, lambda x: A.dot(x.T).T, initial_x=vectors, accuracy=accuracy, max_iterations=max_iterations)
+    result = result.reshape((data.shape[0], data.shape[-1]) + data.shape[1:-1])
+    return np.moveaxis(result, 1, -1).astype(data.dtype)
+
+
+def implicit_diffusion_matrix(resolution, dx, extrapolation, amount):
+    """
+Returns the cached sparse matrix (I - amount * L) where L is the finite-difference Laplace operator of a CenteredGrid,
+i.e. the system matrix of a backward Euler diffusion step.
+The matrix is symmetric positive definite so that it can be solved with the conjugate gradient method.
+The returned matrix is shared and must not be modified.
+    :param resolution: grid resolution
+    :param dx: cell size per axis
+    :param extrapolation: 'boundary' (zero flux) or 'constant' (zero values outside)
+    :param amount: diffusion amount
+    :return: SciPy sparse matrix of shape (N, N) where N is the number of cells
+    """
+    assert extrapolation in ('boundary', 'constant'), 'Implicit diffusion does not support extrapolation %s' % (extrapolation,)
+    key = (tuple(int(r) for r in resolution), tuple(float(d) for d in dx), extrapolation, float(amount), np.dtype(math.accumulation_dtype()).str)
+    return _DIFFUSION_CACHE.lookup(key, lambda: _implicit_diffusion_matrix(*key[:4]))
+
+
+def _implicit_diffusion_matrix(resolution, dx, extrapolation, amount):
+    dtype = math.accumulation_dtype()
+    cell_count = int(np.prod(resolution))
+    laplace = scipy.sparse.csr_matrix((cell_count, cell_count), dtype=dtype)
+    for axis, size in enumerate(resolution):
+        center = np.full(size, -2.)
+        if extrapolation == 'boundary':
+            # the value outside equals the outermost cell, see _pad_mode()
+            center[0] += 1
+            center[-1] += 1
+        second_difference = scipy.sparse.diags([np.ones(size - 1), center, np.ones(size - 1)], [-1, 0, 1]) / dx[axis] ** 2
+        before, after = int(np.prod(resolution[:axis])), int(np.prod(resolution[axis + 1:]))
+        laplace = laplace + scipy.sparse.kron(scipy.sparse.kron(scipy.sparse.identity(before), second_difference), scipy.sparse.identity(after))
+    return (scipy.sparse.identity(cell_count, dtype=dtype) - amount * laplace).tocsr().astype(dtype)
+
+
 def data_bounds(field):
     assert field.has_points
     try:
@@ -48,6 +115,30 @@ def extrapolate(input_field, valid_mask, voxel_distance=10):
         :param voxel_distance: Optional maximal distance (in number of grid cells) where signed distance should still be calculated / how far should be extrapolated.
         :return: ext_field: a new Field with extrapolated values, s_distance: tensor containing signed distance field, depending only on the valid_mask
     """
+    batch_size = math.staticshape(valid_mask)[0]
+    if math.get_num_threads() > 1 and batch_size > 1 and isinstance(valid_mask, np.ndarray):
+        # Batch entries are independent: extrapolate slabs of the batch in parallel
+        results = parallel_map(lambda slab: _extrapolate(_batch_slab(input_field, slab), valid_mask[slab[0]:slab[1]], voxel_distance), slabs(batch_size))
+        if len(results) > 1:
+            ext_data = math.concat([_field_tensor(field) for field, _ in results], axis=0)
+            ext_field = input_field.with_data(ext_data) if isinstance(input_field, StaggeredGrid) else input_field.copied_with(data=ext_data)
+            return ext_field, math.concat([s_distance for _, s_distance in results], axis=0)
+    return _extrapolate(input_field, valid_mask, voxel_distance)
+
+
+def _field_tensor(field):
+    return field.staggered_tensor() if isinstance(field, StaggeredGrid) else field.data
+
+
+def _batch_slab(field, slab):
+    data = _field_tensor(field)
+    if math.staticshape(data)[0] == 1:
+        return field
+    data = data[slab[0]:slab[1]]
+    return field.with_data(data) if isinstance(field, StaggeredGrid) else field.copied_with(data=data)
+
+
+def _extrapolate(input_field, valid_mask, voxel_distance):
     ext_data = input_field.data
     dx = input_field.dx
     if isinstance(input_field, StaggeredGrid):
@@ -143,30 +234,88 @@ def extrapolate(input_field, valid_mask, voxel_distance=10):
     return ext_field, s_distance
 
 
+def extrapolate_by_distance(input_field, valid_mask, voxel_distance=10):
+    """
+    Extrapolates input_field into the cells outside of valid_mask and computes the signed distance to the fluid surface using exact Euclidean distance transforms.
+    Each invalid cell that lies within voxel_distance cells (along every axis) of a valid cell takes the value of the nearest valid cell in Euclidean distance.
+    The signed distances are exact Euclidean distances to the closest surface cell (see create_surface_mask()), clipped at voxel_distance.
+    Both can differ from extrapolate() which propagates values and distances by iterative sweeps over all 3^d directions.
+    For StaggeredGrids, a face is valid if either of its two neighbouring cells is valid and each component takes the values of its nearest valid faces.
+    Runtime is linear in the number of cells and independent of voxel_distance.
+    Only NumPy tensors are supported, other tensors are passed to extrapolate().
+        :param input_field: CenteredGrid or StaggeredGrid to be extrapolated
+        :param valid_mask: One dimensional binary mask indicating where fluid is present
+        :param voxel_distance: maximal distance (in number of grid cells) where values are extrapolated and the signed distance is calculated
+        :return: ext_field: a new Field with extrapolated values, s_distance: tensor containing signed distance field, depending only on the valid_mask
+    """
+    data = _field_tensor(input_field)
+    if not isinstance(valid_mask, np.ndarray) or not isinstance(data, np.ndarray):
+        return extrapolate(input_field, valid_mask, voxel_distance)
+    from scipy import ndimage
+    dx = np.broadcast_to(input_field.dx, [input_field.rank]).astype(np.float64)
+    valid = valid_mask[..., 0] > 0
+    surface = create_surface_mask(valid_mask)[..., 0] > 0
+    s_distance = np.empty(valid.shape, np.result_type(valid_mask.dtype, np.float32))
+    for batch in range(valid.shape[0]):
+        distance = ndimage.distance_transform_edt(~surface[batch], sampling=dx) if surface[batch].any() else np.inf
+        s_distance[batch] = np.where(valid[batch], -distance, distance)
+    # Cut off values beyond voxel_distance like extrapolate()
+    s_distance = np.where(np.abs(s_distance) < voxel_distance, s_distance, -voxel_distance * (2 * valid - 1))[..., np.newaxis]
+    if isinstance(input_field, StaggeredGrid):
+        components = [_nearest_valid_values(component.data, _face_valid_mask(valid, axis), dx, voxel_distance) for axis, component in enumerate(input_field.data)]
+        ext_field = input_field.with_data(components)
+    else:
+        ext_field = input_field.copied_with(data=_nearest_valid_values(data, valid, dx, voxel_distance))
+    return ext_field, s_distance
+
+
+def _face_valid_mask(valid, axis):
+    """ Faces of the staggered component along axis are valid if a neighbouring cell is valid. """
+    padded = np.pad(valid, [(0, 0)] + [(1, 1) if d == axis else (0, 0) for d in range(valid.ndim - 1)], 'constant')
+    lower = padded[(slice(None),) + tuple(slice(None, -1) if d == axis else slice(None) for d in range(valid.ndim - 1))]
+    upper = padded[(slice(None),) + tuple(slice(1, None) if d == axis else slice(None) for d in range(valid.ndim - 1))]
+    return lower | upper
+
+
+def _nearest_valid_values(data, valid, dx, voxel_distance):
+    """ Replaces the values of invalid cells within voxel_distance cells of a valid cell by the value of the nearest valid cell with a single gather per batch entry. """
+    from scipy import ndimage
+    batch_size = max(valid.shape[0], data.shape[0])
+    result = np.array(np.broadcast_to(data, (batch_size,) + data.shape[1:]))
+    for batch in range(batch_size):
+        batch_valid = valid[batch % valid.shape[0]]
+        if not batch_valid.any() or batch_valid.all():
+            continue
+        _, nearest = ndimage.distance_transform_edt(~batch_valid, sampling=dx, return_indices=True)
+        offsets = np.abs(nearest - np.indices(batch_valid.shape))
+        update = ~batch_valid & (np.max(offsets, axis=0) <= voxel_distance)
+        result[batch][update] = data[batch % data.shape[0]][tuple(index[update] for index in nearest)]
+    return result
+
+
 def create_surface_mask(liquid_mask):
     """
 Computes inner contours of the liquid_mask.
-A cell i is flagged 1 if liquid_mask[i] = 1 and it has a non-liquid neighbour.
+A cell i is flagged 1 if liquid_mask[i] = 1 and it has a non-liquid neighbour, including diagonal neighbours.
+Cells outside the grid count as non-liquid.
     :param liquid_mask: binary tensor
     :return: tensor
     """
-    # When we create inner contour, we don't want the fluid-wall boundaries to show up as surface, so we should pad with symmetric edge values.
-    mask = math.pad(liquid_mask, [[0, 0]] + [[1, 1]] * math.spatial_rank(liquid_mask) + [[0, 0]], "constant")
-    dims = range(math.spatial_rank(mask))
-    bcs = math.zeros_like(liquid_mask)
+    return liquid_mask - erode(liquid_mask)
 
-    # Move in every possible direction to assure corners are properly set.
-    directions = np.array(list(itertools.product(
-        *np.tile((-1, 0, 1), (len(dims), 1))
-    )))
-
-    for d in directions:
-        d_slice = tuple([(slice(2, None) if d[i] == -1 else slice(0, -2) if d[i] == 1 else slice(1, -1)) for i in dims])
-        center_slice = tuple([slice(1, -1) for _ in dims])
 
-        # Create inner contour of particles
-        bc_d = math.maximum(mask[(slice(None),) + d_slice + (slice(None),)],
-                            mask[(slice(None),) + center_slice + (slice(None),)]) - \
-               mask[(slice(None),) + d_slice + (slice(None),)]
-        bcs = math.maximum(bcs, bc_d)
-    return bcs
\ No newline at end of file
+def erode(mask):
+    """
+Morphological erosion with a box of 3 cells along each axis: every cell takes the minimum of itself and all of its neighbours, including diagonal ones.
+The mask is padded with zeros.
+Since the box is separable, the erosion is computed as one minimum filter per axis, i.e. O(N*d) instead of O(N*3^d).
+    :param mask: tensor of shape (batch_size, spatial dimensions..., components)
+    :return: tensor of the same shape as mask
+    """
+    rank = math.spatial_rank(mask)
+    for dim in range(rank):
+        padded = math.pad(mask, [[0, 0]] + [[1, 1] if d == dim else [0, 0] for d in range(rank)] + [[0, 0]], 'constant')
+        lower, center, upper = [padded[(slice(None),) + tuple(axis_slice if d == dim else slice(None) for d in range(rank)) + (slice(None),)]
+                                for axis_slice in (slice(None, -2), slice(1, -1), slice(2, None))]
+        mask = math.minimum(math.minimum(lower, center), upper)
+    return mask
@@ -7,17 +7,18 @@ import numpy as np
 
 from phi import struct
 from phi import math
+from phi.geom import union, signed_distance_lattice
 
 from .physics import StateDependency, Physics
 from .pressuresolver.solver_api import FluidDomain
 from .pressuresolver.sparse import SparseCG
-from .field import CenteredGrid, StaggeredGrid, union_mask, advect
+from .field import CenteredGrid, StaggeredGrid, rasterized_union, advect
 from .material import OPEN, Material
 from .domain import Domain, DomainState
 from .field.effect import Gravity, gravity_tensor, effect_applied
 
 
-@struct.definition()
+@struct.definition(compile=True)
 class Fluid(DomainState):
     """
     A Fluid state consists of a density field (centered grid) and a velocity field (staggered grid).
@@ -80,8 +81,7 @@ Supports obstacles, density effects, velocity effects, global gravity.
         if self.make_input_divfree:
             velocity = divergence_free(velocity, fluid.domain, obstacles, pressure_solver=self.pressure_solver)
         # --- Advection ---
-        density = advect.semi_lagrangian(density, velocity, dt=dt)
-        velocity = advect.semi_lagrangian(velocity, velocity, dt=dt)
+        density, velocity = advect.grid_semi_lagrangian([density, velocity], velocity, dt=dt)
         if self.conserve_density and np.all(Material.solid(fluid.domain.boundaries)):
             density = density.normalized(fluid.density)
         # --- Effects ---
@@ -139,27 +139,32 @@ def solve_pressure(divergence, fluiddomain, pressure_solver=None):
     return pressure, iteration
 
 
-def divergence_free(velocity, domain=None, obstacles=(), pressure_solver=None):
+def divergence_free(velocity, domain=None, obstacles=(), pressure_solver=None, continuous_masks=False):
     """
 Projects the given velocity field by solving for and subtracting the pressure.
     :param velocity: StaggeredGrid
     :param domain: Domain matching the velocity field, used for boundary conditions
     :param obstacles: list of Obstacles
     :param pressure_solver: PressureSolver. Uses default solver if none provided.
+    :param continuous_masks: If True, cells are blocked by the fraction of their volume covered by obstacles instead of the obstacle value at the cell center.
+    Coverages are derived from the cached signed distance of the obstacles (see signed_distance_lattice). Requires a solver that supports continuous masks.
     :return: divergence-free velocity as StaggeredGrid
     """
     assert isinstance(velocity, StaggeredGrid)
     # --- Set up FluidDomain ---
     if domain is None:
         domain = Domain(velocity.resolution, OPEN)
-    obstacle_mask = union_mask([obstacle.geometry for obstacle in obstacles])
-    if obstacle_mask is not None:
-        obstacle_grid = obstacle_mask.at(velocity.center_points, collapse_dimensions=False).copied_with(extrapolation='constant')
-        active_mask = 1 - obstacle_grid
-    else:
-        active_mask = math.ones(domain.centered_shape(name='active', extrapolation='constant'))
-    accessible_mask = active_mask.copied_with(extrapolation=Material.accessible_extrapolation_mode(domain.boundaries))
-    fluiddomain = FluidDomain(domain, active=active_mask, accessible=accessible_mask)
+    obstacle_grid = None
+    if continuous_masks and len(obstacles) > 0:
+        assert pressure_solver is None or pressure_solver.supports_continuous_masks, '%s does not support continuous masks' % pressure_solver
+        try:
+            coverage = signed_distance_lattice(union([obstacle.geometry for obstacle in obstacles]), velocity.box, velocity.resolution).coverage()
+            obstacle_grid = CenteredGrid(coverage, velocity.box, name='obstacle_coverage')
+        except NotImplementedError:
+            pass  # geometries without signed distance, use binary masks
+    if obstacle_grid is None:
+        obstacle_grid = rasterized_union([obstacle.geometry for obstacle in obstacles], velocity.center_points)
+    fluiddomain = _fluid_domain(domain, obstacle_grid)
     # --- Boundary Conditions, Pressure Solve ---
     velocity = fluiddomain.with_hard_boundary_conditions(velocity)
     divergence_field = velocity.divergence(physical_units=False)
@@ -168,3 +173,25 @@ Projects the given velocity field by solving for and subtracting the pressure.
     gradp = StaggeredGrid.gradient(pressure)
     velocity -= fluiddomain.with_hard_boundary_conditions(gradp)
     return velocity
+
+
+# Maximum number of FluidDomains kept by _fluid_domain()
+FLUID_DOMAIN_CACHE_SIZE = 8
+
+_FLUID_DOMAIN_CACHE = struct.LRUCache(FLUID_DOMAIN_CACHE_SIZE)  # (fingerprint of Domain, fingerprint of obstacle mask) -> FluidDomain
+
+
+def _fluid_domain(domain, obstacle_grid):
+    """
+Creates the FluidDomain with the cells of obstacle_grid marked as inactive.
+FluidDomains of NumPy masks are cached and re-used while domain and obstacles stay the same.
+Since fingerprints are memoised per instance, the pressure matrix cache (see cached_pressure_matrix) then finds its matrix without hashing the masks again.
+    """
+    def create():
+        active_mask = 1 - obstacle_grid.copied_with(extrapolation='constant')
+        accessible_mask = active_mask.copied_with(extrapolation=Material.accessible_extrapolation_mode(domain.boundaries))
+        return FluidDomain(domain, active=active_mask, accessible=accessible_mask)
+
+    if not isinstance(obstacle_grid.data, np.ndarray):
+        return create()
+    return _FLUID_DOMAIN_CACHE.lookup((struct.fingerprint(domain), struct.fingerprint(obstacle_grid)), create)
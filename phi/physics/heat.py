@@ -5,13 +5,14 @@ from .field.effect import effect_applied
 
 class HeatDiffusion(Physics):
 
-    def __init__(self, diffusivity=0.1):
+    def __init__(self, diffusivity=0.1, implicit=False):
         Physics.__init__(self, [StateDependency('effects', 'temperature_effect', blocking=True)])
         self.diffusivity = diffusivity
+        self.implicit = implicit
 
     def step(self, temperature, dt=1.0, effects=()):
         # pylint: disable-msg = arguments-differ
-        temperature = diffuse(temperature, dt * self.diffusivity)
+        temperature = diffuse(temperature, dt * self.diffusivity, implicit=self.implicit)
         for effect in effects:
             temperature = effect_applied(effect, temperature, dt)
         return temperature.copied_with(age=temperature.age + dt)
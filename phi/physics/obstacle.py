@@ -5,7 +5,7 @@ from .physics import State, Physics
 from .material import Material, CLOSED
 
 
-@struct.definition()
+@struct.definition(slots=True, compile=True)
 class Obstacle(State):
 
     def __init__(self, geometry, material=CLOSED, velocity=0, tags=('obstacle',), **kwargs):
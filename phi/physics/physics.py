@@ -6,7 +6,7 @@ from phi import struct
 from phi.math import staticshape
 
 
-@struct.definition()
+@struct.definition(slots=True, compile=True)
 class State(struct.Struct):
     """
     States describe one configuration of a physical system.
@@ -18,6 +18,8 @@ class State(struct.Struct):
     States are identified by their unique name.
     """
 
+    __slots__ = ('_batch_size',)
+
     def __init__(self, batch_size=None, **kwargs):
         self._batch_size = batch_size
         struct.Struct.__init__(self, **kwargs)
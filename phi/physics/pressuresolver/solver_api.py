@@ -36,7 +36,7 @@ class PressureSolver(object):
         return self.name
 
 
-@struct.definition()
+@struct.definition(fingerprint=True)
 class FluidDomain(struct.Struct):
 
     def __init__(self, domain, valid_state=(), active=None, accessible=None, **kwargs):
@@ -5,7 +5,7 @@ import scipy
 import scipy.sparse
 import scipy.sparse.linalg
 
-from phi import math
+from phi import math, struct
 from phi.math.blas import conjugate_gradient
 from .solver_api import PressureSolver, FluidDomain
 
@@ -24,20 +24,44 @@ class SparseSciPy(PressureSolver):
     def solve(self, divergence, domain, pressure_guess):
         assert isinstance(domain, FluidDomain)
         dimensions = list(divergence.shape[1:-1])
-        A = sparse_pressure_matrix(dimensions, domain.active_tensor(extend=1), domain.accessible_tensor(extend=1))
+        A = cached_pressure_matrix(dimensions, domain)
+
+        dtype = math.storage_dtype()
 
         def np_solve_p(div):
             div_vec = div.reshape([-1, A.shape[0]])
             pressure = [scipy.sparse.linalg.spsolve(A, div_vec[i, ...]) for i in range(div_vec.shape[0])]
-            return np.array(pressure).reshape(div.shape).astype(np.float32)
+            return np.array(pressure).reshape(div.shape).astype(dtype)
 
         def np_solve_p_gradient(op, grad_in):
-            return math.py_func(np_solve_p, [grad_in], np.float32, divergence.shape)
+            return math.py_func(np_solve_p, [grad_in], dtype, divergence.shape)
 
-        pressure = math.py_func(np_solve_p, [divergence], np.float32, divergence.shape, grad=np_solve_p_gradient)
+        pressure = math.py_func(np_solve_p, [divergence], dtype, divergence.shape, grad=np_solve_p_gradient)
         return pressure, None
 
 
+# Maximum number of pressure matrices kept by cached_pressure_matrix()
+MATRIX_CACHE_SIZE = 8
+
+_MATRIX_CACHE = struct.LRUCache(MATRIX_CACHE_SIZE)  # (dimensions, fingerprint of FluidDomain, dtype) -> sparse matrix
+
+
+def cached_pressure_matrix(dimensions, domain):
+    """
+    Returns the sparse pressure matrix for a FluidDomain, re-using the matrix of a previous call if the domain has the same content.
+    Domains are compared by their fingerprint (see struct.fingerprint) so the masks are hashed instead of compared element-wise.
+    Only domains holding NumPy masks are cached. The returned matrix is shared and must not be modified.
+
+    :param dimensions: valid simulation dimensions
+    :param domain: FluidDomain
+    :return: SciPy sparse matrix, see sparse_pressure_matrix()
+    """
+    if not isinstance(domain.active.data, np.ndarray) or not isinstance(domain.accessible.data, np.ndarray):
+        return sparse_pressure_matrix(dimensions, domain.active_tensor(extend=1), domain.accessible_tensor(extend=1))
+    key = (tuple(int(d) for d in dimensions), struct.fingerprint(domain), np.dtype(math.accumulation_dtype()).str)
+    return _MATRIX_CACHE.lookup(key, lambda: sparse_pressure_matrix(dimensions, domain.active_tensor(extend=1), domain.accessible_tensor(extend=1)))
+
+
 def sparse_pressure_matrix(dimensions, extended_active_mask, extended_fluid_mask):
     """
     Builds a sparse matrix such that when applied to a flattened pressure channel, it calculates the laplace
@@ -50,7 +74,7 @@ def sparse_pressure_matrix(dimensions, extended_active_mask, extended_fluid_mask
     """
     N = int(np.prod(dimensions))
     d = len(dimensions)
-    A = scipy.sparse.lil_matrix((N, N), dtype=np.float32)
+    A = scipy.sparse.lil_matrix((N, N), dtype=math.accumulation_dtype())
     dims = range(d)
 
     center_values = None # diagonal matrix entries
@@ -131,8 +155,6 @@ class SparseCG(PressureSolver):
 
     def solve(self, divergence, domain, pressure_guess):
         assert isinstance(domain, FluidDomain)
-        active_mask = domain.active_tensor(extend=1)
-        fluid_mask = domain.accessible_tensor(extend=1)
         dimensions = list(divergence.shape[1:-1])
         N = int(np.prod(dimensions))
 
@@ -143,10 +165,10 @@ class SparseCG(PressureSolver):
                 tf = tf.compat.v1
                 tf.disable_eager_execution()
             sidx, sorting = sparse_indices(dimensions)
-            sval_data = sparse_values(dimensions, active_mask, fluid_mask, sorting)
+            sval_data = sparse_values(dimensions, domain.active_tensor(extend=1), domain.accessible_tensor(extend=1), sorting)
             A = tf.SparseTensor(indices=sidx, values=sval_data, dense_shape=[N, N])
         else:
-            A = sparse_pressure_matrix(dimensions, active_mask, fluid_mask)
+            A = cached_pressure_matrix(dimensions, domain)
 
         if self.autodiff:
             return sparse_cg(divergence, A, self.max_iterations, pressure_guess, self.accuracy, back_prop=True)
@@ -169,6 +191,8 @@ def sparse_cg(divergence, A, max_iterations, guess, accuracy, back_prop=False):
         guess = math.reshape(guess, [-1, int(np.prod(divergence.shape[1:]))])
     apply_A = lambda pressure: math.matmul(A, pressure)
     result_vec, iterations = conjugate_gradient(div_vec, apply_A, guess, accuracy, max_iterations, back_prop)
+    if math.dtype(result_vec) != math.dtype(divergence):
+        result_vec = math.cast(result_vec, math.dtype(divergence))
     return math.reshape(result_vec, math.shape(divergence)), iterations
 
 
@@ -14,6 +14,7 @@ import six
 from .physics import State, Physics, Static
 from .collective import CollectiveState
 from .field.effect import Gravity
+from .field.lazy import lazy_evaluation_enabled, materialize
 
 
 class StateProxy(object):
@@ -165,6 +166,7 @@ Sets the current state of the world and informs all observers.
         Calling World.step resolves all dependencies among simulations and then calls Physics.step on each simulation to evolve the states.
 
         Invoking this method alters the world state. To to_field a copy of the state, use :func:`World.stepped <~world.World.stepped>` instead.
+        If lazy Field evaluation is enabled, all pending expressions of the new state are evaluated before this method returns.
             :param state: State, StateProxy or None
             :param dt: time increment
             :param physics: Physics object for the state or None for default
@@ -172,12 +174,17 @@ Sets the current state of the world and informs all observers.
         """
         if state is None:
             if physics is None: physics = self.physics
-            self.state = physics.step(self._state, dt)
+            new_state = physics.step(self._state, dt)
+            if lazy_evaluation_enabled():
+                materialize(new_state)
+            self.state = new_state
             return self.state
         else:
             if isinstance(state, StateProxy):
                 state = state.state
             s = self.physics.substep(state, self._state, dt, override_physics=physics)
+            if lazy_evaluation_enabled():
+                materialize(s)
             self.state = self._state.state_replaced(s)
             return s
 
@@ -4,3 +4,5 @@ from .struct import Struct, kwargs, to_dict, variables, constants, properties_di
 
 # pylint: disable-msg = redefined-builtin
 from .functions import flatten, names, map, zip, Trace, compare, print_differences
+from .fingerprint import fingerprint, LRUCache
+from .packing import pack, unpack, packed_size
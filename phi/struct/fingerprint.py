@@ -0,0 +1,155 @@
+"""
+Content fingerprints for structs and their values.
+
+A fingerprint is a short string that identifies the content of a value, including shapes and data types of arrays.
+Equal fingerprints imply exactly equal content which makes fingerprints suitable as cache keys.
+Fingerprints of structs are computed lazily and memoised per instance since structs are immutable.
+This assumes that arrays held by structs are not modified in-place.
+
+Tensors of backends whose content cannot be read directly (e.g. TensorFlow tensors) are identified by object identity.
+LRUCache holds the most recently used results of expensive computations, typically keyed by fingerprints.
+"""
+import hashlib
+import weakref
+from collections import OrderedDict
+from numbers import Number
+
+import numpy as np
+import six
+
+from .struct import Struct, to_dict
+from .structdef import ALL_ITEMS
+
+
+_FINGERPRINTS = {}  # id(struct) -> (weakref to struct, fingerprint)
+
+
+def fingerprint(obj):
+    """
+Computes a content fingerprint of obj.
+Supported values are structs, NumPy arrays, numbers, strings, None and lists, tuples or dicts thereof.
+    :param obj: any value
+    :return: fingerprint string
+    """
+    if isinstance(obj, Struct):
+        return _struct_fingerprint(obj)
+    hasher = hashlib.sha1()
+    _update(hasher, obj)
+    return hasher.hexdigest()
+
+
+def _struct_fingerprint(struct):
+    key = id(struct)
+    memoised = _FINGERPRINTS.get(key, None)
+    if memoised is not None and memoised[0]() is struct:
+        return memoised[1]
+    hasher = hashlib.sha1()
+    hasher.update(('%s.%s' % (type(struct).__module__, type(struct).__name__)).encode('utf-8'))
+    items = to_dict(struct, item_condition=ALL_ITEMS)
+    for name in sorted(items.keys(), key=str):
+        hasher.update(str(name).encode('utf-8'))
+        _update(hasher, items[name])
+    result = hasher.hexdigest()
+    try:
+        _FINGERPRINTS[key] = (weakref.ref(struct, lambda _ref: _FINGERPRINTS.pop(key, None)), result)
+    except TypeError:  # struct does not support weak references
+        pass
+    return result
+
+
+def _update(hasher, value):
+    if isinstance(value, Struct):
+        hasher.update(b'struct')
+        hasher.update(_struct_fingerprint(value).encode('utf-8'))
+    elif isinstance(value, np.ndarray):
+        hasher.update(('ndarray%s%s' % (value.dtype.str, value.shape)).encode('utf-8'))
+        if value.dtype == object:
+            for element in value.flat:
+                _update(hasher, element)
+        else:
+            hasher.update(np.ascontiguousarray(value).view(np.uint8).data)
+    elif isinstance(value, (tuple, list)):
+        hasher.update(('%s%d' % (type(value).__name__, len(value))).encode('utf-8'))
+        for element in value:
+            _update(hasher, element)
+    elif isinstance(value, dict):
+        hasher.update(('dict%d' % len(value)).encode('utf-8'))
+        for key in sorted(value.keys(), key=str):
+            _update(hasher, key)
+            _update(hasher, value[key])
+    elif value is None or isinstance(value, (Number, six.string_types, np.generic)):
+        hasher.update(('%s:%r' % (type(value).__name__, value)).encode('utf-8'))
+    else:
+        try:
+            hasher.update(('%s#%d' % (type(value).__name__, hash(value))).encode('utf-8'))
+        except TypeError:  # unhashable, e.g. backend tensors
+            hasher.update(('%s@%d' % (type(value).__name__, id(value))).encode('utf-8'))
+
+
+class LRUCache(object):
+    """
+Dictionary-like cache that keeps only the size most recently used entries.
+    :param size: maximum number of entries
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()  # least recently used first
+
+    def lookup(self, key, create):
+        """
+Returns the value stored for key or, if there is none, stores and returns create().
+        :param create: function without arguments computing the value
+        """
+        try:
+            value = self._entries.pop(key)
+        except KeyError:
+            value = create()
+        self[key] = value
+        return value
+
+    def get(self, key, default=None):
+        """ Returns the value stored for key, marking it as most recently used, or default if there is none. """
+        try:
+            value = self._entries.pop(key)
+        except KeyError:
+            return default
+        self._entries[key] = value
+        return value
+
+    def pop(self, key, default=None):
+        return self._entries.pop(key, default)
+
+    def __setitem__(self, key, value):
+        self._entries.pop(key, None)
+        self._entries[key] = value
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def values(self):
+        return self._entries.values()
+
+    def clear(self):
+        self._entries.clear()
+
+
+def fingerprint_eq(fallback_eq):
+    """
+Creates __eq__ for struct classes declared with struct.definition(fingerprint=True).
+Instances with equal fingerprints are equal without comparing their items.
+    :param fallback_eq: __eq__ used if the fingerprints differ, e.g. to accept approximately equal values
+    :return: __eq__
+    """
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if type(self) != type(other):  # pylint: disable-msg = unidiomatic-typecheck
+            return False
+        if _struct_fingerprint(self) == _struct_fingerprint(other):
+            return True
+        return fallback_eq(self, other)
+
+    return __eq__
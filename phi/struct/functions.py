@@ -6,12 +6,13 @@ from .context import unsafe
 
 
 def flatten(struct, leaf_condition=None, trace=False, item_condition=DATA):
-    result = []
-    def map_leaf(value):
-        result.append(value)
-        return value
-    with unsafe(): map(map_leaf, struct, leaf_condition, recursive=True, trace=trace, item_condition=item_condition)
-    return result
+    if trace is True:
+        trace = Trace(struct, None, None)
+    leaves = []
+    _traverse(struct, leaf_condition, True, trace, item_condition, leaves)
+    if trace is False:
+        return [leaf.values[0] if isinstance(leaf, LeafZip) else leaf for leaf in leaves]
+    return leaves
 
 
 def names(struct, leaf_condition=None, full_path=True, basename=None, separator='.'):
@@ -80,25 +81,44 @@ def map(function, struct, leaf_condition=None, recursive=True, trace=False, item
     # pylint: disable-msg = redefined-builtin
     if trace is True:
         trace = Trace(struct, None, None)
+    # First collect all leaves, then apply function in a flat loop and rebuild the structure in a single pass
+    leaves = []
+    plan = _traverse(struct, leaf_condition, recursive, trace, item_condition, leaves)
+    return _rebuild(plan, iter(_apply_to_leaves(function, leaves, trace)))
+
+
+def _traverse(struct, leaf_condition, recursive, trace, item_condition, leaves):
+    """
+Appends all leaves of struct to leaves in depth-first order.
+If trace is not False, the leaves are represented by their Trace objects.
+    :return: traversal plan for _rebuild, None if struct is a leaf, else (struct, keys, child plans)
+    """
     if not isstruct(struct, leaf_condition):
-        if trace is False:
-            if isinstance(struct, LeafZip):
-                return function(*struct.values)
-            else:
-                return function(struct)
+        leaves.append(struct if trace is False else trace)
+        return None
+    old_values = to_dict(struct, item_condition=item_condition)
+    children = []
+    for key, value in old_values.items():
+        child_trace = Trace(value, key, trace) if trace is not False else False
+        if recursive:
+            children.append(_traverse(value, leaf_condition, recursive, child_trace, item_condition, leaves))
         else:
-            return function(trace)
-    else:
-        old_values = to_dict(struct, item_condition=item_condition)
-        new_values = {}
-        if not recursive:
-            leaf_condition = lambda x: True
-        for key, value in old_values.items():
-            new_values[key] = map(function, value, leaf_condition, recursive,
-                                  Trace(value, key, trace) if trace is not False else False,
-                                  item_condition=item_condition)
-
-        return copy_with(struct, new_values)
+            leaves.append(value if trace is False else child_trace)
+            children.append(None)
+    return struct, tuple(old_values.keys()), children
+
+
+def _apply_to_leaves(function, leaves, trace):
+    if trace is not False:
+        return [function(leaf_trace) for leaf_trace in leaves]
+    return [function(*leaf.values) if isinstance(leaf, LeafZip) else function(leaf) for leaf in leaves]
+
+
+def _rebuild(plan, new_values):
+    if plan is None:
+        return next(new_values)
+    struct, keys, children = plan
+    return copy_with(struct, {key: _rebuild(child, new_values) for key, child in six.moves.zip(keys, children)})
 
 
 class Trace(object):
@@ -0,0 +1,149 @@
+"""
+Serialization of all data leaves of a struct into a single contiguous buffer.
+
+Layout of a packed buffer:
+    8 bytes     magic b'PHIPACK1'
+    8 bytes     header length in bytes (little-endian uint64)
+    header      UTF-8 encoded JSON list with one entry per leaf: name, dtype, shape, offset
+    data        the leaves, each starting at a multiple of ALIGNMENT bytes from the start of the buffer
+
+Unpacking creates NumPy views into the buffer instead of copying the data.
+This allows structs to be shared between processes via multiprocessing.shared_memory or mmap:
+
+    shm = SharedMemory(create=True, size=struct.packed_size(state))
+    struct.pack(state, shm.buf)
+    ...
+    state = struct.unpack(shm.buf, template=state)  # in another process, shm = SharedMemory(name)
+
+The buffer must outlive all structs unpacked from it.
+"""
+import json
+from numbers import Number
+
+import numpy as np
+
+from .functions import flatten, map
+from .structdef import DATA
+
+
+MAGIC = b'PHIPACK1'
+ALIGNMENT = 64
+_PREFIX_SIZE = len(MAGIC) + 8
+
+
+def packed_size(struct, item_condition=DATA):
+    """
+    :return: number of bytes required to pack struct, see pack()
+    """
+    header, size = _layout(struct, item_condition)
+    return size
+
+
+def pack(struct, buffer=None, item_condition=DATA):
+    """
+Writes all data leaves of struct to a single contiguous buffer.
+Leaves must be NumPy arrays, numbers or None.
+    :param struct: struct, e.g. a State or CollectiveState
+    :param buffer: (optional) writable buffer of at least packed_size(struct) bytes, e.g. bytearray, mmap or SharedMemory.buf.
+    If None, a new bytearray is allocated.
+    :param item_condition: selects the items to pack, must match the item_condition passed to unpack()
+    :return: buffer
+    """
+    header, size = _layout(struct, item_condition)
+    if buffer is None:
+        buffer = bytearray(size)
+    target = np.frombuffer(buffer, np.uint8)
+    if target.size < size:
+        raise ValueError('Buffer too small to pack struct: %d bytes required but got %d' % (size, target.size))
+    header_bytes = json.dumps(header).encode('utf-8')
+    target[:len(MAGIC)] = np.frombuffer(MAGIC, np.uint8)
+    target[len(MAGIC):_PREFIX_SIZE] = np.frombuffer(np.array([len(header_bytes)], '<u8').tobytes(), np.uint8)
+    target[_PREFIX_SIZE:_PREFIX_SIZE + len(header_bytes)] = np.frombuffer(header_bytes, np.uint8)
+    leaves = flatten(struct, item_condition=item_condition)
+    for entry, leaf in zip(header, leaves):
+        if entry['dtype'] is not None:
+            _view(buffer, entry)[...] = leaf
+    return buffer
+
+
+def unpack(buffer, template, item_condition=DATA):
+    """
+Rebuilds a struct from a buffer created by pack().
+The leaves of the result are NumPy views into buffer. They are read-only if buffer is read-only, e.g. bytes.
+Items are validated as usual unless unpacking happens within struct.unsafe(). Validation may copy leaves and is not required if the packed struct was valid.
+    :param buffer: buffer holding a packed struct
+    :param template: struct with the same structure as the packed struct. Its data is not used.
+    :param item_condition: must match the item_condition passed to pack()
+    :return: struct of the same type as template
+    """
+    entries = {entry['name']: entry for entry in read_header(buffer)}
+
+    def leaf_from_buffer(trace):
+        name = _leaf_name(trace)
+        if name not in entries:
+            raise ValueError("Packed buffer does not contain '%s'. Available: %s" % (name, sorted(entries.keys())))
+        entry = entries[name]
+        if entry['dtype'] is None:
+            return None
+        value = _view(buffer, entry)
+        return value.item() if entry.get('number', False) else value
+
+    return map(leaf_from_buffer, template, trace=True, item_condition=item_condition)
+
+
+def read_header(buffer):
+    """
+    :return: list of dicts describing the leaves stored in a packed buffer, each holding name, dtype, shape and offset
+    """
+    prefix = np.frombuffer(buffer, np.uint8, count=_PREFIX_SIZE)
+    if prefix[:len(MAGIC)].tobytes() != MAGIC:
+        raise ValueError('Buffer does not hold a packed struct')
+    header_size = int(prefix[len(MAGIC):].view('<u8')[0])
+    header_bytes = np.frombuffer(buffer, np.uint8, count=header_size, offset=_PREFIX_SIZE).tobytes()
+    return json.loads(header_bytes.decode('utf-8'))
+
+
+def _layout(struct, item_condition):
+    """
+    :return: header (list of entries), total size in bytes
+    """
+    header = []
+    arrays = []
+    for trace in flatten(struct, trace=True, item_condition=item_condition):
+        entry = {'name': _leaf_name(trace), 'dtype': None, 'shape': None, 'offset': 0}
+        header.append(entry)
+        leaf = trace.value
+        if leaf is None:
+            continue
+        if not isinstance(leaf, (np.ndarray, Number)):
+            raise ValueError("Cannot pack '%s': only NumPy arrays, numbers and None are supported but got %s" % (entry['name'], type(leaf)))
+        if not isinstance(leaf, np.ndarray):
+            entry['number'] = True
+        leaf = np.asarray(leaf)
+        if leaf.dtype.hasobject:
+            raise ValueError("Cannot pack '%s': arrays of dtype object are not supported" % entry['name'])
+        entry.update(dtype=leaf.dtype.str, shape=list(leaf.shape))
+        arrays.append((entry, leaf.nbytes))
+    # Offsets are only known after the header size is fixed, so reserve room for up to 20 digits per offset
+    data_start = _align(_PREFIX_SIZE + len(json.dumps(header).encode('utf-8')) + 20 * len(arrays))
+    offset = data_start
+    for entry, nbytes in arrays:
+        entry['offset'] = offset
+        offset = _align(offset + nbytes)
+    assert _PREFIX_SIZE + len(json.dumps(header).encode('utf-8')) <= data_start
+    return header, offset
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _view(buffer, entry):
+    dtype = np.dtype(str(entry['dtype']))
+    count = int(np.prod(entry['shape'], dtype=np.int64))
+    return np.frombuffer(buffer, dtype, count=count, offset=entry['offset']).reshape(entry['shape'])
+
+
+def _leaf_name(trace):
+    name = trace.path()
+    return '' if name is None else name
@@ -44,3 +44,103 @@ class %s(struct.Struct):
         struct.Struct.__init__(self, **struct.kwargs(locals()%s))%s
     %s
 """ % (struct_name, parameters, ignore, other_init, items)
+
+
+def compile_methods(structtype):
+    """
+Generates and compiles methods specialized to the items of a struct type.
+The generated methods access the item attributes directly instead of looping over Item objects.
+
+Only methods that the struct class inherits unchanged from Struct are generated so that custom implementations are not replaced.
+    :param structtype: StructType
+    :return: dict mapping method names to functions
+    """
+    from .struct import Struct, equal, _copy_function
+    from .context import skip_validate
+    from .structdef import DATA, VARIABLES, CONSTANTS
+    cls = structtype.struct_class
+    items = structtype.items
+    namespace = {
+        'cls': cls,
+        'Struct': Struct,
+        'equal': equal,
+        'skip_validate': skip_validate,
+        'copy_struct': _copy_function(cls),
+        'items_to_validate': structtype.items_to_validate,
+        'DATA': DATA, 'VARIABLES': VARIABLES, 'CONSTANTS': CONSTANTS,
+    }
+    for i, item in enumerate(items):
+        namespace['ITEM_%d' % i] = item
+        namespace['VALIDATE_%d' % i] = item.validation_function
+    methods = {}
+
+    generate_set_items = _inherits_from_struct(cls, '_set_items')
+    if generate_set_items:
+        source = 'def _set_items(self, **kwargs):\n' + _guard('_set_items(self, **kwargs)') + '    for name, value in kwargs.items():\n'
+        for i, item in enumerate(items):
+            source += '        %s name == %r:\n            self._%s = value\n' % ('if' if i == 0 else 'elif', item.name, item.name)
+        source += '        %s:\n            raise TypeError("Struct %%s has no property %%s" %% (self, name))\n' % ('else' if items else 'if True')
+        source += '    return self\n'
+        methods['_set_items'] = source
+
+    if _inherits_from_struct(cls, '__validate__'):
+        source = 'def __validate__(self, changed_items=None):\n' + _guard('__validate__(self, changed_items)') + '    if skip_validate():\n        return\n'
+        source += '    plan = None if changed_items is None else items_to_validate(changed_items)\n'
+        for i, item in enumerate(items):
+            if item.validation_function is not None:
+                source += '    if plan is None or ITEM_%d in plan:\n        self._%s = VALIDATE_%d(self, self._%s)\n' % (i, item.name, i, item.name)
+        source += '    self._validated = True\n'
+        methods['__validate__'] = source
+
+    if _inherits_from_struct(cls, 'copied_with'):
+        source = 'def copied_with(self, **kwargs):\n' + _guard('copied_with(self, **kwargs)') + '    duplicate = copy_struct(self)\n    duplicate._set_items(**kwargs)\n'
+        source += '    if not skip_validate():\n'
+        if _inherits_from_struct(cls, '__validate__'):
+            source += '        duplicate.__validate__(changed_items=tuple(kwargs.keys()) if getattr(self, "_validated", False) else None)\n'
+        else:  # custom __validate__(self) always validates all items
+            source += '        duplicate.__validate__()\n'
+        source += '    else:\n        duplicate._validated = False\n    return duplicate\n'
+        methods['copied_with'] = source
+
+    if _inherits_from_struct(cls, '__to_dict__'):
+        def dict_literal(condition):
+            return '{%s}' % ', '.join('%r: self._%s' % (item.name, item.name) for item in items if condition is None or condition(item))
+        source = 'def __to_dict__(self, item_condition):\n' + _guard('__to_dict__(self, item_condition)')
+        source += '    if item_condition is None:\n        return %s\n' % dict_literal(None)
+        for condition_name, condition in (('DATA', DATA), ('VARIABLES', VARIABLES), ('CONSTANTS', CONSTANTS)):
+            source += '    if item_condition is %s:\n        return %s\n' % (condition_name, dict_literal(condition))
+        source += '    return Struct.__to_dict__(self, item_condition)\n'
+        methods['__to_dict__'] = source
+
+    if _inherits_from_struct(cls, '__eq__'):
+        source = 'def __eq__(self, other):\n' + _guard('__eq__(self, other)') + '    if type(self) != type(other):\n        return False\n'
+        for item in items:
+            source += '    if not equal(self._%s, other._%s):\n        return False\n' % (item.name, item.name)
+        source += '    return True\n'
+        methods['__eq__'] = source
+
+    functions = {}
+    for name, source in methods.items():
+        exec(source, namespace)  # pylint: disable-msg = exec-used
+        functions[name] = namespace[name]
+        functions[name].__generated_source__ = source
+    return functions
+
+
+def _guard(generic_call):
+    # Subclasses that are not compiled themselves as well as explicit calls like Base._set_items(self) from subclasses use the generic implementation
+    return '    if type(self) is not cls:\n        return Struct.%s\n' % generic_call
+
+
+def _inherits_from_struct(cls, method_name):
+    """ True if cls does not override method_name or the override was generated by compile_methods(). """
+    from .struct import Struct
+    for klass in cls.__mro__:
+        if method_name in klass.__dict__:
+            method = klass.__dict__[method_name]
+            return klass is Struct or is_generated(method)
+    return False
+
+
+def is_generated(method):
+    return hasattr(method, '__generated_source__')
@@ -36,20 +36,44 @@ See the struct documentation at documentation/Structs.ipynb
     """
 
     __struct__ = None
+    # _validated is True if all items have been validated, False if created or modified in an unsafe() context
+    __slots__ = ('_validated', '__weakref__')
 
     def __init__(self, **kwargs):
         assert isinstance(self, Struct), 'Struct.__init__() called on %s. Maybe you forgot **' % type(self)
+        self._validated = False
         for item in self.__struct__.items:
             if item.name not in kwargs:
                 kwargs[item.name] = item.default_value
         self._set_items(**kwargs)
         self.__validate__()
 
+    def __copy__(self):
+        # Equivalent to the default shallow copy but avoids the generic __reduce_ex__ protocol
+        return _copy_function(self.__class__)(self)
+
+    def __getstate__(self):
+        state = dict(self.__dict__) if _copy_plan(self.__class__)[1] else {}
+        for name in _copy_plan(self.__class__)[0]:
+            if hasattr(self, name):
+                state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
     def copied_with(self, **kwargs):
         duplicate = copy(self)
         duplicate._set_items(**kwargs)  # pylint: disable-msg = protected-access
         if not skip_validate():  # double-check since __validate__ could be overridden
-            duplicate.__validate__()
+            if _validates_incrementally(self.__class__):
+                # Items that did not change and do not depend on changed items are still valid
+                duplicate.__validate__(changed_items=tuple(kwargs.keys()) if getattr(self, '_validated', False) else None)
+            else:
+                duplicate.__validate__()
+        else:
+            duplicate._validated = False
         return duplicate
 
     def _set_items(self, **kwargs):
@@ -61,15 +85,17 @@ See the struct documentation at documentation/Structs.ipynb
             item.set(self, value)
         return self
 
-    def __validate__(self):
+    def __validate__(self, changed_items=None):
+        """
+Validates all items or, if changed_items is given, only those items and the items depending on them.
+        :param changed_items: names of items that changed or None
+        """
         if not skip_validate():
-            self.__struct__.validate(self)
+            self.__struct__.validate(self, changed_items)
+            self._validated = True
 
     def __to_dict__(self, item_condition):
-        if item_condition is not None:
-            return {item.name: item.get(self) for item in self.__struct__.items if item_condition(item)}
-        else:
-            return {item.name: item.get(self) for item in self.__struct__.items}
+        return {item.name: item.get(self) for item in self.__struct__.items_where(item_condition)}
 
     def __properties_dict__(self):
         result = {item.name: properties_dict(getattr(self, item.name)) for item in self.__struct__.items if not item.holds_data}
@@ -103,6 +129,50 @@ See the struct documentation at documentation/Structs.ipynb
 structdef.STRUCT_CLASSES = [Struct]
 
 
+_INCREMENTAL_VALIDATION = {}  # class -> bool
+_COPY_PLANS = {}  # class -> (slot names, has __dict__)
+_COPY_FUNCTIONS = {}  # class -> function(struct) -> shallow copy
+
+
+def _validates_incrementally(cls):
+    """ Classes overriding __validate__ implement the original hook __validate__(self) and always validate all items. """
+    try:
+        return _INCREMENTAL_VALIDATION[cls]
+    except KeyError:
+        from .python_generator import _inherits_from_struct  # pylint: disable-msg = cyclic-import
+        result = _inherits_from_struct(cls, '__validate__')
+        _INCREMENTAL_VALIDATION[cls] = result
+        return result
+
+
+def _copy_plan(cls):
+    try:
+        return _COPY_PLANS[cls]
+    except KeyError:
+        plan = structdef.slot_names(cls), any('__dict__' in klass.__dict__ for klass in cls.__mro__)
+        _COPY_PLANS[cls] = plan
+        return plan
+
+
+def _copy_function(cls):
+    """ Generates a shallow copy function specialized to the slots of cls. """
+    try:
+        return _COPY_FUNCTIONS[cls]
+    except KeyError:
+        pass
+    slots, has_dict = _copy_plan(cls)
+    source = 'def copy_struct(self):\n    duplicate = cls.__new__(cls)\n'
+    if has_dict:
+        source += '    duplicate.__dict__.update(self.__dict__)\n'
+    for name in slots:
+        source += '    try:\n        duplicate.{0} = self.{0}\n    except AttributeError:\n        pass\n'.format(name)
+    source += '    return duplicate\n'
+    namespace = {'cls': cls}
+    exec(source, namespace)
+    _COPY_FUNCTIONS[cls] = namespace['copy_struct']
+    return namespace['copy_struct']
+
+
 def to_dict(struct, item_condition=None):
     if isinstance(struct, Struct):
         return struct.__to_dict__(item_condition)
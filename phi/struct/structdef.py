@@ -1,5 +1,6 @@
 import typing  # pylint: disable-msg = unused-import  # this is used in # type
 from typing import Dict
+import weakref
 import six
 
 
@@ -10,13 +11,31 @@ _STRUCT_REGISTER = {}  # type: Dict[typing.Type, StructType]
 _UNUSED_ITEMS = {}  # type: Dict[str, Item] # only temporary, before class decorator called
 
 
-def definition():
+def definition(slots=False, compile=False, fingerprint=False):
     """
 Required decorator for custom struct classes.
+    :param slots: If True, the class is re-created with __slots__ for all of its items (and for any names declared in its own __slots__ attribute).
+    Instances then store their items without a per-object __dict__ which saves memory and speeds up copying.
+    Instances only lack a __dict__ if all struct base classes use slots as well. Subclasses that do not use slots get a __dict__ as usual.
+    :param compile: If True, generates specialized versions of _set_items, __validate__, copied_with, __to_dict__ and __eq__ for this class
+    which access items directly (see python_generator.compile_methods). Methods overridden by the class or its bases are kept.
+    :param fingerprint: If True, __eq__ compares the content fingerprints of all items (see struct.fingerprint) first and only falls back to element-wise comparison if they differ.
+    __hash__ is not derived from the fingerprint because approximately equal instances must have equal hashes. Caches should use struct.fingerprint() as key instead.
+    This assumes that arrays held by instances are never modified in-place.
     """
+    # pylint: disable-msg = redefined-builtin
     def decorator(cls):
+        from . import python_generator  # pylint: disable-msg = cyclic-import
         structtype = _build_type(cls)
+        if slots:
+            cls = _slotted_class(cls, structtype)
         cls.__struct__ = structtype
+        if compile:
+            for name, function in python_generator.compile_methods(structtype).items():
+                setattr(cls, name, function)
+        if fingerprint:
+            from .fingerprint import fingerprint_eq  # pylint: disable-msg = cyclic-import
+            cls.__eq__ = fingerprint_eq(cls.__eq__)
         return cls
     return decorator
 
@@ -84,6 +103,32 @@ def _build_type(cls):
     return structtype
 
 
+def _slotted_class(cls, structtype):
+    inherited_slots = set(slot_names(cls.__bases__[0])) if len(cls.__bases__) == 1 else set()
+    declared = cls.__dict__.get('__slots__', ())
+    declared = (declared,) if isinstance(declared, six.string_types) else tuple(declared)
+    item_slots = tuple('_' + item.name for item in structtype.items if '_' + item.name not in inherited_slots and '_' + item.name not in declared)
+    namespace = {key: value for key, value in cls.__dict__.items() if key not in ('__dict__', '__weakref__') + declared}
+    namespace['__slots__'] = declared + item_slots
+    slotted = type(cls)(cls.__name__, cls.__bases__, namespace)
+    del _STRUCT_REGISTER[cls]
+    _STRUCT_REGISTER[slotted] = structtype
+    structtype.struct_class = slotted
+    return slotted
+
+
+def slot_names(cls):
+    """
+    :return: names of all attributes stored in __slots__ of cls and its base classes, excluding __dict__ and __weakref__
+    """
+    names = []
+    for klass in reversed(cls.__mro__):
+        declared = klass.__dict__.get('__slots__', ())
+        declared = (declared,) if isinstance(declared, six.string_types) else declared
+        names.extend(name for name in declared if name not in ('__dict__', '__weakref__') and name not in names)
+    return tuple(names)
+
+
 def get_type(struct_class):
     """
     :rtype: StructType
@@ -102,14 +147,65 @@ One StructType is associated with each defined struct (subclass of Struct) and s
         self.items = _order_by_dependencies(item_dict, self)
         self.variables = tuple(filter(lambda item: item.is_variable, self.items))
         self.constants = tuple(filter(lambda item: not item.is_variable, self.items))
+        self._items_by_condition = weakref.WeakKeyDictionary()  # item_condition -> tuple of items
+        self._dependents = {item: [] for item in self.items}  # item -> items that declare a dependency on it
+        for item in self.items:
+            for dependency in _get_dependencies(item, item_dict, self):
+                self._dependents[dependency].append(item)
+        self._validation_plans = {}  # frozenset of changed item names -> tuple of items to validate
 
     def find(self, name):
         return self.item_dict[name]
 
-    def validate(self, struct):
-        for item in self.items:
+    def items_where(self, item_condition):
+        """
+Returns the items that satisfy item_condition in dependency order.
+The result is cached per condition so that repeated traversals do not re-evaluate the condition.
+        :param item_condition: function(Item) -> bool or None for all items
+        :return: tuple of Items
+        """
+        if item_condition is None:
+            return tuple(self.items)
+        try:
+            return self._items_by_condition[item_condition]
+        except KeyError:
+            items = tuple(filter(item_condition, self.items))
+            self._items_by_condition[item_condition] = items
+            return items
+
+    def validate(self, struct, changed_items=None):
+        """
+Validates the items of struct in dependency order.
+        :param changed_items: names of the items that changed since struct was last validated or None to validate all items.
+        If given, only these items and the items that depend on them (directly or indirectly) are validated.
+        """
+        items = self.items if changed_items is None else self.items_to_validate(changed_items)
+        for item in items:
             item.validate(struct)
 
+    def items_to_validate(self, changed_items):
+        """
+        :param changed_items: collection of item names
+        :return: the changed items and all items depending on them, in dependency order
+        """
+        key = frozenset(changed_items)
+        try:
+            return self._validation_plans[key]
+        except KeyError:
+            pass
+        if not key.issubset(self.item_dict.keys()):  # e.g. CollectiveState accepts state names
+            return tuple(self.items)
+        affected = set()
+        pending = [self.item_dict[name] for name in key]
+        while pending:
+            item = pending.pop()
+            if item not in affected:
+                affected.add(item)
+                pending.extend(self._dependents[item])
+        plan = tuple(item for item in self.items if item in affected)
+        self._validation_plans[key] = plan
+        return plan
+
     @property
     def item_names(self):
         return [item.name for item in self.items]
@@ -207,15 +303,22 @@ class DerivedProperty(object):
 def _order_by_dependencies(item_dict, owner):
     result = []
     for item in item_dict.values():
-        _recursive_deps_add(item, item_dict, result, owner)
+        _recursive_deps_add(item, item_dict, result, owner, [])
     return result
 
 
-def _recursive_deps_add(item, item_dict, result_list, owner):
-    if item in result_list: return
-    dependencies = _get_dependencies(item, item_dict, owner)
-    for dependency in dependencies:
-        _recursive_deps_add(dependency, item_dict, result_list, owner)
+def _recursive_deps_add(item, item_dict, result_list, owner, in_progress):
+    """
+Adds item to result_list after its dependencies.
+Items may depend on each other, e.g. a validator reading an item that is itself validated using this item.
+Such cycles are broken at the item that is reached again, which is then validated first with the unvalidated value of the other item.
+    """
+    if item in result_list or item in in_progress: return
+    in_progress.append(item)
+    positions = list(item_dict.values())
+    for dependency in sorted(_get_dependencies(item, item_dict, owner), key=positions.index):
+        _recursive_deps_add(dependency, item_dict, result_list, owner, in_progress)
+    in_progress.remove(item)
     result_list.append(item)
 
 
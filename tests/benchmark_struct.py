@@ -0,0 +1,23 @@
+"""
+Microbenchmark of struct traversals.
+Not collected by the test runners, run with: python -m tests.benchmark_struct
+"""
+import timeit
+
+from phi import struct
+from phi.physics.collective import CollectiveState
+from phi.physics.domain import Domain
+from phi.physics.fluid import Fluid
+
+
+def benchmark_traversals(fluid_count=16, repetitions=20):
+    state = CollectiveState(tuple(Fluid(Domain([16, 16]), name='fluid%d' % i) for i in range(fluid_count)))
+    leaf_count = len(struct.flatten(state))
+    for name, function in (('flatten', struct.flatten), ('identity map', lambda s: struct.map(lambda x: x, s))):
+        with struct.unsafe():
+            seconds = timeit.timeit(lambda: function(state), number=repetitions)
+        print('%s: %.3f ms per traversal of %d leaves' % (name, seconds / repetitions * 1000, leaf_count))
+
+
+if __name__ == '__main__':
+    benchmark_traversals()
@@ -35,6 +35,54 @@ class MyStruct(Parent):
         return self.age >= 18
 
 
+@struct.definition(slots=True)
+class SlottedStruct(struct.Struct):
+
+    __slots__ = ('_cache',)
+
+    def __init__(self, value, **kwargs):
+        struct.Struct.__init__(self, **struct.kwargs(locals()))
+        self._cache = None
+
+    @struct.variable()
+    def value(self, value): return value
+
+
+@struct.definition()
+class UnslottedChild(SlottedStruct):
+
+    @struct.constant(default='child')
+    def label(self, label): return label
+
+
+@struct.definition(compile=True)
+class CompiledStruct(MyStruct):
+
+    @struct.variable(default=1, dependencies='age')
+    def velocity(self, velocity): return velocity * 2
+
+
+@struct.definition()
+class UncompiledChild(CompiledStruct):
+
+    @struct.constant(default='child')
+    def label(self, label): return label
+
+
+@struct.definition(compile=True)
+class CustomValidation(struct.Struct):
+
+    def __init__(self, value, **kwargs):
+        struct.Struct.__init__(self, **struct.kwargs(locals()))
+
+    @struct.variable()
+    def value(self, value): return value
+
+    def __validate__(self):
+        struct.Struct.__validate__(self)
+        self.validations = getattr(self, 'validations', 0) + 1
+
+
 class TestStruct(TestCase):
 
     def test_custom_struct_typedef(self):
@@ -57,3 +105,41 @@ class TestStruct(TestCase):
         self.assertEqual(age, {'a': [26]})
         adult = MyStruct.is_adult(obj)
         self.assertEqual(adult, {'a': [True]})
+
+    def test_incremental_validation(self):
+        structtype = get_type(MyStruct)
+        self.assertEqual(('age2', 'a_super_dependent'), tuple(item.name for item in structtype.items_to_validate(['age2'])))
+        self.assertEqual({'parent', 'density', 'age', 'age2', 'a_super_dependent'}, set(item.name for item in structtype.items_to_validate(['parent'])))
+        self.assertEqual(('density',), tuple(item.name for item in structtype.items_to_validate(['density'])))
+        with struct.unsafe():
+            unsafe = MyStruct(age='invalid')
+        self.assertFalse(unsafe._validated)
+        self.assertTrue(unsafe.copied_with(density=1)._validated)
+        for custom in (CustomValidation(1), struct.Struct.copied_with(CustomValidation(1), value=0)):
+            self.assertEqual(custom.copied_with(value=2).value, 2)  # overridden __validate__(self) is called without arguments
+
+    def test_slots(self):
+        slotted = SlottedStruct(1)
+        self.assertFalse(hasattr(slotted, '__dict__'))
+        self.assertIs(get_type(SlottedStruct).struct_class, SlottedStruct)
+        copied = slotted.copied_with(value=2)
+        self.assertEqual((1, 2, None), (slotted.value, copied.value, copied._cache))
+        child = UnslottedChild(1).copied_with(label='x')
+        self.assertTrue(hasattr(child, '__dict__'))
+        self.assertEqual((1, 'x'), (child.value, child.label))
+
+    def test_compile(self):
+        self.assertTrue(hasattr(CompiledStruct.copied_with, '__generated_source__'))
+        compiled = CompiledStruct()
+        self.assertEqual(2, compiled.velocity)
+        self.assertEqual(4, compiled.copied_with(velocity=2).velocity)
+        self.assertEqual(4, compiled.copied_with(age=30).velocity)  # velocity depends on age
+        self.assertEqual(2, compiled.copied_with(density=1).velocity)
+        self.assertEqual({'density': 0, 'velocity': 2}, struct.variables(compiled))
+        self.assertEqual(compiled, CompiledStruct())
+        self.assertNotEqual(compiled, compiled.copied_with(density=1))
+        with self.assertRaises(TypeError):
+            compiled.copied_with(unknown=1)
+        child = UncompiledChild().copied_with(label='x', velocity=3)
+        self.assertEqual(('x', 6), (child.label, child.velocity))
+        self.assertIn('label', struct.constants(child))
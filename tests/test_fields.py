@@ -4,7 +4,7 @@ import numpy as np
 
 from phi import struct, math
 from phi.geom import box, AABox
-from phi.physics.field import CenteredGrid, Field, unstack_staggered_tensor, StaggeredGrid, data_bounds
+from phi.physics.field import CenteredGrid, Field, unstack_staggered_tensor, StaggeredGrid, data_bounds, lazy_evaluation
 from phi.physics.field.flag import SAMPLE_POINTS
 from phi.physics.field.staggered_grid import stack_staggered_components
 
@@ -52,6 +52,11 @@ class TestFields(TestCase):
         tensor2 = stack_staggered_components(components)
         np.testing.assert_equal(tensor, tensor2)
 
+    def test_flags_revalidated(self):
+        from phi.physics.field import DIVERGENCE_FREE
+        grid = CenteredGrid(np.zeros([1, 4, 4, 2]), flags=[DIVERGENCE_FREE])
+        self.assertRaises(ValueError, lambda: grid.copied_with(data=np.zeros([1, 4, 4, 1])))
+
     def test_points_flag(self):
         data = math.zeros([1, 2, 3, 1])
         f = CenteredGrid(data, box[0:2, 0:3])
@@ -97,3 +102,255 @@ class TestFields(TestCase):
         np.testing.assert_equal(field.sample_at([[0.5,1.5]]), [[[2]]])
         np.testing.assert_equal(field.sample_at([[-10,0.5]]), [[[1]]])
         np.testing.assert_equal(field.sample_at([[-10,1.5]]), [[[2]]])
+
+    def test_ghost_cells(self):
+        data = np.random.rand(2, 6, 5, 1).astype(np.float32)
+        for extrapolation in ('boundary', 'constant', 'periodic', [('boundary', 'constant'), 'periodic']):
+            grid = CenteredGrid(data, extrapolation=extrapolation)
+            ghost_grid = grid.with_ghost_cells(1)
+            self.assertIsNotNone(math.halo.find_halo(ghost_grid.data))
+            np.testing.assert_equal(ghost_grid.data, grid.data)
+            np.testing.assert_equal(ghost_grid.padded([[1, 1], [1, 1]]).data, grid.padded([[1, 1], [1, 1]]).data)
+            points = np.random.rand(2, 7, 2) * 8 - 1
+            np.testing.assert_allclose(ghost_grid.sample_at(points), grid.sample_at(points), rtol=1e-5)
+            derived = ghost_grid * 2 + grid  # element-wise operations write into new halo buffers
+            self.assertIsNotNone(math.halo.find_halo(derived.data))
+            np.testing.assert_equal(derived.data, data * 3)
+            padded = derived.padded([[1, 1], [1, 1]]).data
+            self.assertTrue(np.shares_memory(padded, derived.data))  # padding allocates nothing
+            self.assertFalse(padded.flags.writeable)
+            np.testing.assert_equal(padded, grid.padded([[1, 1], [1, 1]]).data * 3)
+            other = np.random.rand(2, 6, 5, 1)
+            self.assertIs(ghost_grid.copied_with(data=other).data, other)  # new data is not copied into a halo buffer
+        grid = CenteredGrid(data)
+        ghost_grid = grid.with_ghost_cells(1)
+        np.testing.assert_equal(ghost_grid.laplace().data, grid.laplace().data)
+        np.testing.assert_equal(StaggeredGrid.gradient(ghost_grid).staggered_tensor(), StaggeredGrid.gradient(grid).staggered_tensor())
+
+    def test_points_cache(self):
+        points = CenteredGrid.getpoints(box[0:4, 0:8], [4, 8])
+        self.assertIs(points, CenteredGrid.getpoints(AABox([0, 0], [4, 8]), np.array([4, 8])))
+        self.assertIsNot(points, CenteredGrid.getpoints(box[0:4, 0:8], [4, 4]))
+        self.assertFalse(points.data.flags.writeable)
+        np.testing.assert_equal(points.data[0, 0, 0], [0.5, 0.5])
+        grid = StaggeredGrid(np.zeros([1, 5, 9, 2]), box[0:4, 0:8])
+        self.assertIs(grid.center_points, points)
+
+    def test_resampling_plan(self):
+        from phi.physics.field import resampling
+        for extrapolation in ('boundary', 'constant', 'periodic'):
+            grid = CenteredGrid(np.random.rand(2, 12, 10, 1), box[0:16, 0:10], extrapolation=extrapolation)
+            target = CenteredGrid(np.zeros([1, 16, 7, 1]), box[-2:18, 1:9])
+            resampled = grid.at(target)
+            self.assertIsInstance(resampling.resampling_plan(grid, target), resampling.GatherPlan)
+            self.assertEqual(resampled.data.shape, (2, 16, 7, 1))
+            for batch in range(2):
+                expected = grid.copied_with(data=grid.data[batch:batch + 1]).sample_at(target.points.data)
+                np.testing.assert_allclose(resampled.data[batch:batch + 1], expected, rtol=1e-6)
+            self.assertIs(resampling.resampling_plan(grid, target), resampling.resampling_plan(grid.copied_with(data=grid.data * 2), target))
+        staggered = StaggeredGrid(np.random.rand(1, 9, 9, 2), box[0:8, 0:8])
+        centers = staggered.at_centers()
+        self.assertIsInstance(resampling.resampling_plan(staggered.data[0], staggered.center_points), resampling.InterpolationPlan)
+        np.testing.assert_allclose(centers.data[..., 0], (staggered.data[0].data[:, 1:, :, 0] + staggered.data[0].data[:, :-1, :, 0]) / 2)
+
+    def test_grid_advection(self):
+        from phi.physics.field import advect
+        for extrapolation in ('boundary', 'constant', 'periodic'):
+            velocity = StaggeredGrid(np.random.rand(2, 9, 11, 2) * 4 - 2, box[0:16, 0:20], extrapolation=extrapolation)
+            density = CenteredGrid(np.random.rand(2, 8, 10, 1), box[0:16, 0:20], extrapolation=extrapolation)
+            fused = advect.grid_semi_lagrangian([density, velocity], velocity, 0.8)
+            single = advect.semi_lagrangian(density, velocity, 0.8), advect.semi_lagrangian(velocity, velocity, 0.8)
+            self.assertIsInstance(fused[1], StaggeredGrid)
+            self.assertIsInstance(single[1], StaggeredGrid)
+            # reference: sample the fields at backtraced world positions
+            for batch in range(2):
+                x = density.points.data - velocity.at(density).data * 0.8
+                reference = density.copied_with(data=density.data[batch:batch + 1]).sample_at(x[batch:batch + 1])
+                np.testing.assert_allclose(fused[0].data[batch:batch + 1], reference, atol=1e-5)
+                np.testing.assert_allclose(single[0].data[batch:batch + 1], reference, atol=1e-5)
+                for axis, component in enumerate(velocity.data):
+                    x = component.points.data - velocity.at(component).data * 0.8
+                    reference = component.copied_with(data=component.data[batch:batch + 1]).sample_at(x[batch:batch + 1])
+                    np.testing.assert_allclose(fused[1].data[axis].data[batch:batch + 1], reference, atol=1e-5)
+                    np.testing.assert_allclose(single[1].data[axis].data[batch:batch + 1], reference, atol=1e-5)
+
+    def test_mac_averaging(self):
+        data = np.random.rand(2, 5, 4, 1)
+        for extrapolation, lower, upper in (('boundary', data[:, :1], data[:, -1:]), ('constant', 0, 0), ('periodic', data[:, -1:], data[:, :1])):
+            centered = CenteredGrid(data, box[0:5, 0:4], extrapolation=extrapolation)
+            staggered = StaggeredGrid(np.zeros([2, 6, 5, 2]), box[0:5, 0:4], extrapolation=extrapolation)
+            faces = centered.at(staggered)
+            self.assertIsInstance(faces, StaggeredGrid)
+            np.testing.assert_equal(faces.data[0].data[:, 1:-1], (data[:, 1:] + data[:, :-1]) / 2)
+            np.testing.assert_equal(faces.data[0].data[:, :1], (data[:, :1] + lower) / 2)
+            np.testing.assert_equal(faces.data[0].data[:, -1:], (data[:, -1:] + upper) / 2)
+            centers = faces.at_centers()
+            self.assertEqual(centers.data.shape, (2, 5, 4, 2))
+            np.testing.assert_equal(centers.data[..., :1], (faces.data[0].data[:, 1:] + faces.data[0].data[:, :-1]) / 2)
+
+    def test_packed_staggered(self):
+        tensor = np.random.rand(2, 5, 4, 2)
+        grid = StaggeredGrid(tensor)
+        self.assertIs(grid.data[0].data.base, tensor)
+        self.assertTrue(grid.staggered_tensor().flags.writeable)  # grids of caller-owned tensors are not packed
+        self.assertFalse(np.shares_memory(grid.staggered_tensor(), tensor))
+        packed = grid.packed()
+        self.assertIsNot(packed, grid)
+        buffer = packed.staggered_tensor()
+        self.assertIs(packed.packed(), packed)
+        self.assertFalse(buffer.flags.writeable)
+        np.testing.assert_equal(buffer, StaggeredGrid([c.data for c in grid.data]).staggered_tensor())
+        for component, packed_component in zip(grid.data, packed.data):
+            np.testing.assert_equal(component.data, packed_component.data)
+            self.assertTrue(np.shares_memory(packed_component.data, buffer))
+        result = packed * 2 + packed
+        self.assertTrue(np.shares_memory(result.data[1].data, result.staggered_tensor()))
+        np.testing.assert_allclose(result.staggered_tensor(), buffer * 3)
+        separate = packed.with_data([c.data + 1 for c in packed.data])
+        np.testing.assert_allclose((separate - packed).data[0].data, 1)
+
+    def test_extrapolate_by_distance(self):
+        from phi.physics.field.util import extrapolate, extrapolate_by_distance
+        valid = np.zeros([2, 12, 10, 1], np.float32)
+        valid[:, :, :5] = 1
+        valid[1, 4:8, 5:7] = 1
+        for field in (CenteredGrid(np.random.rand(1, 12, 10, 2)), StaggeredGrid(np.random.rand(2, 13, 11, 2))):
+            reference, reference_distance = extrapolate(field, valid[:1], voxel_distance=3)
+            fast, distance = extrapolate_by_distance(field, valid[:1], voxel_distance=3)
+            np.testing.assert_equal(distance, reference_distance)
+            self.assertEqual(type(fast), type(field))
+            if isinstance(field, CenteredGrid):
+                np.testing.assert_equal(fast.data, reference.data)
+            fast, distance = extrapolate_by_distance(field, valid, voxel_distance=3)
+            self.assertEqual(distance.shape, (2, 12, 10, 1))
+        grid = CenteredGrid(np.arange(12 * 10, dtype=np.float32).reshape([1, 12, 10, 1]))
+        fast, _ = extrapolate_by_distance(grid, valid, voxel_distance=2)
+        np.testing.assert_equal(fast.data[0, :, :5], grid.data[0, :, :5])  # valid cells unchanged
+        np.testing.assert_equal(fast.data[0, :, 5:7], np.repeat(grid.data[0, :, 4:5], 2, axis=1))  # nearest valid value
+        np.testing.assert_equal(fast.data[0, :, 7:], grid.data[0, :, 7:])  # beyond voxel_distance
+        staggered = StaggeredGrid(np.arange(13 * 11 * 2, dtype=np.float32).reshape([1, 13, 11, 2]))
+        fast, _ = extrapolate_by_distance(staggered, valid[:1], voxel_distance=2)
+        y, x = [component.data[0] for component in staggered.data]
+        fast_y, fast_x = [component.data[0] for component in fast.data]
+        np.testing.assert_equal(fast_y[:, :5], y[:, :5])  # faces of valid cells unchanged
+        np.testing.assert_equal(fast_y[:, 5:7], np.repeat(y[:, 4:5], 2, axis=1))
+        np.testing.assert_equal(fast_y[:, 7:], y[:, 7:])
+        np.testing.assert_equal(fast_x[:, :6], x[:, :6])  # face 5 lies between a valid and an invalid cell
+        np.testing.assert_equal(fast_x[:, 6:8], np.repeat(x[:, 5:6], 2, axis=1))
+        np.testing.assert_equal(fast_x[:, 8:], x[:, 8:])
+
+    def test_surface_mask(self):
+        from phi.physics.field.util import create_surface_mask, erode
+        for shape in ([2, 9, 7, 1], [1, 6, 5, 4, 1]):
+            mask = (np.random.rand(*shape) > 0.3).astype(np.float32)
+            padded = np.pad(mask, [[0, 0]] + [[1, 1]] * (len(shape) - 2) + [[0, 0]], 'constant')
+            neighbours = [padded[(slice(None),) + tuple(slice(1 + o, 1 + o + n) for o, n in zip(offset, shape[1:-1])) + (slice(None),)]
+                          for offset in np.ndindex(*[3] * (len(shape) - 2)) for offset in [np.array(offset) - 1]]
+            np.testing.assert_equal(erode(mask), np.min(neighbours, axis=0))
+            np.testing.assert_equal(create_surface_mask(mask), mask * (1 - np.min(neighbours, axis=0)))
+        mask = np.zeros([1, 5, 5, 1], np.float32)
+        mask[0, 1:, 1:4] = 1
+        np.testing.assert_equal(create_surface_mask(mask)[0, ..., 0], [[0, 0, 0, 0, 0], [0, 1, 1, 1, 0], [0, 1, 0, 1, 0], [0, 1, 0, 1, 0], [0, 1, 1, 1, 0]])
+
+    def test_point_advection(self):
+        from phi.physics.field import advect, SampledField
+        grid_box = box[0:20, 0:20]
+        # rotation around the center, linear in space so that it is interpolated exactly
+        components = []
+        for axis in range(2):
+            faces = CenteredGrid.getpoints(AABox([-0.5, 0] if axis == 0 else [0, -0.5], [20.5, 20] if axis == 0 else [20, 20.5]), [21, 20] if axis == 0 else [20, 21]).data
+            components.append(-(faces[..., 1:2] - 10) if axis == 0 else faces[..., 0:1] - 10)
+        velocity = StaggeredGrid(components, grid_box)
+        start = np.array([[[10., 15.], [13., 10.]]])
+        radius = np.linalg.norm(start - 10, axis=-1)
+        errors = {}
+        for order in (1, 2, 4):
+            x = start
+            for _ in range(20):
+                x = advect.points(x, velocity, 0.1, order=order)
+            errors[order] = np.max(np.abs(np.linalg.norm(x - 10, axis=-1) - radius))
+            np.testing.assert_allclose(np.arctan2(x[0, 0, 0] - 10, x[0, 0, 1] - 10), -2, atol=0.01)  # angular velocity -1
+        self.assertLess(errors[4], 1e-5)
+        self.assertLess(errors[4], errors[2])
+        self.assertLess(errors[2], errors[1])
+        uniform = StaggeredGrid(np.ones([2, 21, 21, 2]), grid_box)
+        markers = SampledField('markers', np.random.rand(2, 30, 2) * 10 + 5, 2.)
+        advected = advect.points(markers, uniform, 1.5, order=4)
+        np.testing.assert_allclose(advected.sample_points, markers.sample_points + 1.5)
+        self.assertEqual(advected.data, 2.)
+
+    def test_particle_transfer(self):
+        from phi.physics.field import SampledField, particles_to_grid, grid_to_particles
+        from phi.physics.field.transfer import cell_order
+        rng = np.random.RandomState(0)
+        grid_box = box[0:8, 0:6]
+        points = rng.rand(2, 50, 2) * [7, 5] + 0.5  # inside the outermost cell centers
+        values = rng.rand(2, 50, 2)
+        grid = CenteredGrid(rng.rand(2, 8, 6, 2), grid_box)
+        staggered = StaggeredGrid(rng.rand(2, 9, 7, 2), grid_box)
+        np.testing.assert_allclose(grid_to_particles(grid, points), grid.sample_at(points))
+        np.testing.assert_allclose(grid_to_particles(staggered, points), staggered.sample_at(points))
+        scattered = particles_to_grid(points, values, grid_box, [8, 6])
+        np.testing.assert_allclose(scattered.sum(axis=(1, 2)), values.sum(axis=1))
+        # P2G is the adjoint of G2P
+        self.assertAlmostEqual(np.sum(scattered * grid.data), np.sum(values * grid_to_particles(grid, points)))
+        components = particles_to_grid(points, values, grid_box, [8, 6], staggered=True)
+        self.assertEqual([c.shape for c in components], [(2, 9, 6, 1), (2, 8, 7, 1)])
+        self.assertAlmostEqual(sum(np.sum(c * s.data) for c, s in zip(components, staggered.data)), np.sum(values * grid_to_particles(staggered, points)))
+        mean = particles_to_grid(points, 3., grid_box, [8, 6], mode='mean')
+        np.testing.assert_allclose(mean[mean > 0], 3)
+        counts = SampledField('markers', points, 1).at(CenteredGrid(np.zeros([1, 8, 6, 1]), grid_box)).data
+        np.testing.assert_equal(counts.sum(axis=(1, 2, 3)), [50, 50])
+        np.testing.assert_equal(counts[1, 3, 2, 0], np.sum(np.all(np.floor(points[1]) == [3, 2], axis=-1)))
+        order = cell_order(points, grid_box, [8, 6])
+        sorted_points = np.take_along_axis(points, order[..., None], 1)
+        np.testing.assert_allclose(particles_to_grid(sorted_points, 1, grid_box, [8, 6]), particles_to_grid(points, 1, grid_box, [8, 6]))
+
+    def test_distribute_points(self):
+        from phi.physics.field.sampled import distribute_points, distribute_points_flat
+        density = np.zeros([2, 4, 5, 1], np.float32)
+        density[:, 1:3, 2] = 1
+        points = distribute_points(density, particles_per_cell=2, distribution='center')
+        self.assertEqual(points.shape, (2, 4, 2))
+        np.testing.assert_equal(points[0], [[1.5, 2.5], [1.5, 2.5], [2.5, 2.5], [2.5, 2.5]])
+        uniform = distribute_points(density, particles_per_cell=3)
+        np.testing.assert_equal(np.floor(uniform), np.repeat(np.floor(points[:, ::2]), 3, axis=1))
+        density[1, 0, 0] = 1  # ragged
+        self.assertRaises(ValueError, distribute_points, density)
+        padded = distribute_points(density, distribution='center', pad_value=-1)
+        np.testing.assert_equal(padded[:, :, 0], [[1.5, 2.5, -1], [0.5, 1.5, 2.5]])
+        flat, offsets = distribute_points_flat(density, particles_per_cell=2)
+        np.testing.assert_equal(offsets, [0, 4, 10])
+        np.testing.assert_equal(np.floor(flat[4:6]), [[0, 0], [0, 0]])
+
+    def test_implicit_diffusion(self):
+        from phi.physics.field.util import diffuse, implicit_diffusion_matrix
+        data = np.random.rand(2, 16, 12, 2).astype(np.float32)
+        for extrapolation in ('boundary', 'constant'):
+            grid = CenteredGrid(data, box[0:8, 0:6], extrapolation=extrapolation)
+            diffused = diffuse(grid, 2., implicit=True)
+            self.assertEqual(diffused.data.dtype, np.float32)
+            np.testing.assert_allclose(diffused.data - 2. * diffused.laplace(), data, atol=1e-4)  # backward Euler step
+            self.assertLessEqual(diffused.data.max(), data.max())
+            self.assertGreaterEqual(diffused.data.min(), min(data.min(), 0))
+            self.assertIs(implicit_diffusion_matrix(grid.resolution, grid.dx, extrapolation, 2.), implicit_diffusion_matrix(grid.resolution, grid.dx, extrapolation, 2.))
+        conserved = diffuse(CenteredGrid(data, extrapolation='boundary'), 100., implicit=True)
+        np.testing.assert_allclose(conserved.data.sum(axis=(1, 2)), data.sum(axis=(1, 2)), rtol=1e-4)
+        np.testing.assert_array_less(np.std(conserved.data, axis=(1, 2)), 0.1 * np.std(data, axis=(1, 2)))
+        self.assertRaises(NotImplementedError, lambda: diffuse(CenteredGrid(data, extrapolation=['periodic', 'boundary']), 2., implicit=True))  # mixed extrapolation
+
+    def test_lazy_evaluation(self):
+        a = CenteredGrid(np.random.rand(2, 200, 100, 1))  # large enough to be evaluated in chunks
+        b = CenteredGrid(np.random.rand(1, 200, 100, 1))
+        staggered = StaggeredGrid(np.random.rand(2, 41, 31, 2))
+        with lazy_evaluation():
+            lazy = ((a + b) * 2 - a / (b + 1)) ** 2
+            lazy_staggered = staggered * 2 - staggered
+            self.assertNotIn('_data', lazy.__dict__)
+            np.testing.assert_equal(lazy.resolution, [200, 100])
+        np.testing.assert_allclose(lazy.data, (((a + b) * 2 - a / (b + 1)) ** 2).data)
+        np.testing.assert_allclose(lazy_staggered.staggered_tensor(), staggered.staggered_tensor())
+        ghost_grid = a.with_ghost_cells(1)
+        with lazy_evaluation():
+            derived = ghost_grid * 2
+        self.assertIsNotNone(math.halo.find_halo(derived.data))
@@ -3,15 +3,43 @@ from unittest import TestCase
 import numpy
 
 from phi import struct, math
-from phi.geom import Sphere
+from phi.geom import AABox, Sphere, Geometry
 from phi.physics.domain import Domain
-from phi.physics.field import StaggeredGrid
+from phi.physics.field import CenteredGrid, StaggeredGrid
 from phi.physics.field.effect import Fan, Inflow
 from phi.physics.material import CLOSED, OPEN
-from phi.physics.fluid import Fluid, INCOMPRESSIBLE_FLOW
+from phi.physics.fluid import Fluid, INCOMPRESSIBLE_FLOW, divergence_free
+from phi.physics.obstacle import Obstacle
+from phi.physics.pressuresolver.sparse import SparseCG
 from phi.physics.world import World
 
 
+@struct.definition()
+class _MaskOnlySphere(Geometry):
+    """ Sphere without signed distance """
+
+    def __init__(self, sphere, **kwargs):
+        Geometry.__init__(self, **struct.kwargs(locals()))
+
+    @struct.constant()
+    def sphere(self, sphere):
+        return sphere
+
+    @property
+    def rank(self):
+        return self.sphere.rank
+
+    def value_at(self, location):
+        return self.sphere.value_at(location)
+
+
+class _BinaryMaskCG(SparseCG):
+
+    def __init__(self):
+        SparseCG.__init__(self, accuracy=1e-8)
+        self.supports_continuous_masks = False
+
+
 class TestFluid(TestCase):
 
     def test_direct_fluid(self):
@@ -36,6 +64,50 @@ class TestFluid(TestCase):
         fluid = Fluid(Domain([16, 16], boundaries=[(CLOSED, OPEN), CLOSED]))
         INCOMPRESSIBLE_FLOW.step(fluid)
 
+    def test_pressure_matrix_cache(self):
+        from phi.physics.pressuresolver import sparse
+        sparse._MATRIX_CACHE.clear()
+        fluid = Fluid(Domain([16, 16], boundaries=CLOSED), velocity=numpy.random.rand(1, 17, 17, 2))
+        fluid1 = INCOMPRESSIBLE_FLOW.step(fluid)
+        self.assertEqual(len(sparse._MATRIX_CACHE), 1)
+        matrix = next(iter(sparse._MATRIX_CACHE.values()))
+        INCOMPRESSIBLE_FLOW.step(fluid1)
+        self.assertEqual(len(sparse._MATRIX_CACHE), 1)
+        self.assertIs(next(iter(sparse._MATRIX_CACHE.values())), matrix)
+        INCOMPRESSIBLE_FLOW.step(fluid1, obstacles=[Obstacle(Sphere((8, 8), radius=3))])
+        self.assertEqual(len(sparse._MATRIX_CACHE), 2)
+
+    def test_continuous_masks(self):
+        from phi.geom.sdf import signed_distance_lattice
+        domain = Domain([16, 16], boundaries=CLOSED)
+        velocity = StaggeredGrid(numpy.random.rand(1, 17, 17, 2))
+        sphere = Sphere((8, 8), radius=3.3)
+        solver = SparseCG(accuracy=1e-8)
+        continuous = divergence_free(velocity, domain, [Obstacle(sphere)], pressure_solver=solver, continuous_masks=True)
+        binary = divergence_free(velocity, domain, [Obstacle(sphere)], pressure_solver=solver)
+        coverage = signed_distance_lattice(sphere, velocity.box, velocity.resolution).coverage()
+        self.assertTrue(numpy.any((coverage > 0) & (coverage < 1)))
+        numpy.testing.assert_allclose(continuous.divergence().data[coverage == 0], 0, atol=1e-5)  # fully fluid cells
+        self.assertGreater(numpy.max(numpy.abs(continuous.staggered_tensor() - binary.staggered_tensor())), 1e-3)
+        # geometries without signed distance fall back to binary masks
+        fallback = divergence_free(velocity, domain, [Obstacle(_MaskOnlySphere(sphere))], pressure_solver=solver, continuous_masks=True)
+        numpy.testing.assert_allclose(fallback.staggered_tensor(), binary.staggered_tensor(), atol=1e-5)
+        self.assertRaises(AssertionError, lambda: divergence_free(velocity, domain, [Obstacle(sphere)], pressure_solver=_BinaryMaskCG(), continuous_masks=True))
+
+    def test_rasterized_union(self):
+        from phi.physics.field import rasterized_union, union_mask
+        grid = CenteredGrid.getpoints(AABox(0, [32, 24]), [32, 24])
+        static = [AABox([4, 4], [10, 20]), Sphere((20, 12), radius=3)]
+        previous = None
+        for step in range(4):
+            geometries = static + [Sphere((6 + 4 * step, 18), radius=2.5)]
+            result = rasterized_union(geometries, grid)
+            numpy.testing.assert_equal(result.data, union_mask(geometries).at(grid, collapse_dimensions=False).data)
+            self.assertIsNot(result, previous)
+            self.assertIs(rasterized_union(geometries, grid), result)
+            previous = result
+        numpy.testing.assert_equal(Sphere((6, 18), radius=2.5).bounding_box().lower, [3.5, 15.5])
+
     def test_fluid_initializers(self):
         def typetest(fluid):
             self.assertIsInstance(fluid, Fluid)
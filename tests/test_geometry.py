@@ -2,7 +2,7 @@ from unittest import TestCase
 
 import numpy as np
 
-from phi.geom import AABox, Sphere, box
+from phi.geom import AABox, Sphere, box, union, SphereBatch, BoxBatch, batch_geometries, signed_distance_lattice
 from phi.physics.field import CenteredGrid
 
 
@@ -38,3 +38,49 @@ class TestGeometry(TestCase):
         values = growing_sphere.value_at(np.zeros([10, 3, 2]) + [0, 4])
         np.testing.assert_equal(values.shape, [10, 3, 1])
         np.testing.assert_equal(values[:, 0, 0], [0, 0, 0, 0, 1, 1, 1, 1, 1, 1])
+
+    def test_rasterize(self):
+        grid_box = box[0:10, 0:8]
+        sample_points = CenteredGrid.getpoints(grid_box, [10, 8]).data
+        geometries = [AABox([2, 1], [6.5, 4]), box[3:, :2], Sphere([4, 5], 2.5), Sphere([-1, 0], 1), union([AABox([7, 1], [9, 2]), Sphere([2, 2], 1.5)])]
+        for geometry in geometries:
+            mask = geometry.rasterize(grid_box, [10, 8])
+            np.testing.assert_equal(mask, geometry.value_at(sample_points))
+            self.assertEqual(mask.dtype, geometry.value_at(sample_points).dtype)
+        moving_sphere = Sphere(center=np.stack([np.ones(4), np.linspace(0, 10, 4)], axis=-1), radius=2)
+        np.testing.assert_equal(moving_sphere.rasterize(grid_box, [10, 8]), moving_sphere.value_at(sample_points))
+        out = np.zeros([1, 10, 8, 1], np.float32)
+        geometries[0].rasterize(grid_box, [10, 8], out=out)
+        geometries[2].rasterize(grid_box, [10, 8], out=out)
+        np.testing.assert_equal(out, np.maximum(geometries[0].value_at(sample_points), geometries[2].value_at(sample_points)))
+
+    def test_geometry_batches(self):
+        rng = np.random.RandomState(0)
+        spheres = [Sphere(rng.rand(2) * 10, rng.rand() + 0.2) for _ in range(20)]
+        boxes = [AABox(lower, lower + rng.rand(2)) for lower in rng.rand(20, 2) * 10]
+        locations = rng.rand(2, 50, 2) * 12 - 1
+        for geometries, batch_type in ((spheres, SphereBatch), (boxes, BoxBatch)):
+            expected = np.max([geometry.value_at(locations) for geometry in geometries], axis=0)
+            batch, = batch_geometries(geometries)
+            self.assertIsInstance(batch, batch_type)
+            np.testing.assert_equal(batch.value_at(locations), expected)  # uses acceleration structure
+            small_batch, = batch_geometries(geometries[:5])
+            np.testing.assert_equal(small_batch.value_at(locations), np.max([geometry.value_at(locations) for geometry in geometries[:5]], axis=0))
+        self.assertEqual(len(batch_geometries(spheres + boxes + [Sphere(center=np.ones([3, 2]), radius=1)])), 3)
+        mixed = spheres + boxes + [Sphere([2, 2], radius=1.5)]
+        np.testing.assert_equal(union(mixed).value_at(points().data), np.max([g.value_at(points().data) for g in mixed], axis=0))
+
+    def test_signed_distance_lattice(self):
+        grid_box = box[0:8, 0:6]
+        geometry = union([Sphere([3.2, 2.9], 1.7), AABox([5, 1], [7, 2.5])])
+        np.testing.assert_allclose(Sphere([0, 0], 1).signed_distance(np.array([[3., 4.], [0., 0.5]])), [[4], [-0.5]])
+        np.testing.assert_allclose(AABox([0, 0], [2, 1]).signed_distance(np.array([[5., 5.], [1., 0.75]])), [[5], [-0.25]])
+        lattice = signed_distance_lattice(geometry, grid_box, [8, 6])
+        self.assertIs(signed_distance_lattice(geometry, grid_box, [8, 6]), lattice)
+        np.testing.assert_equal(lattice.mask(), geometry.value_at(CenteredGrid.getpoints(grid_box, [8, 6]).data))
+        np.testing.assert_equal(lattice.mask(level=1), geometry.value_at(CenteredGrid.getpoints(grid_box, [4, 3]).data))
+        faces = CenteredGrid.getpoints(AABox([-0.5, 0], [8.5, 6]), [9, 6]).data
+        np.testing.assert_equal(lattice.staggered_mask(0), geometry.value_at(faces))
+        coverage = lattice.coverage()
+        self.assertTrue(np.all((coverage >= 0) & (coverage <= 1)))
+        self.assertAlmostEqual(float(coverage.sum()), np.pi * 1.7 ** 2 + 3, delta=1)
@@ -93,3 +93,56 @@ class TestMath(TestCase):
         a_tf = tf.constant(a, tf.float32, shape=(2,2))
         p_tf = pad(a_tf, [[1,1], [1,1]], mode=['symmetric', ['wrap', 'constant']], constant_values=[0, [0, 10]])
         np.testing.assert_equal(p, p_tf.eval())
+
+    def test_precision(self):
+        points = np.zeros([1, 4, 2])
+        indices = np.array([[[0, 0, 1], [0, 2, 3], [0, 0, 1], [0, 3, 3]]])
+        self.assertEqual(to_float(1).dtype, np.float32)
+        with precision(64):
+            self.assertEqual(to_float(1).dtype, np.float64)
+            self.assertEqual(indices_tensor(np.zeros([1, 3, 3, 1])).dtype, np.float64)
+            self.assertEqual(scatter(points, indices, np.ones([1, 4, 1]), [1, 4, 4, 1], duplicates_handling='add').dtype, np.float64)
+        with precision(16, 32):
+            self.assertEqual(storage_dtype(), np.float16)
+            self.assertEqual(accumulation_dtype(), np.float32)
+            scattered = scatter(points, indices, np.ones([1, 4, 1]), [1, 4, 4, 1], duplicates_handling='add')
+            self.assertEqual(scattered.dtype, np.float16)
+            self.assertEqual(scattered[0, 0, 1, 0], 2)
+            self.assertEqual(laplace(np.ones([1, 4, 4, 1], np.float16)).dtype, np.float16)
+        self.assertEqual(to_float(1).dtype, np.float32)
+
+    def test_threads(self):
+        data = np.random.rand(3, 10, 8, 2)
+        points = np.random.rand(3, 12, 2) * 10
+        indices = np.concatenate([np.random.randint(0, 3, [3, 20, 1]), np.random.randint(0, 8, [3, 20, 2])], -1)
+        values = np.random.rand(3, 20, 2)
+
+        def compute():
+            return [resample(data, points), conv(data, np.random.RandomState(0).rand(3, 3, 2, 2)),
+                    scatter(None, indices, values, [3, 10, 8, 2], duplicates_handling='add'),
+                    pad(data, [[0, 0], [1, 2], [2, 1], [0, 0]], mode=['constant', 'symmetric', ['wrap', 'reflect'], 'constant'])]
+        expected = compute()
+        with threads(3):
+            self.assertEqual(get_num_threads(), 3)
+            for result, reference in zip(compute(), expected):
+                np.testing.assert_equal(result, reference)
+        self.assertEqual(get_num_threads(), 1)
+        self.assertGreaterEqual(available_cpus(), 1)
+
+    def test_threads_single_batch(self):
+        import scipy.sparse
+        data = np.random.rand(1, 40, 30, 1)
+        points = np.random.rand(1, 50, 2) * 40
+        indices = np.concatenate([np.zeros([1, 200, 1], np.int64), np.random.randint(0, 30, [1, 200, 2])], -1)
+        values = np.random.rand(1, 200, 1)
+        matrix = scipy.sparse.random(4096, 4096, density=0.002, format='csr', random_state=0) + scipy.sparse.eye(4096, format='csr')
+        vector = np.random.rand(1, 4096)
+
+        def compute():
+            return [resample(data, points), scatter(None, indices, values, [1, 40, 30, 1], duplicates_handling='add'),
+                    pad(data, [[0, 0], [1, 2], [2, 1], [0, 0]], mode=['constant', 'symmetric', ['wrap', 'reflect'], 'constant']),
+                    matmul(matrix, vector)]
+        expected = compute()
+        with threads(3):  # batch size 1 is split along spatial axes, sample points or matrix rows
+            for result, reference in zip(compute(), expected):
+                np.testing.assert_equal(result, reference)
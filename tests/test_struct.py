@@ -2,7 +2,7 @@ from unittest import TestCase
 
 import numpy
 
-from phi.geom import box
+from phi.geom import box, AABox
 from phi.physics.collective import CollectiveState
 from phi.physics.domain import Domain
 from phi.physics.field import CenteredGrid, manta
@@ -95,4 +95,70 @@ class TestStruct(TestCase):
         @mappable(item_condition=CONSTANTS)
         def act_on_constants(x): return x + 1
         self.assertEqual([1], act_on_variables(x))
-        self.assertEqual([0], act_on_constants(x))
\ No newline at end of file
+        self.assertEqual([0], act_on_constants(x))
+
+    def test_map_flatten(self):
+        state = CollectiveState(tuple(Fluid(Domain([16, 16]), name='fluid%d' % i) for i in range(16)))
+        with struct.unsafe():
+            mapped = struct.map(lambda x: x, state)
+        self.assertEqual(state, mapped)
+        self.assertEqual(len(struct.flatten(state)), 16 * 3)  # density, velocity.x, velocity.y
+        # matching items are cached per condition
+        fluid_type = Fluid.__struct__
+        self.assertIs(fluid_type.items_where(VARIABLES), fluid_type.items_where(VARIABLES))
+        self.assertEqual(fluid_type.items_where(VARIABLES), tuple(item for item in fluid_type.items if VARIABLES(item)))
+
+    def test_fingerprint(self):
+        box1 = box[0:1, 0:2]
+        box2 = box[0:1, 0:2]
+        self.assertEqual(struct.fingerprint(box1), struct.fingerprint(box2))
+        self.assertNotEqual(struct.fingerprint(box1), struct.fingerprint(box[0:1, 0:3]))
+        self.assertEqual(box1, box2)
+        self.assertEqual(hash(box1), hash(box2))
+        with struct.unsafe():
+            close = AABox(numpy.float64([0, 0]), numpy.float64([1, 2])), AABox(numpy.float64([0, 0]), numpy.float64([1, 2.0000001]))
+        for other in close:
+            self.assertNotEqual(struct.fingerprint(box1), struct.fingerprint(other))
+            self.assertEqual(box1, other)  # approximately equal
+            self.assertEqual(hash(box1), hash(other))
+        self.assertEqual(len({box1, box2} | set(close)), 1)
+        cache = {box1: 'cached'}
+        self.assertEqual(cache[box2], 'cached')
+        self.assertEqual(hash(Domain([16, 16])), hash(Domain([16, 16])))
+        self.assertNotEqual(struct.fingerprint(Domain([16, 16])), struct.fingerprint(Domain([16, 17])))
+        # arrays
+        a = numpy.zeros([2, 3])
+        self.assertNotEqual(struct.fingerprint(a), struct.fingerprint(a.astype(numpy.float32)))
+        self.assertNotEqual(struct.fingerprint(a), struct.fingerprint(a.reshape([3, 2])))
+        self.assertEqual(struct.fingerprint([a, 'x', None]), struct.fingerprint([numpy.zeros([2, 3]), 'x', None]))
+
+    def test_lru_cache(self):
+        cache = struct.LRUCache(2)
+        self.assertEqual(cache.lookup('a', lambda: 1), 1)
+        self.assertEqual(cache.lookup('a', lambda: 2), 1)
+        cache['b'] = 2
+        self.assertEqual(cache.get('a'), 1)  # 'a' is now the most recently used entry
+        cache['c'] = 3
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(list(cache.values()), [1, 3])
+
+    def test_pack_unpack(self):
+        fluid = Fluid(Domain([16, 16]), density=numpy.random.rand(1, 16, 16, 1), velocity=numpy.random.rand(1, 17, 17, 2).astype(numpy.float32))
+        state = CollectiveState((fluid, fluid.copied_with(name='other', age=1.5)))
+        buffer = struct.pack(state)
+        self.assertEqual(len(buffer), struct.packed_size(state))
+        unpacked = struct.unpack(buffer, template=state)
+        self.assertEqual(state, unpacked)
+        self.assertEqual(unpacked.states['fluid'].velocity.data[0].data.dtype, numpy.float32)
+        buffer_array = numpy.frombuffer(buffer, numpy.uint8)
+        for leaf in struct.flatten(unpacked):  # unpacked leaves are aligned views into the buffer
+            self.assertTrue(numpy.shares_memory(leaf, buffer_array))
+            self.assertEqual((leaf.ctypes.data - buffer_array.ctypes.data) % struct.packing.ALIGNMENT, 0)
+        # read-only buffer, template with different data
+        template = CollectiveState((Fluid(Domain([16, 16])), Fluid(Domain([16, 16]), name='other')))
+        unpacked = struct.unpack(bytes(struct.pack(state)), template=template)
+        for original, leaf in zip(struct.flatten(state), struct.flatten(unpacked)):
+            numpy.testing.assert_equal(original, leaf)
+        self.assertRaises(ValueError, lambda: struct.unpack(bytearray(64), template=state))
+        self.assertRaises(ValueError, lambda: struct.pack(state, bytearray(64)))